@@ -0,0 +1,96 @@
+"""
+Benchmark geocricket.read_gdf / write_gdf against plain geopandas
+read_file / to_file.
+
+Writes and reads a synthetic polygon layer of n_features features to
+shp, gpkg and fgb, then reads a subset with column and bbox pushdown.
+
+usage: python benchmarks/bench_gis_io.py [--n-features N] [--repeat R]
+"""
+import argparse
+import pathlib
+import tempfile
+import time
+import warnings
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+import geocricket as gc
+
+
+def make_layer(n_features, seed=0):
+    """
+    Return geodataframe of n_features small squares with attributes
+    """
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(-107, -106, n_features)
+    y = rng.uniform(35, 36, n_features)
+    return gpd.GeoDataFrame(
+        {
+            'rencat_id': [f'facility_{ndx}' for ndx in range(n_features)],
+            'Sector': rng.choice(['Hospitals', 'Schools', 'Fire'], n_features),
+            'capacity': rng.integers(0, 1000, n_features),
+            'NAME': [f'Facility number {ndx}' for ndx in range(n_features)],
+        },
+        geometry=shapely.box(x, y, x + 0.001, y + 0.001),
+        crs=4326)
+
+
+def best_time(func, repeat):
+    """
+    Return fastest of repeat timings of func
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(n_features, repeat):
+    gdf = make_layer(n_features)
+    bbox = (-106.6, 35.4, -106.4, 35.6)
+    columns = ['rencat_id']
+
+    print(f'{n_features} features, engine: {gc.gis_io.get_engine()}, '
+          f'arrow: {gc.gis_io.HAS_PYARROW}\n')
+    print(f'{"case":<28}{"geopandas":>12}{"gis_io":>12}{"speedup":>10}')
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for suffix in ['.shp', '.gpkg', '.fgb']:
+            fp = pathlib.Path(temp_dir) / f'layer{suffix}'
+            driver = gc.gis_io.get_driver(fp)
+
+            cases = {
+                f'write {suffix}': (
+                    lambda: gdf.to_file(fp, driver=driver),
+                    lambda: gc.write_gdf(gdf, fp)),
+                f'read {suffix}': (
+                    lambda: gpd.read_file(fp),
+                    lambda: gc.read_gdf(fp)),
+                f'read {suffix} columns+bbox': (
+                    lambda: gpd.read_file(fp, bbox=bbox)[
+                        columns + ['geometry']],
+                    lambda: gc.read_gdf(fp, columns=columns, bbox=bbox)),
+                }
+
+            for name, (baseline, candidate) in cases.items():
+                baseline_time = best_time(baseline, repeat)
+                candidate_time = best_time(candidate, repeat)
+                print(f'{name:<28}{baseline_time:>11.3f}s'
+                      f'{candidate_time:>11.3f}s'
+                      f'{baseline_time / candidate_time:>9.1f}x')
+
+
+if __name__ == '__main__':
+    warnings.filterwarnings('ignore')
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--n-features', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    run(args.n_features, args.repeat)
@@ -9,28 +9,61 @@ from .geocricket import export_server_URL_data
 from .geocricket import add_field_to_file
 from .geocricket import add_rencat_id
 from .geocricket import ensure_crs
+from .geocricket import export_census_blocks
+from .geocricket import stream_layer
 
 from .kml import make_kml_pts
 from .kml import make_kml_lines
 from .kml import make_kml_polygons
 from .kml import convert_to_kml
+from .kml_stream import stream_kml
+from .kml_stream import make_descriptions
+from .kml_overlay import write_kml_super_overlay
+from .kml_export import export_layers_to_kml
+from .kml_export import export_merged_kmz
 
 from .transit_land import transit_land_radius_query
+from .transit_land import iter_transit_land_radius_pages
 from .transit_land import get_routes_from_transit_land_res
 from .transit_land import get_stops_from_transit_land_res
+from .transit_land import normalize_transit_tables
 from .transit_land import export_transit_land_point_radius_query
 from .transit_land import export_transit_land_geometry_bound_query
+from .transit_land import export_transit_land_sites_query
+from .transit_land import generate_search_covering
 
 from .rest_info import hifld_dict
 from .rest_info import non_hifld_dict
 from .rest_info import usgs_dict
+from .rest_info import dedupe_dict
 
 from .census_stats import get_census_stats
+from .census_stats import join_decennial_block_stats
 
 from .csv_out import export_census_geography_to_csv
 from .csv_out import export_facilities_to_csv
+from .csv_out import assign_census_geography
+
+from .geoparquet import write_geoparquet
+from .geoparquet import write_geoparquet_dataset
+
+from .flatgeobuf import write_flatgeobuf
+from .flatgeobuf import shp_to_fgb
+from .flatgeobuf import read_flatgeobuf_bbox
+
+from .gpkg import write_gpkg_layer
+
+from .gis_io import read_gdf
+from .gis_io import write_gdf
 
 from .combined import collect
 from .combined import query_census
 from .combined import query_hifld
 from .combined import query_non_hifld
+
+from .interpolation import interpolate_census_stats
+
+from .dedupe import find_duplicate_facilities
+
+from .rate_limit import TokenBucket
+from .response_cache import ResponseCache
@@ -2,10 +2,18 @@
 Functions to handle census data query
 """
 
+import functools
+import operator
+
 import geopandas as gpd
 import pandas as pd
 import requests
 
+from .gis_io import read_gdf
+
+
+CENSUS_API_URL = 'https://api.census.gov/data/'
+
 
 def json_to_dataframe(response):
     """
@@ -17,43 +25,25 @@ def json_to_dataframe(response):
 def generate_geoid(res_df):
     """
     create geoid based on census response.
-    return no change dataframe if geometry not a county, tract, or block group
+    return no change dataframe if geometry not a county, tract, block group,
+    or block
     """
-    if 'block group' in res_df.columns:
-        res_df['GEOID'] = ''
-        cols_to_keep = res_df.columns.to_list()
-        cols_to_keep.remove('state')
-        cols_to_keep.remove('county')
-        cols_to_keep.remove('tract')
-        cols_to_keep.remove('block group')
-
-        for index, row in res_df.iterrows():
-            res_df.at[index, 'GEOID'] = row['state'] + row['county'] + row['tract'] + row['block group']
-        return res_df[cols_to_keep]
-
-    if 'tract' in res_df.columns:
-        res_df['GEOID'] = ''
-        cols_to_keep = res_df.columns.to_list()
-        cols_to_keep.remove('state')
-        cols_to_keep.remove('county')
-        cols_to_keep.remove('tract')
-
-        for index, row in res_df.iterrows():
-            res_df.at[index, 'GEOID'] = row['state'] + row['county'] + row['tract']
-        return res_df[cols_to_keep]
-
-    if 'county' in res_df.columns:
-        res_df['GEOID'] = ''
-        cols_to_keep = res_df.columns.to_list()
-        cols_to_keep.remove('state')
-        cols_to_keep.remove('county')
-
-        for index, row in res_df.iterrows():
-            res_df.at[index, 'GEOID'] = row['state'] + row['county']
-        return res_df[cols_to_keep]
-    else:
+    # census geography hierarchy, most detailed last
+    geo_levels = ['state', 'county', 'tract', 'block group', 'block']
+
+    if 'county' not in res_df.columns:
         return res_df
 
+    found_levels = [x for x in geo_levels if x in res_df.columns]
+
+    # concatenated column wise, a header only (empty) response gives an
+    # empty GEOID column
+    res_df['GEOID'] = functools.reduce(
+        operator.add, (res_df[x].astype(str) for x in found_levels))
+    cols_to_keep = [x for x in res_df.columns if x not in found_levels]
+
+    return res_df[cols_to_keep]
+
 
 def get_census_stats(
         census_geo,
@@ -81,7 +71,7 @@ def get_census_stats(
     if isinstance(census_geo, gpd.GeoDataFrame):
         gdf = census_geo.copy()
     else:
-        gdf = gpd.read_file(census_geo)
+        gdf = read_gdf(census_geo)
 
     # collect states and counties to query
     if 'STATE' in gdf.columns:
@@ -183,3 +173,86 @@ def get_census_stats(
         rename_dict[code] = name + '_' + code
 
     return merged_results.rename(columns=rename_dict)
+
+
+@functools.lru_cache(maxsize=16)
+def get_decennial_block_stats(
+        state,
+        county,
+        api_key,
+        census_year='2020',
+        census_vars=('P1_001N',),
+        ):
+    """
+    Query decennial census redistricting (P1) statistics for every block
+    in a single county.
+
+    Blocks are only reported by the decennial census. The block table of
+    a county is requested in one call and the most recent counties are
+    cached so that a streamed block collection, which visits counties in
+    spatial order, only requests each county once.
+
+    Returns dataframe of GEOID and numeric census_vars.
+    Do not modify the returned (cached) dataframe.
+    Raises requests.RequestException on an invalid response, which is
+    not cached.
+    """
+    var_str = ','.join(census_vars)
+
+    query = (
+        fr"{CENSUS_API_URL}{census_year}/dec/pl?get={var_str}"
+        fr"&for=block:*&in=state:{state}&in=county:{county}&in=tract:*"
+        fr"&key={api_key}")
+
+    response = requests.request('GET', query, timeout=60)
+
+    # invalid response, raised so it is not cached
+    if (response.status_code != 200) or (len(response.content) == 0):
+        raise requests.RequestException(
+            f'No valid response for state {state} county {county}')
+
+    res_df = generate_geoid(json_to_dataframe(response))
+
+    for var in census_vars:
+        res_df[var] = pd.to_numeric(res_df[var])
+        res_df[var] = res_df[var].mask(res_df[var] < 0)
+
+    return res_df
+
+
+def join_decennial_block_stats(
+        block_df,
+        api_key,
+        census_year='2020',
+        census_vars=('P1_001N',),
+        ):
+    """
+    Merge decennial block statistics onto a geodataframe of census blocks
+    with a 15 character GEOID.
+
+    Statistics are requested per county found in block_df, counties
+    without a valid response are left without statistics.
+    """
+    geoid = block_df['GEOID'].astype(str)
+    state_county = (geoid.str[:2] + geoid.str[2:5]).unique()
+
+    stats = []
+    for x in state_county:
+        try:
+            stats.append(get_decennial_block_stats(
+                x[:2], x[2:], api_key,
+                census_year=census_year,
+                census_vars=tuple(census_vars)))
+        except requests.RequestException as err:
+            print(err)
+
+    if not stats:
+        stats = [pd.DataFrame(columns=['GEOID', *census_vars])]
+
+    stats_df = pd.concat(stats, ignore_index=True)
+
+    return block_df.merge(
+        stats_df,
+        on='GEOID',
+        how='left',
+        suffixes=('_OG', '_QUERY'))
@@ -7,7 +7,6 @@ Functions have nice docstrings...
 import pathlib
 from pathlib import Path
 import time
-import geopandas as gpd
 import pandas as pd
 import geocricket as gc
 
@@ -58,7 +57,7 @@ def query_census(
     ci_result_count['census_geometry']['query_time'] = query_end - query_start
 
     # read collected census data
-    census_df = gpd.read_file(temp_out_path)
+    census_df = gc.read_gdf(temp_out_path)
 
     if census_api_key is not None:
         # get census statistics
@@ -70,26 +69,27 @@ def query_census(
     census_df = gc.add_rencat_id(census_df, sector='census_geometry')
 
     # export shp
-    census_df.to_file(temp_out_path)
+    gc.write_gdf(census_df, temp_out_path)
     ci_result_count['census_geometry']['shp'] = temp_out_path
 
     # export gpkg
-    if 'gpkg' in output_paths:
+    if 'single_gpkg' in output_paths:
+        ci_result_count['census_geometry']['gpkg'] = gc.write_gpkg_layer(
+            census_df,
+            output_paths['single_gpkg'],
+            layer='census_geometry')
+        ci_result_count['census_geometry']['gpkg_layer'] = 'census_geometry'
+    elif 'gpkg' in output_paths:
         temp_out_path = Path(temp_out_path)
         single_gpkg_path = output_paths['gpkg'] / (str(temp_out_path.stem)+'.gpkg')
-        census_df.to_file(single_gpkg_path, driver='GPKG')
+        gc.write_gdf(census_df, single_gpkg_path, driver='GPKG')
         ci_result_count['census_geometry']['gpkg'] = single_gpkg_path
 
-    # export kml
-    if 'kml' in output_paths:
-        try:
-            kml = gc.convert_to_kml(
-                temp_out_path,
-                output_path=output_paths['kml'],
-                id_field='GEOID')
-            ci_result_count['census_geometry']['kml'] = kml
-        except:
-            print("KML export failed (multi-part?)")
+    # export FlatGeobuf
+    if 'fgb' in output_paths:
+        ci_result_count['census_geometry']['fgb'] = gc.write_flatgeobuf(
+            census_df,
+            output_paths['fgb'] / f'{Path(temp_out_path).stem}.fgb')
 
     return ci_result_count
 
@@ -163,31 +163,31 @@ def query_hifld(
 
         # add rencat id
         temp_out_path = gc.add_rencat_id(temp_out_path[0], sector=sector_name)
+        ci_result_count[key]['sector'] = sector_name
 
         ci_result_count[key]['shp'] = temp_out_path
 
         # export gpkg
-        if 'gpkg' in output_paths:
+        if 'single_gpkg' in output_paths:
+            ci_result_count[key]['gpkg'] = gc.write_gpkg_layer(
+                gc.read_gdf(temp_out_path),
+                output_paths['single_gpkg'],
+                layer=key)
+            ci_result_count[key]['gpkg_layer'] = key
+        elif 'gpkg' in output_paths:
             gpkg = gc.shp_to_gpkg(
                 temp_out_path,
                 out_path=output_paths['gpkg'],
                 remove_old=False)
             ci_result_count[key]['gpkg'] = Path(gpkg)
 
-        # export kml
-        if 'kml' in output_paths:
-            # export kml
-            try:
-                kml = gc.convert_to_kml(
-                    gpkg,
-                    output_path=output_paths['kml'],
-                    id_field=hifld_dict[key]['idField'],
-                    element_color=hifld_dict[key]['color'],
-                    )
-                ci_result_count[key]['kml'] = Path(kml)
-            except:
-                print("* KML export failed (multi-part?)")
-            print(f'Collected {key} resources...\n')
+        # export FlatGeobuf
+        if 'fgb' in output_paths:
+            ci_result_count[key]['fgb'] = gc.shp_to_fgb(
+                temp_out_path,
+                out_path=output_paths['fgb'])
+
+        print(f'Collected {key} resources...\n')
 
     return ci_result_count
 
@@ -257,34 +257,171 @@ def query_non_hifld(
             overwrite_old=True)
 
         temp_out_path = gc.add_rencat_id(temp_out_path[0], sector=sector_name)
+        ci_result_count[key]['sector'] = sector_name
         ci_result_count[key]['shp'] = temp_out_path
 
         # export gpkg
-        if 'gpkg' in output_paths:
+        if 'single_gpkg' in output_paths:
+            ci_result_count[key]['gpkg'] = gc.write_gpkg_layer(
+                gc.read_gdf(temp_out_path),
+                output_paths['single_gpkg'],
+                layer=key)
+            ci_result_count[key]['gpkg_layer'] = key
+        elif 'gpkg' in output_paths:
             gpkg = gc.shp_to_gpkg(
                 temp_out_path,
                 out_path=output_paths['gpkg'],
                 remove_old=False)
             ci_result_count[key]['gpkg'] = Path(gpkg)
 
-        # export kml
-        if 'kml' in output_paths:
-            # export kml
-            try:
-                kml = gc.convert_to_kml(
-                    gpkg,
-                    output_path=output_paths['kml'],
-                    id_field=non_hifld_dict[key]['idField'],
-                    element_color=non_hifld_dict[key]['color'],
-                    )
-                ci_result_count[key]['kml'] = Path(kml)
-            except:
-                print("* KML export failed (multi-part?)")
-            print(f'Collected {key} resources...\n')
+        # export FlatGeobuf
+        if 'fgb' in output_paths:
+            ci_result_count[key]['fgb'] = gc.shp_to_fgb(
+                temp_out_path,
+                out_path=output_paths['fgb'])
+
+        print(f'Collected {key} resources...\n')
 
     return ci_result_count
 
 
+def get_layer_source(result):
+    """
+    Return location of a collected layer file to read: the layer's own
+    gpkg if written, else its shp.
+    """
+    if 'gpkg_layer' in result:
+        # layer of a single collect gpkg
+        return result.get('shp')
+    return result.get('gpkg', result.get('shp'))
+
+
+def export_kml(
+        ci_results,
+        output_paths,
+        merge_kml=False,
+        max_workers=None,
+    ):
+    """
+    Export every collected layer to kml in parallel, and optionally to a
+    single merged kmz with one folder per sector.
+    Adds kml output locations to ci_results.
+
+    Parameters
+    ----------
+    ci_results : dict
+        combined collection results of query_census, query_hifld and
+        query_non_hifld.
+    output_paths : dict
+        dictionary of output locations for file types to export.
+    merge_kml : bool
+        If true, also write all layers to collect.kmz. Defaults to False
+    max_workers : int, optional
+        Number of processes used, defaults to number of cores.
+
+    Returns
+    -------
+    dict
+        ci_results with kml output locations.
+    """
+    layer_info = {**gc.hifld_dict(), **gc.usgs_dict(), **gc.non_hifld_dict()}
+
+    kml_layers = {}
+    for key, result in ci_results.items():
+        layer_fp = get_layer_source(result)
+        if layer_fp is None:
+            continue
+
+        if key == 'census_geometry':
+            id_field = 'GEOID'
+            element_color = None
+        else:
+            id_field = layer_info[key]['idField']
+            element_color = layer_info[key]['color']
+
+        kml_layers[key] = {
+            'input_file': layer_fp,
+            'sector': result.get('sector', key),
+            'id_field': id_field,
+            'element_color': element_color,
+            }
+
+    kml_paths = gc.export_layers_to_kml(
+        kml_layers,
+        output_paths['kml'],
+        max_workers=max_workers)
+
+    for key, kml in kml_paths.items():
+        if kml is not None:
+            ci_results[key]['kml'] = Path(kml)
+
+    if merge_kml:
+        merged_kmz = gc.export_merged_kmz(
+            kml_layers,
+            output_paths['kml'] / 'collect.kmz',
+            max_workers=max_workers)
+        print(f'Merged kmz: {merged_kmz}')
+
+    return ci_results
+
+
+def export_geoparquet(
+        ci_results,
+        output_paths,
+        partition_cols=None,
+    ):
+    """
+    Export every collected layer to GeoParquet.
+    Census geometry is written to census_geometry.parquet.  Facility
+    layers are written to one {layer}.parquet each, or, if partition_cols
+    are given, to a single facilities dataset partitioned by those
+    columns (e.g. ['Sector']).
+    Adds geoparquet output locations to ci_results.
+
+    Parameters
+    ----------
+    ci_results : dict
+        combined collection results of query_census, query_hifld and
+        query_non_hifld.
+    output_paths : dict
+        dictionary of output locations for file types to export.
+    partition_cols : list of str, optional
+        facility columns to partition by. Defaults to None
+
+    Returns
+    -------
+    dict
+        ci_results with geoparquet output locations.
+    """
+    facility_gdfs = []
+    for key, result in ci_results.items():
+        layer_fp = get_layer_source(result)
+        if layer_fp is None:
+            continue
+
+        layer_gdf = gc.read_gdf(layer_fp)
+
+        if partition_cols and key != 'census_geometry':
+            facility_gdfs.append(layer_gdf.to_crs(4326))
+            continue
+
+        ci_results[key]['geoparquet'] = gc.write_geoparquet(
+            layer_gdf,
+            output_paths['geoparquet'] / f'{key}.parquet')
+
+    if facility_gdfs:
+        facilities_path = output_paths['geoparquet'] / 'facilities'
+        gc.write_geoparquet_dataset(
+            pd.concat(facility_gdfs, ignore_index=True),
+            facilities_path,
+            partition_cols)
+        for key, result in ci_results.items():
+            if key != 'census_geometry' and 'geoparquet' not in result:
+                ci_results[key]['geoparquet'] = facilities_path
+
+    return ci_results
+
+
 def collect(
         query_geometry,
         output_dir,
@@ -293,7 +430,15 @@ def collect(
         update_census_geo=True,
         output_kml=True,
         output_gpkg=True,
-        output_csv=True
+        single_gpkg=False,
+        output_fgb=False,
+        output_csv=True,
+        output_sector_counts=False,
+        dedupe_facilities=False,
+        merge_kml=False,
+        kml_workers=None,
+        output_geoparquet=False,
+        geoparquet_partition_cols=None,
         ):
     """
     Perform full gis collect of given query_geometry. This includes:
@@ -323,9 +468,37 @@ def collect(
     output_gpkg : bool
         If true, gpkg files are created from initial shp files.
         Defaults to True
+    single_gpkg : bool
+        If true, and output_gpkg is true, all layers are written to a
+        single collect.gpkg with one layer per query, instead of a gpkg
+        per layer. Defaults to False
+    output_fgb : bool
+        If true, FlatGeobuf files with a spatial index are created from
+        initial shp files. Defaults to False
     output_csv : bool
         If true, output ReNCAT compatible csv files for geometry and
-        infrastructure.
+        infrastructure. Each facility is tagged with the GEOID of the
+        census geometry it is located in.
+    output_sector_counts : bool
+        If true, and output_csv is true, also output counts of facilities
+        per census geometry and sector. Defaults to False.
+    dedupe_facilities : bool
+        If true, and output_csv is true, facilities reported by more than
+        one overlapping source (see gc.dedupe_dict) are only included
+        once in facility csv. Defaults to False.
+    merge_kml : bool
+        If true, and output_kml is true, also output all layers in a
+        single collect.kmz with one folder per sector. Defaults to False.
+    kml_workers : int, optional
+        Number of processes used to create kml, defaults to number of
+        cores.
+    output_geoparquet : bool
+        If true, output GeoParquet files of all layers (requires pyarrow).
+        Defaults to False.
+    geoparquet_partition_cols : list of str, optional
+        If given, facilities are output as a single GeoParquet dataset
+        partitioned by these columns (e.g. ['Sector']) instead of one
+        file per layer. Defaults to None.
 
     Returns
     -------
@@ -345,14 +518,23 @@ def collect(
 
     if output_gpkg:
         output_paths['gpkg'] = output_dir / 'gpkg'
+    if output_fgb:
+        output_paths['fgb'] = output_dir / 'fgb'
     if output_kml:
         output_paths['kml'] = output_dir / 'kml'
     if output_csv:
         output_paths['csv'] = output_dir / 'csv'
+    if output_geoparquet:
+        output_paths['geoparquet'] = output_dir / 'geoparquet'
 
     for folder in output_paths.values():
         folder.mkdir(parents=True, exist_ok=True)
 
+    if output_gpkg and single_gpkg:
+        # start a new collect gpkg, so no layers of old collects remain
+        output_paths['single_gpkg'] = output_paths['gpkg'] / 'collect.gpkg'
+        output_paths['single_gpkg'].unlink(missing_ok=True)
+
     # convert original input geometry to valid search geometry
     b_geo_3857 = gc.convert_geometry_bound(query_geometry, epsg=3857)
     b_geo_4326 = gc.convert_geometry_bound(query_geometry, epsg=4326)
@@ -395,6 +577,21 @@ def collect(
     census_result.update(usgs_result)
     census_result.update(non_hifld_result)
 
+    # export kml of all layers in parallel
+    if output_kml:
+        census_result = export_kml(
+            census_result,
+            output_paths,
+            merge_kml=merge_kml,
+            max_workers=kml_workers)
+
+    # export GeoParquet of all layers
+    if output_geoparquet:
+        census_result = export_geoparquet(
+            census_result,
+            output_paths,
+            partition_cols=geoparquet_partition_cols)
+
     ci_result_df = pd.DataFrame.from_dict(census_result, orient='index')
     ci_result_df.index.rename('query', inplace=True)
 
@@ -410,6 +607,9 @@ def collect(
         facility_fps = ci_result_df.iloc[1:]['shp']
         gc.export_facilities_to_csv(
             facility_fps,
-            output_path=output_paths['csv'])
+            output_path=output_paths['csv'],
+            census_fp=census_fp,
+            sector_counts=output_sector_counts,
+            dedupe_groups=gc.dedupe_dict() if dedupe_facilities else None)
 
     return ci_result_df
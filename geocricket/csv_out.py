@@ -2,10 +2,136 @@
 Code to handle collected data into csv format
 """
 
+import collections
+import functools
 import os
 import pathlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 import geopandas as gpd
+import pyproj
+import shapely
+
+from .dedupe import find_duplicates_in_groups
+from .gis_io import read_gdf
+from .table_out import CENSUS_DTYPES
+from .table_out import FACILITY_DTYPES
+from .table_out import TableWriter
+from .table_out import write_table
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(crs_from, crs_to):
+    """
+    Return cached (always x, y) pyproj transformer between two crs.
+    """
+    return pyproj.Transformer.from_crs(crs_from, crs_to, always_xy=True)
+
+
+def transform_xy(x, y, crs_from, crs_to):
+    """
+    Return x and y coordinate arrays transformed between crs
+    """
+    if pyproj.CRS(crs_from) == pyproj.CRS(crs_to):
+        return x, y
+    return get_transformer(crs_from, crs_to).transform(x, y)
+
+
+def transform_geometry(geoms, crs_from, crs_to):
+    """
+    Return array of shapely geometries with every coordinate transformed
+    between crs in a single vectorized call.
+    """
+    if pyproj.CRS(crs_from) == pyproj.CRS(crs_to):
+        return geoms
+
+    def transform_coords(coords):
+        x, y = transform_xy(coords[:, 0], coords[:, 1], crs_from, crs_to)
+        return np.column_stack([x, y])
+
+    return shapely.transform(geoms, transform_coords)
+
+
+def location_points(gis_data):
+    """
+    Return longitude and latitude arrays (epsg 4326) of the location of
+    each geometry in gis_data.
+
+    Points are used as is, multipoints use a representative point, lines
+    their midpoint and polygons their centroid (both in epsg 3857).
+    Layers of mixed geometry types are handled row by row.
+    """
+    crs = gis_data.crs if gis_data.crs is not None else 4326
+    geoms = np.asarray(gis_data.geometry.array)
+    type_ids = shapely.get_type_id(geoms)
+
+    longitude = np.full(len(geoms), np.nan)
+    latitude = np.full(len(geoms), np.nan)
+
+    # points in original crs
+    is_multipoint = type_ids == 4
+    points = geoms.copy()
+    points[is_multipoint] = shapely.point_on_surface(geoms[is_multipoint])
+
+    is_line = np.isin(type_ids, [1, 2, 5])
+    is_polygon = np.isin(type_ids, [3, 6])
+    is_metric = is_line | is_polygon
+
+    in_crs = ~is_metric
+    longitude[in_crs], latitude[in_crs] = transform_xy(
+        shapely.get_x(points[in_crs]),
+        shapely.get_y(points[in_crs]),
+        crs, 4326)
+
+    # line midpoints and polygon centroids in meter crs
+    if is_metric.any():
+        metric_geoms = transform_geometry(geoms, crs, 3857)
+        metric_points = np.empty(len(geoms), dtype=object)
+        metric_points[is_line] = shapely.line_interpolate_point(
+            metric_geoms[is_line], 0.5, normalized=True)
+        metric_points[is_polygon] = shapely.centroid(
+            metric_geoms[is_polygon])
+
+        longitude[is_metric], latitude[is_metric] = transform_xy(
+            shapely.get_x(metric_points[is_metric]),
+            shapely.get_y(metric_points[is_metric]),
+            3857, 4326)
+
+    return longitude, latitude
+
+
+def read_layer(layer):
+    """
+    Return geodataframe of path, or layer as is if already a geodataframe
+    """
+    if isinstance(layer, gpd.GeoDataFrame):
+        return layer
+    return read_gdf(layer)
+
+
+def iter_layers(layers, max_workers=4):
+    """
+    Yield (layer, geodataframe) of each layer in order while the next
+    max_workers layers are read concurrently.  Missing layers (None or
+    nan) are skipped.
+    """
+    layers = [
+        x for x in layers
+        if not (x is None or isinstance(x, float))]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = collections.deque()
+        for layer in layers:
+            pending.append((layer, executor.submit(read_layer, layer)))
+            if len(pending) > max_workers:
+                layer, future = pending.popleft()
+                yield layer, future.result()
+
+        while pending:
+            layer, future = pending.popleft()
+            yield layer, future.result()
 
 
 def prepare_census_data_for_csv(census_fp):
@@ -13,43 +139,13 @@ def prepare_census_data_for_csv(census_fp):
     read in a census generated gis file,
     export csv with latitude and longitude and default stat fields.
     """
-    gis_data = gpd.read_file(census_fp)
+    gis_data = read_layer(census_fp)
 
     # if field name not found, use first column
     if 'rencat_id' not in gis_data.columns:
         gis_data['rencat_id'] = 'rencat_id' + gis_data.index.astype(str)
 
-    # ensure correct lat long
-    gis_data = gis_data.to_crs(4326)
-
-    # collect input data type
-    input_data_type = gis_data.geometry.type.unique()
-
-    if len(input_data_type) > 1:
-        if all(['Polygon' in x for x in input_data_type]):
-            input_data_type = 'Polygon'
-        else:
-            return print('Multiple data types found')
-
-    # account for various input types (multipoing, point, poly, ...)
-    if input_data_type == 'MultiPoint':
-        # multipoint data uses a representative point...
-        location_points = gis_data.representative_point()
-
-    elif input_data_type == 'Point':
-        location_points = gis_data.geometry
-
-    elif input_data_type == 'Polygon':
-        # if not point, make into centroids...
-        original_crs = gis_data.crs.to_epsg()
-        # convert to meter crs
-        converted_gdf = gis_data.to_crs(3857)
-        # replace original geometry with centroids
-        converted_gdf['geometry'] = converted_gdf.centroid
-        # convert back to original crs
-        gis_data = converted_gdf.to_crs(original_crs)
-        # collect centroid lat long
-        location_points = gis_data.geometry
+    longitude, latitude = location_points(gis_data)
 
     columns_to_keep = [
         'rencat_id',
@@ -61,11 +157,11 @@ def prepare_census_data_for_csv(census_fp):
         ]
 
     # add desired data to original object
-    gis_data['longitude'] = location_points.x
-    gis_data['latitude'] = location_points.y
+    gis_data['longitude'] = longitude
+    gis_data['latitude'] = latitude
 
     valid_columns = [x for x in columns_to_keep if x in gis_data.columns ]
-    gis_data = gis_data[valid_columns]
+    gis_data = pd.DataFrame(gis_data[valid_columns])
 
     return gis_data
 
@@ -73,9 +169,17 @@ def prepare_census_data_for_csv(census_fp):
 def export_census_geography_to_csv(
         census_fp,
         output_path=None,
-        export_csv=True):
+        export_csv=True,
+        compression=None,
+        columnar_formats=(),
+        chunk_size=None,
+        ):
     """
     Use data in census_fp to create simplified csv
+
+    compression ('gzip' or 'zstd') compresses the csv, columnar_formats
+    ('parquet' and / or 'feather') adds twins with explicit dtypes, and
+    chunk_size limits rows formatted at once (see table_out).
     """
     census_data = prepare_census_data_for_csv(census_fp)
 
@@ -87,111 +191,218 @@ def export_census_geography_to_csv(
 
     pathlib.Path.mkdir(output_path, parents=True, exist_ok=True)
 
-    census_data.to_csv(
-        pathlib.Path(output_path) / 'census_geometry_and_stats.csv',
-        index=False)
+    write_table(
+        census_data,
+        output_path,
+        'census_geometry_and_stats',
+        dtypes=CENSUS_DTYPES,
+        compression=compression,
+        columnar_formats=columnar_formats,
+        chunk_size=chunk_size)
 
     return output_path
 
 
 def prepare_facility_data_for_csv(facility_fp, sector_field='Sector'):
     """
-    read in a facility gis file, add sector name,
-    export csv with latitude and longitude.
+    read in a facility gis file (or geodataframe), add sector name,
+    return dataframe with rencat_id, latitude, longitude and sector.
+    Points, lines and polygons (single or multi part) are handled.
     """
-    gis_data = gpd.read_file(facility_fp)
+    gis_data = read_layer(facility_fp)
 
     # standardize rencat id
-    if 'rencat_id' not in gis_data.columns:
-        gis_data['rencat_id'] = 'rencat_id' + gis_data.index.astype(str)
-
-    # ensure correct lat long
-    gis_data = gis_data.to_crs(4326)
-
-    # collect input data type
-    input_data_type = gis_data.geometry.type.unique()
-
-    if len(input_data_type) > 1:
-        return 'Multiple data types found'
-
-    # account for various input types (multipoing, point, poly, ...)
-    if input_data_type == 'MultiPoint':
-        # multipoint data uses a representative point...
-        location_points = gis_data.representative_point()
-
-    elif input_data_type == 'Point':
-        location_points = gis_data.geometry
-
-    elif input_data_type == 'Polygon':
-        # if not point, make into centroids...
-        original_crs = gis_data.crs.to_epsg()
-        # convert to meter crs
-        converted_gdf = gis_data.to_crs(3857)
-        # replace original geometry with centroids
-        converted_gdf['geometry'] = converted_gdf.centroid
-        # convert back to original crs
-        gis_data = converted_gdf.to_crs(original_crs)
-        # collect centroid lat long
-        location_points = gis_data.geometry
-
-    elif 'Line' in input_data_type:
-        return 'Line data not handled.'
+    if 'rencat_id' in gis_data.columns:
+        rencat_ids = gis_data['rencat_id'].to_numpy()
     else:
-        return f"Data type '{input_data_type}' not handled."
+        rencat_ids = ('rencat_id' + gis_data.index.astype(str)).to_numpy()
 
-    columns_to_keep = [
-        'rencat_id',
-        'longitude',
-        'latitude',
-        'sector']
+    type_ids = shapely.get_type_id(np.asarray(gis_data.geometry.array))
+    if (type_ids == 7).any():
+        return "Data type 'GeometryCollection' not handled."
 
-    # add desired data to original object
-    gis_data['longitude'] = location_points.x
-    gis_data['latitude'] = location_points.y
-    gis_data['sector'] = gis_data[sector_field]
+    longitude, latitude = location_points(gis_data)
 
-    gis_data = gis_data[columns_to_keep]
+    return pd.DataFrame({
+        'rencat_id': rencat_ids,
+        'longitude': longitude,
+        'latitude': latitude,
+        'sector': gis_data[sector_field].to_numpy(),
+        })
 
-    return gis_data
+
+def make_census_index(census_fp, geoid_field='GEOID'):
+    """
+    Return STRtree of census geometry (epsg 4326) and array of geoids
+    """
+    census_data = read_layer(census_fp).to_crs(4326)
+    census_tree = shapely.STRtree(np.asarray(census_data.geometry.array))
+
+    return census_tree, census_data[geoid_field].to_numpy()
+
+
+def lookup_geoids(longitude, latitude, census_index):
+    """
+    Return geoid of the census geometry containing each longitude and
+    latitude, or None.  Points on a shared census boundary are assigned
+    to the first matching census geometry.
+    """
+    census_tree, census_geoids = census_index
+
+    facility_pts = shapely.points(
+        np.asarray(longitude, dtype=float),
+        np.asarray(latitude, dtype=float))
+
+    pt_ndx, census_ndx = census_tree.query(
+        facility_pts, predicate='intersects')
+
+    # query results are ordered by point, keep first match of each point
+    pt_ndx, first_match = np.unique(pt_ndx, return_index=True)
+
+    geoids = np.full(len(facility_pts), None, dtype=object)
+    geoids[pt_ndx] = census_geoids[census_ndx[first_match]]
+
+    return geoids
+
+
+def assign_census_geography(
+        facility_df,
+        census_fp,
+        geoid_field='GEOID',
+        ):
+    """
+    Attach the geoid of the census geometry containing each facility
+    (longitude / latitude) as a GEOID column.
+
+    All facilities are joined with a single bulk STRtree query.
+    Facilities on a shared census boundary are assigned to the first
+    matching census geometry, facilities outside of all census geometry
+    are left without a GEOID.
+    """
+    census_index = make_census_index(census_fp, geoid_field)
+
+    facility_df = facility_df.copy()
+    facility_df['GEOID'] = lookup_geoids(
+        facility_df['longitude'], facility_df['latitude'], census_index)
+
+    return facility_df
+
+
+def count_facilities_by_sector(facility_df):
+    """
+    Count facilities of each sector found in each census geography.
+    Returns a dataframe with a GEOID column and a column per sector.
+    """
+    counts = pd.crosstab(facility_df['GEOID'], facility_df['sector'])
+    counts.columns.name = None
+
+    return counts.reset_index()
 
 
 def export_facilities_to_csv(
         facility_fps,
         output_path=None,
         export_csv=True,
+        census_fp=None,
+        sector_counts=False,
+        dedupe_groups=None,
+        compression=None,
+        columnar_formats=(),
+        chunk_size=None,
         ):
     """
     Collect and export facility data to csv
+
+    facility_fps may be paths or geodataframes of point, line or polygon
+    layers.  Layers are read concurrently and facility_data.csv is
+    written in a single pass, one layer at a time.
+
+    If census_fp is given, the GEOID of the census geometry each facility
+    is located in is added, and optionally facility counts per census
+    geometry and sector are exported to census_facility_counts.csv.
+
+    If dedupe_groups (see rest_info.dedupe_dict) is given, facilities
+    reported by more than one layer of a group are only kept once.
+    The rencat_ids of merged facilities are listed in a merged_rencat_ids
+    column, and full provenance is exported to facility_dedupe.csv.
+
+    compression ('gzip' or 'zstd') compresses facility_data.csv,
+    columnar_formats ('parquet' and / or 'feather') adds twins with
+    explicit dtypes, and chunk_size limits rows formatted at once
+    (see table_out).
     """
 
+    if dedupe_groups is not None:
+        dedupe_df = find_duplicates_in_groups(facility_fps, dedupe_groups)
+        merged_ids = dedupe_df.groupby('rencat_id')['merged_rencat_id'].agg(
+            ';'.join)
+
+    census_index = None
+    if census_fp is not None:
+        census_index = make_census_index(census_fp)
+
+    if export_csv:
+        if output_path is None:
+            output_path = pathlib.Path(os.getcwd())
+        facility_writer = TableWriter(
+            output_path,
+            'facility_data',
+            dtypes=FACILITY_DTYPES,
+            compression=compression,
+            columnar_formats=columnar_formats,
+            chunk_size=chunk_size)
+
+    # layers are read concurrently and written as they are prepared
     facility_data = []
-    for facility_fp in facility_fps:
-        if isinstance(facility_fp, float):
-            # skips nan
-            continue
-        if facility_fp is None:
-            continue
+    sector_count_data = []
+    for facility_fp, gis_data in iter_layers(facility_fps):
+        csv_data = prepare_facility_data_for_csv(gis_data)
 
-        csv_data = prepare_facility_data_for_csv(facility_fp)
-
-        if isinstance(csv_data, pd.DataFrame):
-            facility_data.append(csv_data)
-        else:
+        if not isinstance(csv_data, pd.DataFrame):
             # handle non handled types
             print(f"Error on {facility_fp}' : {csv_data}")
+            continue
 
-    facility_df = pd.concat(facility_data)
+        if dedupe_groups is not None:
+            csv_data = csv_data[
+                ~csv_data['rencat_id'].isin(dedupe_df['merged_rencat_id'])]
+            csv_data = csv_data.assign(
+                merged_rencat_ids=csv_data['rencat_id'].map(merged_ids))
 
-    if not export_csv:
-        return facility_df
+        if census_index is not None:
+            csv_data = csv_data.assign(GEOID=lookup_geoids(
+                csv_data['longitude'], csv_data['latitude'], census_index))
+            if sector_counts:
+                sector_count_data.append(
+                    count_facilities_by_sector(csv_data))
 
-    if output_path is None:
-        output_path = pathlib.Path(os.getcwd())
+        if not export_csv:
+            facility_data.append(csv_data)
+            continue
 
-    pathlib.Path.mkdir(output_path, parents=True, exist_ok=True)
+        facility_writer.write(csv_data)
 
-    facility_df.to_csv(
-        pathlib.Path(output_path) / 'facility_data.csv',
-        index=False)
+    if not export_csv:
+        if not facility_data:
+            return pd.DataFrame(
+                columns=['rencat_id', 'longitude', 'latitude', 'sector'])
+        return pd.concat(facility_data, ignore_index=True)
+
+    if facility_writer.n_written == 0:
+        facility_writer.write(pd.DataFrame(
+            columns=['rencat_id', 'longitude', 'latitude', 'sector']))
+    facility_writer.close()
+
+    if dedupe_groups is not None:
+        dedupe_df.to_csv(
+            pathlib.Path(output_path) / 'facility_dedupe.csv',
+            index=False)
+
+    if (census_fp is not None) and sector_counts and sector_count_data:
+        count_df = pd.concat(sector_count_data, ignore_index=True)
+        count_df = count_df.groupby('GEOID', sort=True).sum().fillna(0)
+        count_df.astype(int).reset_index().to_csv(
+            pathlib.Path(output_path) / 'census_facility_counts.csv',
+            index=False)
 
     return output_path
@@ -0,0 +1,290 @@
+"""
+Functions to find the same facility reported by multiple sources.
+
+collect() queries overlapping datasets (e.g. HIFLD and USGS hospitals)
+which would double count facilities in ReNCAT outputs.  Facilities of a
+group of layers are matched when they are within a search radius of each
+other (single STRtree dwithin query) and have similar names.  Matched
+facilities are merged into the facility of the highest priority layer.
+"""
+import difflib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from .gis_io import read_gdf
+
+
+def normalize_names(names):
+    """
+    Lower case, remove punctuation and repeated whitespace from names
+    """
+    names = pd.Series(names, dtype=object).fillna('').astype(str)
+    names = names.str.lower()
+    names = names.str.replace(r'[^a-z0-9 ]', ' ', regex=True)
+    names = names.str.replace(r'\s+', ' ', regex=True).str.strip()
+    return names.to_numpy()
+
+
+def name_similarity_ratio(name_a, name_b):
+    """
+    Return similarity ratio (0 - 1) of two normalized names.
+    Missing names are not similar to anything.
+    """
+    if (not name_a) or (not name_b):
+        return 0.0
+    return difflib.SequenceMatcher(None, name_a, name_b).ratio()
+
+
+def find_name_field(gdf, name_field=None):
+    """
+    Return name_field if in gdf, else first column named 'name' (any case)
+    """
+    if (name_field is not None) and (name_field in gdf.columns):
+        return name_field
+
+    for col in gdf.columns:
+        if col.lower() == 'name':
+            return col
+    return None
+
+
+def label_clusters(n_items, pair_a, pair_b):
+    """
+    Union-find of matched pairs.
+    Returns cluster label (lowest member index) for each item.
+    """
+    parent = np.arange(n_items)
+
+    def find(ndx):
+        root = ndx
+        while parent[root] != root:
+            root = parent[root]
+        # compress path
+        while parent[ndx] != root:
+            parent[ndx], ndx = root, parent[ndx]
+        return root
+
+    for a, b in zip(pair_a, pair_b):
+        root_a = find(a)
+        root_b = find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    return np.array([find(ndx) for ndx in range(n_items)])
+
+
+def find_duplicate_facilities(
+        facility_layers,
+        radius=250,
+        name_similarity=0.6,
+        cross_source_only=True,
+        name_field=None,
+        ):
+    """
+    Find facilities that are reported by more than one layer.
+
+    Parameters
+    ----------
+    facility_layers : dict
+        layer name to path or geodataframe of facilities. Layers should
+        be ordered by priority, facilities of earlier layers are kept
+        over those of later layers. Each layer should have a rencat_id.
+    radius : float
+        Search distance in meters. Defaults to 250.
+    name_similarity : float
+        Minimum normalized name similarity ratio (0 - 1) of facilities
+        within radius to be considered the same facility. Defaults to 0.6
+    cross_source_only : bool
+        If true, facilities of the same layer are never merged.
+        Defaults to True
+    name_field : str, optional
+        Field to compare, defaults to a field called 'name' of any case.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Provenance of each merged facility: the kept rencat_id and source,
+        and the merged rencat_id, source, distance, and name similarity.
+    """
+    provenance_cols = [
+        'rencat_id', 'source',
+        'merged_rencat_id', 'merged_source',
+        'distance', 'name_similarity']
+
+    frames = []
+    for priority, (source, layer) in enumerate(facility_layers.items()):
+        if isinstance(layer, gpd.GeoDataFrame):
+            gdf = layer
+        else:
+            gdf = read_gdf(layer)
+
+        if gdf.empty:
+            continue
+
+        # standardize rencat id (as in csv_out)
+        if 'rencat_id' in gdf.columns:
+            rencat_ids = gdf['rencat_id'].to_numpy()
+        else:
+            rencat_ids = ('rencat_id' + gdf.index.astype(str)).to_numpy()
+
+        layer_name_field = find_name_field(gdf, name_field)
+        if layer_name_field is None:
+            names = np.full(len(gdf), '', dtype=object)
+        else:
+            names = gdf[layer_name_field].to_numpy()
+
+        frames.append(gpd.GeoDataFrame({
+            'rencat_id': rencat_ids,
+            'source': source,
+            'priority': priority,
+            'name': names,
+            'geometry': gdf.geometry.to_crs(4326).to_numpy(),
+            }, crs=4326))
+
+    if not frames:
+        return pd.DataFrame(columns=provenance_cols)
+
+    facility_df = pd.concat(frames, ignore_index=True)
+
+    # search in meters
+    utm_crs = facility_df.estimate_utm_crs()
+    points = shapely.point_on_surface(
+        np.asarray(facility_df.geometry.to_crs(utm_crs).array))
+
+    tree = shapely.STRtree(points)
+    pair_a, pair_b = tree.query(points, predicate='dwithin', distance=radius)
+
+    # keep each candidate pair once
+    keep = pair_a < pair_b
+    if cross_source_only:
+        source = facility_df['source'].to_numpy()
+        keep &= source[pair_a] != source[pair_b]
+    pair_a = pair_a[keep]
+    pair_b = pair_b[keep]
+
+    # only candidate pairs are compared by name
+    names = normalize_names(facility_df['name'])
+    similarity = np.array([
+        name_similarity_ratio(names[a], names[b])
+        for a, b in zip(pair_a, pair_b)], dtype=float)
+
+    is_match = similarity >= name_similarity
+    pair_a = pair_a[is_match]
+    pair_b = pair_b[is_match]
+
+    if len(pair_a) == 0:
+        return pd.DataFrame(columns=provenance_cols)
+
+    facility_df['cluster'] = label_clusters(len(facility_df), pair_a, pair_b)
+
+    # keep highest priority (then first found) facility of each cluster
+    in_cluster = facility_df['cluster'].duplicated(keep=False)
+    cluster_df = facility_df[in_cluster].sort_values(
+        ['cluster', 'priority'], kind='stable')
+    is_kept = ~cluster_df['cluster'].duplicated(keep='first')
+
+    kept_df = cluster_df[is_kept]
+    merged_df = cluster_df[~is_kept]
+
+    # facility index of kept facility for each merged facility
+    kept_lookup = pd.Series(
+        kept_df.index.to_numpy(), index=kept_df['cluster'].to_numpy())
+    kept_ndx = kept_lookup.loc[merged_df['cluster'].to_numpy()].to_numpy()
+    merged_ndx = merged_df.index.to_numpy()
+
+    distance = shapely.distance(points[kept_ndx], points[merged_ndx])
+    merged_similarity = np.array([
+        name_similarity_ratio(names[a], names[b])
+        for a, b in zip(kept_ndx, merged_ndx)], dtype=float)
+
+    return pd.DataFrame({
+        'rencat_id': facility_df['rencat_id'].to_numpy()[kept_ndx],
+        'source': facility_df['source'].to_numpy()[kept_ndx],
+        'merged_rencat_id': merged_df['rencat_id'].to_numpy(),
+        'merged_source': merged_df['source'].to_numpy(),
+        'distance': distance,
+        'name_similarity': merged_similarity,
+        })
+
+
+def normalize_layer_name(name):
+    """
+    Return lower case layer name without HIFLD_ prefix, as used in
+    rencat_ids (see geocricket.add_rencat_id)
+    """
+    name = str(name).lower().replace(' ', '_')
+    if name.startswith('hifld_'):
+        name = name[6:]
+    return name
+
+
+def get_named_layers(facility_fp, sector_field='Sector'):
+    """
+    Return dictionary of normalized layer names to the facilities of a
+    file or geodataframe they are matched to dedupe group layers by.
+    Files are named by their file name.  Geodataframes are split by the
+    values of their sector_field, or else their rencat_id prefixes.
+    """
+    if not isinstance(facility_fp, gpd.GeoDataFrame):
+        return {normalize_layer_name(Path(facility_fp).stem): facility_fp}
+
+    if sector_field in facility_fp.columns:
+        names = facility_fp[sector_field]
+    elif 'rencat_id' in facility_fp.columns:
+        names = facility_fp['rencat_id'].astype(str).str.rsplit(
+            '_', n=1).str[0]
+    else:
+        return {}
+
+    names = names.dropna().map(normalize_layer_name)
+    return {
+        name: facility_fp.loc[names.index[names == name]]
+        for name in names.unique()}
+
+
+def find_duplicates_in_groups(facility_fps, dedupe_groups):
+    """
+    Find duplicate facilities for each group of layers in dedupe_groups
+    (see rest_info.dedupe_dict).  Layers are matched to facility_fps by
+    file name (e.g. HIFLD_Hospitals.shp), or for geodataframes by their
+    Sector (e.g. Hospitals) or rencat_id prefix (e.g. hospitals_0).
+
+    Returns combined provenance dataframe with a dedupe_group column.
+    """
+    layer_fps = {}
+    for facility_fp in facility_fps:
+        if isinstance(facility_fp, float) or facility_fp is None:
+            # skips nan
+            continue
+        layer_fps.update(get_named_layers(facility_fp))
+
+    results = []
+    for group_name, group in dedupe_groups.items():
+        group_layers = {
+            layer: layer_fps[normalize_layer_name(layer)]
+            for layer in group['layers']
+            if normalize_layer_name(layer) in layer_fps}
+
+        if not group_layers:
+            continue
+
+        group_result = find_duplicate_facilities(
+            group_layers,
+            radius=group.get('radius', 250),
+            name_similarity=group.get('name_similarity', 0.6),
+            cross_source_only=group.get('cross_source_only', True),
+            name_field=group.get('name_field', None))
+        group_result.insert(0, 'dedupe_group', group_name)
+        results.append(group_result)
+
+    if not results:
+        return pd.DataFrame(columns=[
+            'dedupe_group', 'rencat_id', 'source',
+            'merged_rencat_id', 'merged_source',
+            'distance', 'name_similarity'])
+
+    return pd.concat(results, ignore_index=True)
@@ -0,0 +1,192 @@
+"""
+FlatGeobuf output.
+
+FlatGeobuf files carry a packed Hilbert R-tree ahead of the features, so
+a reader can fetch only the features intersecting a bbox (from disk or a
+http range request) without scanning the file or needing SQLite.  This
+makes large road and transmission layers cheap to subset.
+
+Features without a geometry can not be indexed, and are dropped when a
+spatial index is written.
+
+Layers too large to hold in memory are written chunk by chunk with a
+FlatGeobufWriter.  With pyogrio, each chunk is appended through Arrow
+(GDAL rewrites the file and its index on each append, so larger chunks
+are faster).  Without pyogrio, chunks are written through a single open
+fiona collection that builds the index when the writer is closed.
+"""
+import os
+from pathlib import Path
+
+import fiona
+from geopandas.io.file import infer_schema
+
+from .gis_io import HAS_PYOGRIO
+from .gis_io import read_gdf
+from .gis_io import write_gdf
+
+
+FGB_DRIVER = 'FlatGeobuf'
+
+SHP_ENDINGS = ['.shp', '.shx', '.dbf', '.sbn', '.sbx', '.fbn', '.fbx',
+               '.ain', '.aih', '.stx', '.ixs', '.msx', '.prj', '.xml', '.cpg']
+
+
+def write_flatgeobuf(gdf, out_fp, spatial_index=True):
+    """
+    Write gdf to a FlatGeobuf file, with a packed Hilbert R-tree if
+    spatial_index.
+
+    Returns path of written file, or None if there were no features to
+    write.
+    """
+    out_fp = Path(out_fp)
+    out_fp.parent.mkdir(parents=True, exist_ok=True)
+
+    if spatial_index:
+        geoms = gdf.geometry
+        gdf = gdf[geoms.notna() & ~geoms.is_empty]
+
+    if gdf.empty:
+        # GDAL writes feature-less FlatGeobuf files it can not reopen
+        return None
+
+    write_gdf(
+        gdf,
+        out_fp,
+        driver=FGB_DRIVER,
+        layer_options={'SPATIAL_INDEX': 'YES' if spatial_index else 'NO'})
+
+    return out_fp
+
+
+class FlatGeobufWriter:
+    """
+    Write geodataframe chunks to a FlatGeobuf file, with a packed Hilbert
+    R-tree if spatial_index.
+
+    The field schema of the file is taken from the first written chunk.
+    No file is written if no chunk has features.
+
+    Chunks are appended through pyogrio (Arrow, when pyarrow is
+    available), or fiona if pyogrio is not installed.
+    """
+
+    def __init__(self, out_fp, spatial_index=True):
+        self.out_fp = Path(out_fp)
+        self.spatial_index = spatial_index
+        self._collection = None
+        self.n_written = 0
+
+    def _open(self, gdf):
+        schema = infer_schema(gdf)
+        # geometry types of later chunks are not known
+        schema['geometry'] = 'Unknown'
+
+        self.out_fp.parent.mkdir(parents=True, exist_ok=True)
+        self._collection = fiona.open(
+            self.out_fp,
+            'w',
+            driver=FGB_DRIVER,
+            schema=schema,
+            crs=gdf.crs.to_wkt() if gdf.crs is not None else None,
+            SPATIAL_INDEX='YES' if self.spatial_index else 'NO')
+
+    def write(self, gdf):
+        """
+        Append geodataframe chunk
+        """
+        if self.spatial_index:
+            geoms = gdf.geometry
+            gdf = gdf[geoms.notna() & ~geoms.is_empty]
+
+        if gdf.empty:
+            return
+
+        if HAS_PYOGRIO:
+            self.out_fp.parent.mkdir(parents=True, exist_ok=True)
+            write_gdf(
+                gdf,
+                self.out_fp,
+                driver=FGB_DRIVER,
+                append=self.n_written > 0,
+                layer_options={
+                    'SPATIAL_INDEX': 'YES' if self.spatial_index else 'NO'},
+                # geometry types of later chunks are not known
+                geometry_type='Unknown',
+                engine='pyogrio')
+        else:
+            if self._collection is None:
+                self._open(gdf)
+            self._collection.writerecords(gdf.iterfeatures())
+
+        self.n_written += len(gdf)
+
+    def close(self):
+        """
+        Finish file, building the spatial index
+        """
+        if self._collection is not None:
+            self._collection.close()
+            self._collection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def shp_to_fgb(
+        file_path,
+        out_path=None,
+        remove_old=False,
+        spatial_index=True,
+        ):
+    """
+    Convert shape file to FlatGeobuf and optionally delete shape files
+
+    return of output file location, None if shape file had no features
+    """
+    file_path = Path(file_path)
+
+    if out_path is None:
+        # export in same directory
+        fgb_out_path = file_path.with_suffix('.fgb')
+    else:
+        # export to new directory
+        fgb_out_path = Path(out_path) / f'{file_path.stem}.fgb'
+
+    fgb_out_path = write_flatgeobuf(
+        read_gdf(file_path),
+        fgb_out_path,
+        spatial_index=spatial_index)
+
+    if remove_old:
+        for file_ending in SHP_ENDINGS:
+            shp_part = file_path.with_suffix(file_ending)
+            if shp_part.exists():
+                os.remove(shp_part)
+
+    return fgb_out_path
+
+
+def read_flatgeobuf_bbox(file_path, bbox, crs=None):
+    """
+    Return geodataframe of features of a FlatGeobuf file intersecting
+    bbox.  Only index nodes and features near bbox are read.
+
+    Parameters
+    ----------
+    file_path : path or str
+        FlatGeobuf file, or url.
+    bbox : tuple
+        (minx, miny, maxx, maxy) to read features of.
+    crs : optional
+        crs of bbox, if not the crs of the file.
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+    """
+    return read_gdf(file_path, bbox=bbox, bbox_crs=crs)
@@ -15,6 +15,16 @@ import shapely
 import geopandas as gpd
 from pathlib import Path
 
+from .census_stats import join_decennial_block_stats
+from .gis_io import get_driver
+from .gis_io import read_gdf
+from .gis_io import write_gdf
+from .rest_paging import get_layer_url
+from .rest_paging import get_server_type
+from .rest_paging import iter_chunks
+from .rest_paging import iter_tiled_feature_pages
+from .rest_paging import write_chunks
+
 
 # Rest API link definitions:
 CENSUS_URL = 'https://tigerweb.geo.census.gov/arcgis/rest/services/'
@@ -23,6 +33,9 @@ HIFLD_URL = 'https://services1.arcgis.com/Hp6G80Pky0om7QvQ/ArcGIS/rest/services/
 # For restapi to not use arcpy things
 os.environ['RESTAPI_USE_ARCPY'] = 'FALSE'
 
+# file suffixes of streamed output formats
+STREAM_FORMATS = ['gpkg', 'parquet', 'fgb']
+
 def check_connection():
     """
     Check python connection to sample server
@@ -43,7 +56,7 @@ def ensure_gdf(file_path):
     if isinstance(file_path, gpd.GeoDataFrame):
         return file_path.copy()
     else:
-        return gpd.read_file(file_path)
+        return read_gdf(file_path)
 
 
 def get_single_geometry(gdf, geo_index):
@@ -55,6 +68,13 @@ def get_dissolved_geometry(gdf):
     return dissolved_gdf.geometry[0]
 
 
+def boundary_to_shapely(boundary_geo):
+    """
+    Convert restapi geometry (e.g. from convert_geometry_bound) to shapely
+    """
+    return shapely.geometry.shape(boundary_geo.asShape().__geo_interface__)
+
+
 def convert_geometry_bound(
         file_path,
         epsg=4326,
@@ -132,8 +152,9 @@ def export_census_geometry(
     4: Tribal Block Groups
 
     return of output file location
-    # TODO handle block geometry using last 10 year census...
-    https://tigerweb.geo.census.gov/arcgis/rest/services/TIGERweb/Tracts_Blocks/MapServer
+
+    Block geometry is only available from the last 10 year census and is
+    collected by export_census_blocks.
     """
     layer_dict = get_census_geo_layer_dict()
 
@@ -162,12 +183,137 @@ def export_census_geometry(
     return final_out_path
 
 
+def export_census_blocks(
+        boundary_geo,
+        out_directory=None,
+        out_name='Census_',
+        crs_in=4326,
+        crs=3857,
+        census_api_key=None,
+        census_year='2020',
+        service='Census2020/Tracts_Blocks',
+        layer=2,
+        tile_size=20000,
+        page_size=2000,
+        chunk_size=20000,
+        max_workers=4,
+        ):
+    """
+    Query TigerWEB for census blocks that overlap boundary geometry and
+    stream them to a geopackage.
+
+    Blocks can number hundreds of thousands per state, so the boundary is
+    split into tile_size (crs units) tiles that are paged through
+    concurrently by max_workers threads.  Pages are combined into chunks
+    of chunk_size blocks that are written (appended) as they arrive,
+    which bounds memory by chunk size rather than by boundary size.
+
+    If census_api_key is given, decennial P1 total population
+    (P1_001N) is joined to each chunk before it is written.
+
+    boundary_geo in crs_in is reprojected to crs, the crs of the
+    written blocks.
+
+    Returns tuple of out file path and count
+    will return (None, 0) if no results found
+    """
+    layer_url = get_layer_url(CENSUS_URL, service, layer)
+    boundary = gpd.GeoSeries(
+        [boundary_to_shapely(boundary_geo)], crs=crs_in).to_crs(crs)[0]
+
+    pages = iter_tiled_feature_pages(
+        layer_url,
+        boundary,
+        crs=crs,
+        tile_size=tile_size,
+        page_size=page_size,
+        max_workers=max_workers)
+
+    chunks = iter_chunks(pages, chunk_size=chunk_size)
+
+    if census_api_key is not None:
+        chunks = (
+            join_decennial_block_stats(
+                chunk, census_api_key, census_year=census_year)
+            for chunk in chunks)
+
+    # handle no given output directory
+    if out_directory is None:
+        out_directory = os.getcwd()
+    else:
+        pathlib.Path.mkdir(Path(out_directory), parents=True, exist_ok=True)
+
+    final_out_path = os.path.join(out_directory, f'{out_name}Blocks.gpkg')
+
+    count = write_chunks(chunks, final_out_path, driver='GPKG')
+
+    if count == 0:
+        return (None, 0)
+
+    return (final_out_path, count)
+
+
+def stream_layer(
+        layer_url,
+        boundary_geo,
+        out_path,
+        crs_in=4326,
+        crs_out=3857,
+        tile_size=None,
+        page_size=2000,
+        chunk_size=20000,
+        max_workers=4,
+        ):
+    """
+    Page through features of layer_url that overlap boundary geometry
+    and write them to out_path (gpkg, parquet or fgb) as they arrive.
+
+    Pages are combined into chunks of chunk_size features that are
+    written immediately, so memory depends on page and chunk size rather
+    than layer size.  Large boundaries can be split into tile_size
+    (crs_out units) tiles paged through concurrently by max_workers
+    threads, by default the boundary is queried as a single tile.
+
+    Returns tuple of out file path and count
+    will return (None, 0) if no results found
+    """
+    if Path(out_path).suffix.lstrip('.') not in STREAM_FORMATS:
+        raise ValueError(f'out_path must be one of {STREAM_FORMATS} files')
+
+    boundary = gpd.GeoSeries(
+        [boundary_to_shapely(boundary_geo)], crs=crs_in).to_crs(crs_out)[0]
+
+    if tile_size is None:
+        min_x, min_y, max_x, max_y = boundary.bounds
+        tile_size = max(max_x - min_x, max_y - min_y)
+
+    pages = iter_tiled_feature_pages(
+        layer_url,
+        boundary,
+        crs=crs_out,
+        tile_size=tile_size,
+        page_size=page_size,
+        max_workers=max_workers)
+
+    chunks = iter_chunks(pages, chunk_size=chunk_size)
+
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+    count = write_chunks(chunks, out_path, driver=get_driver(out_path))
+
+    if count == 0:
+        return (None, 0)
+
+    return (out_path, count)
+
+
 def export_census_transportation(
         boundary_geo,
         out_directory=None,
         out_name='Census_',
         crs=3857,
         road_layer=0,
+        stream_format=None,
+        **stream_kwargs,
         ):
     """
     Query TigerWEB and return desired transportation data from the 2020 Census
@@ -178,6 +324,11 @@ def export_census_transportation(
     2: Local
     3: Rail
 
+    If stream_format (one of STREAM_FORMATS) is given, features are paged
+    and written to a file of that format as they arrive (see
+    stream_layer, which stream_kwargs are passed to) rather than
+    collected in memory and exported as shp.
+
     return of output file location
 
     """
@@ -188,6 +339,20 @@ def export_census_transportation(
                    'Local_Roads',
                    'Railroads']
 
+    if stream_format is not None:
+        if out_directory is None:
+            out_directory = os.getcwd()
+        return stream_layer(
+            get_layer_url(
+                CENSUS_URL, 'Census2020/Transportation', layers[road_layer]),
+            boundary_geo,
+            os.path.join(
+                out_directory,
+                f'{out_name}{layer_names[road_layer]}.{stream_format}'),
+            crs_in=crs,
+            crs_out=crs,
+            **stream_kwargs)
+
     arc_gis_server = restapi.ArcServer(CENSUS_URL)
     service_connection = arc_gis_server.getService('Census2020/Transportation')
     layer = service_connection.layer(layers[road_layer])
@@ -215,6 +380,8 @@ def export_hifld_data(
         out_name='HIFLD_data',
         crs_in=4326,
         crs_out=3857,
+        stream_format=None,
+        **stream_kwargs,
         ):
     """
     Query Homeland Infrastrucutre Foundataion-Level Data (HIFLD)
@@ -223,12 +390,27 @@ def export_hifld_data(
     Server typically requires multiple queries before responding correctly.
     Accounted for 5 attempts before returning None.
 
+    If stream_format (one of STREAM_FORMATS) is given, features are paged
+    and written to a file of that format as they arrive (see
+    stream_layer, which stream_kwargs are passed to).
+
     # NOTE: Seems to work best when input crs is 4326,
     output default of 3857 for Census crs match
 
     Returns tuple of out file path and count
     will return (None, 0) if error or no results found
     """
+    if stream_format is not None:
+        if out_directory is None:
+            out_directory = os.getcwd()
+        return stream_layer(
+            get_layer_url(
+                HIFLD_URL, service, layer, server_type='FeatureServer'),
+            boundary_geo,
+            os.path.join(out_directory, f'{out_name}.{stream_format}'),
+            crs_in=crs_in,
+            crs_out=crs_out,
+            **stream_kwargs)
 
     arc_gis_server = restapi.ArcServer(HIFLD_URL)
 
@@ -269,17 +451,37 @@ def export_server_URL_data(
         layer,
         out_directory=None,
         out_name='REST_data',
-        crs_in=4326, crs_out=3857):
+        crs_in=4326, crs_out=3857,
+        stream_format=None,
+        **stream_kwargs):
     """
     Query an ArcGIS server specified by server_url
     and return desired data from layer that overlaps boundary geometry
 
     Accounts for 5 server attempts before returning None.
 
+    If stream_format (one of STREAM_FORMATS) is given, features are paged
+    and written to a file of that format as they arrive (see
+    stream_layer, which stream_kwargs are passed to).
+
     Returns tuple of out file path and count
     will retrun (None, None) if error or no results found
 
     """
+    if stream_format is not None:
+        if out_directory is None:
+            out_directory = os.getcwd()
+        return stream_layer(
+            get_layer_url(
+                server_url,
+                service,
+                layer,
+                server_type=get_server_type(server_url)),
+            boundary_geo,
+            os.path.join(out_directory, f'{out_name}.{stream_format}'),
+            crs_in=crs_in,
+            crs_out=crs_out,
+            **stream_kwargs)
     arc_gis_server = restapi.ArcServer(server_url)
 
     attempt = 0
@@ -334,7 +536,7 @@ def shp_to_gpkg(
     file_name = file_name.split('.')
     file_name = file_name[0]
 
-    shp_file_df = gpd.read_file(file_path)
+    shp_file_df = read_gdf(file_path)
 
     if out_path is None:
         # export in same directory
@@ -343,7 +545,7 @@ def shp_to_gpkg(
         # export to new directory
         gpkg_out_path = os.path.join(out_path, f"{file_name}.gpkg")
 
-    shp_file_df.to_file(gpkg_out_path, driver="GPKG")
+    write_gdf(shp_file_df, gpkg_out_path, driver="GPKG")
 
     if remove_old:
         # read directory, collect files related to shape
@@ -380,7 +582,7 @@ def add_field_to_file(
     """
     # attempt to load file
     try:
-        geo_df = gpd.read_file(file_path)
+        geo_df = read_gdf(file_path)
     except:
         print(f"Error reading: {file_path}")
         return None
@@ -413,12 +615,9 @@ def add_field_to_file(
             path_out = os.path.join(file_path_splits[0],
                                     file_name + f'_{file_n}.{file_type}')
 
-    # handle geopackage output
+    # driver (e.g. geopackage) is discovered from file type
     try:
-        if file_type.lower() == 'gpkg':
-            geo_df.to_file(path_out, driver='GPKG')
-        else:
-            geo_df.to_file(path_out)
+        write_gdf(geo_df, path_out)
     except:
         print(f"Error writing to: {path_out}")
         return None
@@ -447,7 +646,7 @@ def add_rencat_id(
     if not is_gdf:
         # attempt to load file
         try:
-            geo_df = gpd.read_file(file_path)
+            geo_df = read_gdf(file_path)
         except:
             print(f"Error reading: {file_path}")
             return None
@@ -476,12 +675,9 @@ def add_rencat_id(
                 file_path_splits[0],
                 file_name + f'_{file_n}.{file_type}')
 
-    # handle geopackage output
+    # driver (e.g. geopackage) is discovered from file type
     try:
-        if file_type.lower() == 'gpkg':
-            geo_df.to_file(path_out, driver='GPKG')
-        else:
-            geo_df.to_file(path_out)
+        write_gdf(geo_df, path_out)
     except:
         print(f"Error writing to: {path_out}")
         return None
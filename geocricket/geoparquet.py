@@ -0,0 +1,340 @@
+"""
+GeoParquet output.
+
+Shapefiles are slow to write, truncate field names to 10 characters and
+are limited to 2 GB.  These functions write layers as GeoParquet (1.1)
+through Arrow: geometry is encoded to WKB with a single vectorized
+shapely.to_wkb call and a bbox struct column is added as a 'covering' so
+readers can skip row groups outside of an area of interest.  Rows are
+sorted along a Hilbert curve before writing, which keeps each row group
+spatially compact.
+
+Layers can be written one file per layer, or to a hive partitioned
+dataset (e.g. Sector=Hospitals/...) for analytics tools.  Layers too
+large to hold in memory are appended chunk by chunk with a
+GeoParquetWriter.
+
+Requires pyarrow (see setup.cfg extras).
+"""
+import json
+import urllib.parse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from .table_out import import_pyarrow
+
+
+GEOPARQUET_VERSION = '1.1.0'
+
+# shapely type ids to GeoParquet geometry type names
+GEOMETRY_TYPE_NAMES = {
+    0: 'Point',
+    1: 'LineString',
+    2: 'LineString',
+    3: 'Polygon',
+    4: 'MultiPoint',
+    5: 'MultiLineString',
+    6: 'MultiPolygon',
+    7: 'GeometryCollection',
+    }
+
+
+def make_geo_metadata(gdf, bbox_column='bbox'):
+    """
+    Return GeoParquet 'geo' metadata dictionary of gdf geometry
+    """
+    geometry_name = gdf.geometry.name
+    geoms = np.asarray(gdf.geometry.array)
+    present = ~shapely.is_missing(geoms)
+
+    column_meta = {
+        'encoding': 'WKB',
+        'geometry_types': sorted({
+            GEOMETRY_TYPE_NAMES[x]
+            for x in shapely.get_type_id(geoms[present]).tolist()}),
+        }
+
+    if gdf.crs is not None:
+        column_meta['crs'] = gdf.crs.to_json_dict()
+
+    if present.any():
+        column_meta['bbox'] = [
+            float(x) for x in shapely.total_bounds(geoms[present])]
+
+    if bbox_column is not None:
+        column_meta['covering'] = {'bbox': {
+            'xmin': [bbox_column, 'xmin'],
+            'ymin': [bbox_column, 'ymin'],
+            'xmax': [bbox_column, 'xmax'],
+            'ymax': [bbox_column, 'ymax'],
+            }}
+
+    return {
+        'version': GEOPARQUET_VERSION,
+        'primary_column': geometry_name,
+        'columns': {geometry_name: column_meta},
+        }
+
+
+def null_fields_to_string(schema):
+    """
+    Return pyarrow schema with null typed fields (columns of only missing
+    values) typed as strings, so they can hold values of other chunks or
+    partitions.
+    """
+    pa = import_pyarrow()
+    return pa.schema(
+        [field.with_type(pa.string())
+         if pa.types.is_null(field.type) else field
+         for field in schema],
+        metadata=schema.metadata)
+
+
+def make_arrow_schema(gdf, bbox_column='bbox'):
+    """
+    Return pyarrow schema (with GeoParquet metadata) of gdf as written by
+    gdf_to_arrow.  Columns of only missing values are typed as strings.
+    """
+    pa = import_pyarrow()
+
+    geometry_name = gdf.geometry.name
+    schema = null_fields_to_string(pa.Schema.from_pandas(
+        pd.DataFrame(gdf.drop(columns=geometry_name)),
+        preserve_index=False))
+
+    schema = schema.append(pa.field(geometry_name, pa.binary()))
+    if bbox_column is not None:
+        schema = schema.append(pa.field(bbox_column, pa.struct([
+            (name, pa.float64())
+            for name in ['xmin', 'ymin', 'xmax', 'ymax']])))
+
+    metadata = dict(schema.metadata or {})
+    metadata[b'geo'] = json.dumps(
+        make_geo_metadata(gdf, bbox_column)).encode('utf-8')
+
+    return schema.with_metadata(metadata)
+
+
+def gdf_to_arrow(gdf, bbox_column='bbox', schema=None):
+    """
+    Return pyarrow table of gdf with WKB geometry, a bbox struct column
+    (unless bbox_column is None) and GeoParquet metadata.
+
+    If schema is given (see make_arrow_schema), the table is cast to it.
+    """
+    pa = import_pyarrow()
+
+    geometry_name = gdf.geometry.name
+    geoms = np.asarray(gdf.geometry.array)
+
+    table = pa.Table.from_pandas(
+        pd.DataFrame(gdf.drop(columns=geometry_name)),
+        preserve_index=False)
+
+    table = table.append_column(
+        geometry_name,
+        pa.array(shapely.to_wkb(geoms), type=pa.binary()))
+
+    if bbox_column is not None:
+        bounds = shapely.bounds(geoms)
+        table = table.append_column(
+            bbox_column,
+            pa.StructArray.from_arrays(
+                [pa.array(bounds[:, ndx]) for ndx in range(4)],
+                names=['xmin', 'ymin', 'xmax', 'ymax']))
+
+    if schema is not None:
+        return table.select(schema.names).cast(schema)
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'geo'] = json.dumps(
+        make_geo_metadata(gdf, bbox_column)).encode('utf-8')
+
+    return table.replace_schema_metadata(metadata)
+
+
+def sort_spatially(gdf):
+    """
+    Return gdf sorted along a Hilbert curve of its bounds
+    """
+    geoms = gdf.geometry
+    if len(gdf) < 2 or geoms.is_empty.all() or geoms.isna().all():
+        return gdf
+
+    distance = geoms.hilbert_distance(total_bounds=geoms.total_bounds)
+    return gdf.iloc[np.argsort(distance.to_numpy(), kind='stable')]
+
+
+def write_geoparquet(
+        gdf,
+        out_fp,
+        row_group_size=50000,
+        compression='zstd',
+        bbox_column='bbox',
+        sort=True,
+        schema=None,
+        ):
+    """
+    Write gdf to a GeoParquet file.
+
+    Rows are Hilbert sorted (if sort) and written in row groups of
+    row_group_size rows, each with column statistics of the bbox column
+    that readers use to skip row groups.  If schema is given (see
+    make_arrow_schema), the file is written with it.
+
+    Returns path of written file.
+    """
+    pq = import_pyarrow().parquet
+
+    if sort:
+        gdf = sort_spatially(gdf)
+
+    out_fp = Path(out_fp)
+    out_fp.parent.mkdir(parents=True, exist_ok=True)
+
+    pq.write_table(
+        gdf_to_arrow(gdf, bbox_column, schema),
+        out_fp,
+        row_group_size=row_group_size,
+        compression=compression)
+
+    return out_fp
+
+
+class GeoParquetWriter:
+    """
+    Append geodataframe chunks to a GeoParquet file.
+
+    The schema (and GeoParquet metadata) of the file is taken from the
+    first written chunk, later chunks are cast to it.  Columns that are
+    all null in the first chunk are written as strings.  As the file
+    metadata is written before all chunks are seen, the layer bbox is
+    omitted and geometry types are left empty (unknown).  Each chunk is
+    Hilbert sorted (if sort) and written as row groups of at most
+    row_group_size rows.
+    """
+
+    def __init__(
+            self,
+            out_fp,
+            row_group_size=50000,
+            compression='zstd',
+            bbox_column='bbox',
+            sort=True,
+            ):
+        self._pa = import_pyarrow()
+        self.out_fp = Path(out_fp)
+        self.out_fp.parent.mkdir(parents=True, exist_ok=True)
+
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.bbox_column = bbox_column
+        self.sort = sort
+
+        self._schema = None
+        self._writer = None
+        self.n_written = 0
+
+    def _open(self, table, gdf):
+        geo = make_geo_metadata(gdf, self.bbox_column)
+        column_meta = geo['columns'][geo['primary_column']]
+        column_meta['geometry_types'] = []
+        column_meta.pop('bbox', None)
+
+        # null typed columns can not hold values of later chunks
+        schema = null_fields_to_string(table.schema)
+
+        metadata = dict(schema.metadata or {})
+        metadata[b'geo'] = json.dumps(geo).encode('utf-8')
+        self._schema = schema.with_metadata(metadata)
+
+        self._writer = self._pa.parquet.ParquetWriter(
+            self.out_fp, self._schema, compression=self.compression)
+
+    def write(self, gdf):
+        """
+        Append geodataframe chunk
+        """
+        if gdf.empty:
+            return
+
+        if self.sort:
+            gdf = sort_spatially(gdf)
+
+        table = gdf_to_arrow(gdf, self.bbox_column)
+        if self._writer is None:
+            self._open(table, gdf)
+
+        table = table.select(self._schema.names).cast(self._schema)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.n_written += len(gdf)
+
+    def close(self):
+        """
+        Finish file
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_geoparquet_dataset(
+        gdf,
+        out_dir,
+        partition_cols,
+        file_name='part-0',
+        bbox_column='bbox',
+        **write_kwargs,
+        ):
+    """
+    Write gdf to a hive partitioned GeoParquet dataset in out_dir, one
+    file_name.parquet per combination of partition_cols values
+    (e.g. out_dir/Sector=Hospitals/file_name.parquet).  Values are
+    percent encoded in directory names, and missing values are written
+    to a __HIVE_DEFAULT_PARTITION__ partition.
+
+    As in the hive layout, partition columns are only stored in the
+    directory names.  Every file is written with the schema of all of gdf
+    (see make_arrow_schema), so the dataset reads back as one table,
+    e.g. with geopandas.read_parquet(out_dir).
+
+    write_kwargs are passed to write_geoparquet.
+
+    Returns list of written files.
+    """
+    out_dir = Path(out_dir)
+    if isinstance(partition_cols, str):
+        partition_cols = [partition_cols]
+
+    keys = gdf[partition_cols].astype(object).where(
+        gdf[partition_cols].notna(), '__HIVE_DEFAULT_PARTITION__')
+
+    data_gdf = gdf.drop(columns=partition_cols)
+    schema = make_arrow_schema(data_gdf, bbox_column)
+
+    written = []
+    for values, positions in keys.groupby(
+            partition_cols, sort=True).indices.items():
+        if not isinstance(values, tuple):
+            values = (values,)
+        partition_dir = out_dir.joinpath(*[
+            f'{col}={urllib.parse.quote(str(value), safe="")}'
+            for col, value in zip(partition_cols, values)])
+
+        written.append(write_geoparquet(
+            data_gdf.iloc[positions],
+            partition_dir / f'{file_name}.parquet',
+            bbox_column=bbox_column,
+            schema=schema,
+            **write_kwargs))
+
+    return written
@@ -0,0 +1,329 @@
+"""
+Central reading and writing of geodataframes.
+
+All package reads and writes go through read_gdf and write_gdf.  With
+pyogrio installed, features are transferred between GDAL and geopandas in
+Arrow batches (when pyarrow is available) instead of feature by feature
+through fiona.  Reads can push column selection, bbox and attribute
+filters down to GDAL so unneeded features and fields are never
+materialized.
+
+Driver layer creation options and SQLite pragmas (used by GPKG) are
+tuned here, in one place.  See benchmarks/bench_gis_io.py for timings
+against plain geopandas read_file / to_file.
+
+pyogrio is optional (see setup.cfg extras), fiona is used without it.
+"""
+import contextlib
+import threading
+from pathlib import Path
+
+import geopandas as gpd
+import shapely
+
+
+# drivers of output file suffixes
+DRIVERS = {
+    '.gpkg': 'GPKG',
+    '.shp': 'ESRI Shapefile',
+    '.fgb': 'FlatGeobuf',
+    '.geojson': 'GeoJSON',
+    '.json': 'GeoJSON',
+    '.parquet': 'Parquet',
+    }
+
+# default layer creation options of each driver
+LAYER_OPTIONS = {
+    'GPKG': {'SPATIAL_INDEX': 'YES'},
+    'FlatGeobuf': {'SPATIAL_INDEX': 'YES'},
+    }
+
+# SQLite pragmas used when writing GPKG. Output files are written once,
+# so syncs to disk after every transaction are not needed.
+SQLITE_PRAGMAS = {
+    'synchronous': 'OFF',
+    'cache_size': '-65536',
+    }
+
+
+def has_pyogrio():
+    """
+    Return True if pyogrio can be imported
+    """
+    try:
+        import pyogrio  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def has_pyarrow():
+    """
+    Return True if pyarrow can be imported
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# GDAL config options are process global, see gdal_config
+_CONFIG_LOCK = threading.Lock()
+
+# checked once on import, as layers are read in threads and concurrent
+# imports of a broken install can return a partially imported module
+HAS_PYOGRIO = has_pyogrio()
+HAS_PYARROW = has_pyarrow()
+
+
+def get_engine(engine=None):
+    """
+    Return engine, or pyogrio if installed else fiona
+    """
+    if engine is not None:
+        return engine
+    return 'pyogrio' if HAS_PYOGRIO else 'fiona'
+
+
+def get_driver(path, driver=None):
+    """
+    Return driver, or the driver of the suffix of path (None if unknown)
+    """
+    if driver is not None:
+        return driver
+    return DRIVERS.get(Path(path).suffix.lower())
+
+
+@contextlib.contextmanager
+def gdal_config(engine, options):
+    """
+    Context manager setting GDAL config options of engine.
+
+    With pyogrio the options are set for the whole process, so blocks
+    with options are serialized by a module lock (layers are read and
+    written from threads).  Reads without options in other threads still
+    see the options while a block runs.
+    """
+    if not options:
+        yield
+        return
+
+    with _CONFIG_LOCK:
+        if engine == 'pyogrio':
+            import pyogrio
+
+            old_options = {
+                key: pyogrio.get_gdal_config_option(key) for key in options}
+            pyogrio.set_gdal_config_options(options)
+            try:
+                yield
+            finally:
+                pyogrio.set_gdal_config_options(old_options)
+        else:
+            import fiona
+
+            with fiona.Env(**options):
+                yield
+
+
+def get_layer_crs(path, layer=None, engine=None):
+    """
+    Return crs of layer of the file at path
+    """
+    if get_engine(engine) == 'pyogrio':
+        import pyogrio
+
+        return pyogrio.read_info(path, layer=layer)['crs']
+
+    import fiona
+
+    with fiona.open(path, layer=layer) as src:
+        return src.crs
+
+
+def transform_bbox(bbox, crs, to_crs):
+    """
+    Return bounds of (minx, miny, maxx, maxy) bbox in crs transformed to
+    to_crs.  bbox edges are densified so the bounds cover all of bbox.
+    """
+    bbox_geom = shapely.segmentize(
+        shapely.box(*bbox),
+        max(bbox[2] - bbox[0], bbox[3] - bbox[1]) / 32)
+    return tuple(
+        gpd.GeoSeries([bbox_geom], crs=crs).to_crs(to_crs).total_bounds)
+
+
+def read_gdf(
+        path,
+        layer=None,
+        columns=None,
+        bbox=None,
+        bbox_crs=None,
+        where=None,
+        engine=None,
+        use_arrow=None,
+        ):
+    """
+    Read a geodataframe from a GDAL readable file.
+
+    Parameters
+    ----------
+    path : path or str
+        file (or url) to read.
+    layer : str or int, optional
+        layer to read, defaults to the first layer.
+    columns : list of str, optional
+        attribute columns to read, defaults to all.
+    bbox : tuple, optional
+        (minx, miny, maxx, maxy), only features intersecting bbox are read.
+    bbox_crs : optional
+        crs of bbox, if not the crs of the layer.
+    where : str, optional
+        SQL WHERE clause features are filtered by, e.g. "STATE = 'NM'".
+    engine : str, optional
+        'pyogrio' or 'fiona', defaults to pyogrio if installed.
+    use_arrow : bool, optional
+        Read through Arrow (pyogrio only), defaults to True if pyarrow is
+        available.
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+    """
+    engine = get_engine(engine)
+
+    select_columns = None
+    if columns is not None and where is not None:
+        # some drivers drop features the where clause tests fields of that
+        # are not read, so columns are selected after reading
+        select_columns, columns = list(columns), None
+
+    if bbox is not None and bbox_crs is not None:
+        bbox = transform_bbox(
+            bbox, bbox_crs, get_layer_crs(path, layer=layer, engine=engine))
+
+    if engine == 'pyogrio':
+        import pyogrio
+
+        if use_arrow is None:
+            use_arrow = HAS_PYARROW
+
+        gdf = pyogrio.read_dataframe(
+            path,
+            layer=layer,
+            columns=columns,
+            bbox=bbox,
+            where=where,
+            use_arrow=use_arrow)
+    else:
+        read_kwargs = {}
+        if columns is not None:
+            read_kwargs['include_fields'] = columns
+        if where is not None:
+            read_kwargs['where'] = where
+
+        gdf = gpd.read_file(
+            path,
+            layer=layer,
+            bbox=bbox,
+            engine='fiona',
+            **read_kwargs)
+
+    if select_columns is not None:
+        gdf = gdf[select_columns + [gdf.geometry.name]]
+
+    return gdf
+
+
+def write_gdf(
+        gdf,
+        path,
+        driver=None,
+        layer=None,
+        append=False,
+        layer_options=None,
+        dataset_options=None,
+        sqlite_pragmas=None,
+        geometry_type=None,
+        engine=None,
+        use_arrow=None,
+        ):
+    """
+    Write a geodataframe to a file.
+
+    Parameters
+    ----------
+    gdf : geopandas.GeoDataFrame
+        data to write.
+    path : path or str
+        file to write.
+    driver : str, optional
+        GDAL driver, defaults to the driver of the suffix of path.
+    layer : str, optional
+        layer to write, defaults to the file name.
+    append : bool
+        If true, append features to an existing layer. Defaults to False
+    layer_options : dict, optional
+        layer creation options, updating LAYER_OPTIONS of the driver.
+    dataset_options : dict, optional
+        dataset creation options.
+    sqlite_pragmas : dict, optional
+        pragmas used writing GPKG, defaults to SQLITE_PRAGMAS.
+    geometry_type : str, optional
+        geometry type of a created layer (pyogrio only), e.g. 'Unknown'
+        for layers later appended with other types.  Defaults to the
+        geometry types of gdf.
+    engine : str, optional
+        'pyogrio' or 'fiona', defaults to pyogrio if installed.
+    use_arrow : bool, optional
+        Write through Arrow (pyogrio only), defaults to True if pyarrow is
+        available.
+
+    Returns
+    -------
+    pathlib.Path
+        location of written file.
+    """
+    engine = get_engine(engine)
+    driver = get_driver(path, driver)
+
+    layer_options = {
+        **LAYER_OPTIONS.get(driver, {}), **(layer_options or {})}
+
+    config = {}
+    if driver == 'GPKG':
+        if sqlite_pragmas is None:
+            sqlite_pragmas = SQLITE_PRAGMAS
+        if sqlite_pragmas:
+            config['OGR_SQLITE_PRAGMA'] = ','.join(
+                f'{key}={value}' for key, value in sqlite_pragmas.items())
+
+    with gdal_config(engine, config):
+        if engine == 'pyogrio':
+            import pyogrio
+
+            if use_arrow is None:
+                use_arrow = HAS_PYARROW
+
+            pyogrio.write_dataframe(
+                gdf,
+                path,
+                layer=layer,
+                driver=driver,
+                append=append,
+                geometry_type=geometry_type,
+                use_arrow=use_arrow,
+                dataset_options=dataset_options,
+                layer_options=layer_options)
+        else:
+            gdf.to_file(
+                path,
+                driver=driver,
+                layer=layer,
+                mode='a' if append else 'w',
+                engine='fiona',
+                **(dataset_options or {}),
+                **layer_options)
+
+    return Path(path)
@@ -0,0 +1,61 @@
+"""
+Multi-layer GeoPackage output.
+
+Writing a separate .gpkg per layer pays SQLite file creation, metadata
+table setup and spatial index creation for every layer.  write_gpkg_layer
+instead adds each layer to a single GeoPackage.  With pyogrio installed
+every layer is inserted in one transaction, through Arrow when pyarrow is
+available, and GDAL defers the R-tree build until the layer's bulk insert
+is committed rather than updating it feature by feature.  Without pyogrio
+layers are written through fiona (see gis_io).
+"""
+from pathlib import Path
+
+from .gis_io import write_gdf
+
+
+def write_gpkg_layer(
+        gdf,
+        gpkg_fp,
+        layer,
+        use_arrow=None,
+        spatial_index=True,
+        ):
+    """
+    Write gdf as layer of the GeoPackage gpkg_fp, creating the file if it
+    does not exist.  An existing layer of the same name is replaced.
+
+    Parameters
+    ----------
+    gdf : geopandas.GeoDataFrame
+        data to write.
+    gpkg_fp : path or str
+        GeoPackage to write to.
+    layer : str
+        name of layer.
+    use_arrow : bool, optional
+        Write through Arrow, defaults to True if pyarrow is available.
+        Requires pyogrio.
+    spatial_index : bool
+        If true, build an R-tree of the layer. Defaults to True
+
+    Returns
+    -------
+    pathlib.Path
+        location of GeoPackage.
+    """
+    gpkg_fp = Path(gpkg_fp)
+    gpkg_fp.parent.mkdir(parents=True, exist_ok=True)
+
+    write_gdf(
+        gdf,
+        gpkg_fp,
+        driver='GPKG',
+        layer=layer,
+        use_arrow=use_arrow,
+        layer_options={
+            'SPATIAL_INDEX': 'YES' if spatial_index else 'NO',
+            'OVERWRITE': 'YES',
+            })
+
+    return gpkg_fp
@@ -0,0 +1,171 @@
+"""
+Functions to move census statistics onto arbitrary target polygons.
+
+Census statistics are only reported for whole census units (tracts,
+block groups, ...), while users often want values for custom areas such
+as utility service territories.  Values are re-distributed by the share
+of each census unit that overlaps each target polygon (areal
+interpolation), optionally restricted to an ancillary 'weight' layer
+such as residential land use (dasymetric interpolation).
+
+All overlay work is done on shapely geometry arrays found via a single
+bulk STRtree query - there is no per-row python loop.
+"""
+import numpy as np
+import shapely
+
+from .geocricket import ensure_gdf
+
+
+# census_stats output fields and how they are interpolated
+DEFAULT_EXTENSIVE_FIELDS = ['total_population_B01001_001E']
+DEFAULT_INTENSIVE_FIELDS = ['median_household_income_B19013_001E']
+
+
+def ensure_valid_geometry(geoms):
+    """
+    Return array of geometries with any invalid geometry made valid
+    """
+    geoms = np.asarray(geoms)
+    invalid = ~shapely.is_valid(geoms)
+    if invalid.any():
+        geoms = geoms.copy()
+        geoms[invalid] = shapely.make_valid(geoms[invalid])
+    return geoms
+
+
+def overlay_pairs(source_geoms, target_geoms):
+    """
+    Find all overlapping source and target geometries.
+
+    Returns arrays of target indices, source indices, and the
+    intersecting geometry pieces of each pair.
+    """
+    tree = shapely.STRtree(source_geoms)
+    target_ndx, source_ndx = tree.query(target_geoms, predicate='intersects')
+
+    pieces = shapely.intersection(
+        source_geoms[source_ndx],
+        target_geoms[target_ndx])
+
+    return target_ndx, source_ndx, pieces
+
+
+def interpolate_census_stats(
+        census_stats,
+        target_geo,
+        extensive_fields=None,
+        intensive_fields=None,
+        weight_geo=None,
+        area_crs=None,
+        ):
+    """
+    Interpolate census statistics onto target polygons by area.
+
+    Parameters
+    ----------
+    census_stats : path or geodataframe
+        Census geometry with statistics, e.g. output of get_census_stats.
+    target_geo : path or geodataframe
+        Polygons that statistics should be estimated for.
+    extensive_fields : list, optional
+        Count-like fields (population) that are split between targets by
+        overlapping share of each census unit. Defaults to total
+        population if available.
+    intensive_fields : list, optional
+        Rate-like fields (median income) that are averaged over each
+        target weighted by overlapping area. Defaults to median household
+        income if available.
+    weight_geo : path or geodataframe, optional
+        Ancillary polygons (e.g. residential land use) that population is
+        assumed to live in.  If given, only overlapping area inside these
+        polygons is used as a weight (dasymetric interpolation).  Census
+        units without any weight area fall back to their full area.
+    area_crs : int or str, optional
+        Projected crs used for area math. Defaults to crs of census_stats
+        if projected, else its estimated utm crs.
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+        Copy of target_geo in its original crs with interpolated fields.
+    """
+    source_df = ensure_gdf(census_stats)
+    target_df = ensure_gdf(target_geo)
+
+    if extensive_fields is None:
+        extensive_fields = [
+            x for x in DEFAULT_EXTENSIVE_FIELDS if x in source_df.columns]
+    if intensive_fields is None:
+        intensive_fields = [
+            x for x in DEFAULT_INTENSIVE_FIELDS if x in source_df.columns]
+
+    if area_crs is None:
+        if source_df.crs.is_projected:
+            area_crs = source_df.crs
+        else:
+            area_crs = source_df.estimate_utm_crs()
+
+    source_geoms = ensure_valid_geometry(
+        source_df.geometry.to_crs(area_crs).array)
+    target_geoms = ensure_valid_geometry(
+        target_df.geometry.to_crs(area_crs).array)
+
+    target_ndx, source_ndx, pieces = overlay_pairs(
+        source_geoms, target_geoms)
+
+    piece_area = shapely.area(pieces)
+    source_area = shapely.area(source_geoms)
+
+    if weight_geo is not None:
+        # restrict weights to area inside of ancillary polygons
+        weight_df = ensure_gdf(weight_geo)
+        weight_mask = shapely.union_all(
+            ensure_valid_geometry(
+                weight_df.geometry.to_crs(area_crs).array))
+        shapely.prepare(weight_mask)
+
+        masked_piece_area = shapely.area(
+            shapely.intersection(pieces, weight_mask))
+        masked_source_area = np.bincount(
+            source_ndx,
+            weights=masked_piece_area,
+            minlength=len(source_geoms))
+
+        # only use masked weights for census units that contain mask area
+        use_mask = masked_source_area[source_ndx] > 0
+        piece_area = np.where(use_mask, masked_piece_area, piece_area)
+        source_area = np.where(
+            masked_source_area > 0, masked_source_area, source_area)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        source_share = piece_area / source_area[source_ndx]
+    source_share = np.nan_to_num(source_share)
+
+    n_targets = len(target_geoms)
+    result_df = target_df
+
+    for field in extensive_fields:
+        values = source_df[field].to_numpy(dtype=float)[source_ndx]
+        result_df[field] = np.bincount(
+            target_ndx,
+            weights=np.nan_to_num(values) * source_share,
+            minlength=n_targets)
+
+    for field in intensive_fields:
+        values = source_df[field].to_numpy(dtype=float)[source_ndx]
+        # ignore missing values in both numerator and denominator
+        has_value = ~np.isnan(values)
+        value_area = np.where(has_value, piece_area, 0.0)
+        weighted_sum = np.bincount(
+            target_ndx,
+            weights=np.where(has_value, values, 0.0) * value_area,
+            minlength=n_targets)
+        area_sum = np.bincount(
+            target_ndx, weights=value_area, minlength=n_targets)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result_df[field] = np.where(
+                area_sum > 0, weighted_sum / area_sum, np.nan)
+
+    return result_df
+
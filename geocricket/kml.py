@@ -2,7 +2,6 @@
 Functions to handle the creation of kml
 
 TODO: optional highlight color?
-TODO: multi part geometry...
 
 LINTING
 import pdb
@@ -14,6 +13,100 @@ import numpy as np
 import shapely
 import simplekml
 
+from .gis_io import read_gdf
+from .kml_overlay import write_kml_super_overlay
+from .kml_stream import DEFAULT_ICON
+from .kml_stream import as_color_list
+from .kml_stream import make_descriptions
+from .kml_stream import stream_kml
+
+
+def round_coordinates(geo_df, precision=6):
+    """
+    Return copy of geo_df with every coordinate rounded to precision
+    decimals (6 decimal degrees is about 0.1 m) and repeated points
+    removed.  Geometries that rounding collapses (e.g. polygons smaller
+    than the precision) or makes invalid are kept unrounded.
+    """
+    original = np.asarray(geo_df.geometry.array)
+    geoms = shapely.transform(
+        original, lambda coords: np.round(coords, precision))
+    geoms = shapely.remove_repeated_points(geoms)
+
+    collapsed = (
+        (shapely.is_empty(geoms) & ~shapely.is_empty(original))
+        | (~shapely.is_valid(geoms) & shapely.is_valid(original)))
+    geoms[collapsed] = original[collapsed]
+
+    geo_df = geo_df.copy()
+    geo_df[geo_df.geometry.name] = gpd.GeoSeries(
+        geoms, index=geo_df.index, crs=geo_df.crs)
+    return geo_df
+
+
+def simplify_geometry(geo_df, tolerance):
+    """
+    Return copy of geo_df with lines and polygons simplified by
+    tolerance meters (in the estimated utm crs of geo_df).
+    """
+    utm_crs = geo_df.estimate_utm_crs()
+    geoms = shapely.simplify(
+        np.asarray(geo_df.geometry.to_crs(utm_crs).array),
+        tolerance,
+        preserve_topology=True)
+
+    geo_df = geo_df.copy()
+    geo_df[geo_df.geometry.name] = gpd.GeoSeries(
+        geoms, index=geo_df.index, crs=utm_crs).to_crs(geo_df.crs)
+    return geo_df
+
+
+def detect_geo_type(geo_df):
+    """
+    Return 1 for point, 2 for line and 3 for polygon layers (single or
+    multi part) from the first geometry of geo_df, or None.
+    """
+    geom_types = geo_df.geometry.geom_type.dropna()
+    data_type = geom_types.iloc[0] if len(geom_types) > 0 else None
+    if data_type in ('Polygon', 'MultiPolygon'):
+        return 3
+    if data_type in ('LineString', 'MultiLineString'):
+        return 2
+    if data_type in ('Point', 'MultiPoint'):
+        return 1
+
+    print(f"Input type of '{data_type}' - not currently accounted for.")
+    return None
+
+
+def add_kml_geometry(folder, geom, name):
+    """
+    Add shapely geom to simplekml folder as a point, linestring or polygon
+    (with holes), or as a MultiGeometry of those if geom is multi part.
+    Returns the added simplekml geometry.
+    """
+    if shapely.get_type_id(geom) < 4:
+        parts = [geom]
+        container = folder
+    else:
+        parts = shapely.get_parts(geom)
+        container = folder.newmultigeometry(name=name)
+
+    for part in parts:
+        if part.geom_type == 'Point':
+            kml_geom = container.newpoint(name=name, coords=part.coords)
+        elif part.geom_type in ('LineString', 'LinearRing'):
+            kml_geom = container.newlinestring(name=name, coords=part.coords)
+        else:
+            kml_geom = container.newpolygon(
+                name=name,
+                outerboundaryis=part.exterior.coords,
+                innerboundaryis=[x.coords for x in part.interiors])
+
+    if container is folder:
+        return kml_geom
+    return container
+
 
 def make_kml_pts(
             geo_df,
@@ -39,17 +132,15 @@ def make_kml_pts(
         except KeyError:
             print(f'Groupby Field {groupby_field} not found')
 
-    # NOTE: uses google maps icons, assert internet connection
-    default_icon = r"http://maps.google.com/mapfiles/kml/paddle/wht-blank.png"
-
     norm_styles = {}
+    element_color = as_color_list(element_color, len(folder_list))
     for style_color, folder_name in zip(element_color, folder_list):
         # kml style for points
         norm_style = simplekml.Style()
         norm_style.labelstyle.scale = 0
         norm_style.iconstyle.color = style_color
         norm_style.iconstyle.scale = 1
-        norm_style.iconstyle.icon.href = default_icon
+        norm_style.iconstyle.icon.href = DEFAULT_ICON
 
         norm_styles[folder_name] = norm_style
 
@@ -57,7 +148,13 @@ def make_kml_pts(
     selected_style.labelstyle.scale = 0
     selected_style.iconstyle.color = simplekml.Color.orange
     selected_style.iconstyle.scale = 2
-    selected_style.iconstyle.icon.href = default_icon
+    selected_style.iconstyle.icon.href = DEFAULT_ICON
+
+    # one shared style map per folder, referenced by every placemark
+    norm_stylemaps = {
+        folder_name: simplekml.StyleMap(
+            normalstyle=norm_style, highlightstyle=selected_style)
+        for folder_name, norm_style in norm_styles.items()}
 
     # Being Making KML
     kml = simplekml.Kml(open=1)
@@ -72,8 +169,11 @@ def make_kml_pts(
     folders = {folder_name: doc.newfolder(name=folder_name)
                for folder_name in folder_list}
 
+    # html description tables, built column-wise
+    descriptions = make_descriptions(geo_df)
+
     # write each feature, row by row... (that's how kml do)
-    for index, row in geo_df.iterrows():
+    for ndx, (index, row) in enumerate(geo_df.iterrows()):
 
         if id_field is None:
             kml_id = index
@@ -85,25 +185,12 @@ def make_kml_pts(
         else:
             folder = output_name
 
-        kml_point = folders[folder].newpoint(
-            name=f'{kml_id}', coords=row['geometry'].coords)
-
-        kml_point.stylemap.normalstyle = norm_styles[folder]
-        kml_point.stylemap.highlightstyle = selected_style
+        kml_point = add_kml_geometry(
+            folders[folder], row['geometry'], f'{kml_id}')
 
-        description_table = """<table>"""
+        kml_point.stylemap = norm_stylemaps[folder]
 
-        for attr, value in zip(row.index, row.values):
-            if attr == 'geometry':
-                continue
-            # build string...
-            description_table += f"""
-            <tr style='background-color:#9DBBE0'> <th>{attr}</th> </tr>
-            <tr style='background-color:#ffffff'> <td>{value}</td>
-            """
-        description_table += """</table>"""
-
-        kml_point.description = description_table
+        kml_point.description = descriptions[ndx]
 
     if export_as_kmz:
         res_file = os.path.join(output_path, f"{output_name}.kmz")
@@ -140,6 +227,7 @@ def make_kml_lines(
             print(f'Groupby Field {groupby_field} not found')
 
     norm_styles = {}
+    element_color = as_color_list(element_color, len(folder_list))
     for style_color, folder_name in zip(element_color, folder_list):
         # kml style for lines
         norm_style = simplekml.Style()
@@ -151,6 +239,13 @@ def make_kml_lines(
     sel_style = simplekml.Style()
     sel_style.linestyle.color = simplekml.Color.orange
     sel_style.linestyle.width = 4
+
+    # one shared style map per folder, referenced by every placemark
+    norm_stylemaps = {
+        folder_name: simplekml.StyleMap(
+            normalstyle=norm_style, highlightstyle=sel_style)
+        for folder_name, norm_style in norm_styles.items()}
+
     # Being Making KML
     kml = simplekml.Kml(open=1)
 
@@ -164,8 +259,11 @@ def make_kml_lines(
     folders = {folder_name: doc.newfolder(name=folder_name)
                for folder_name in folder_list}
 
+    # html description tables, built column-wise
+    descriptions = make_descriptions(geo_df)
+
     # write each feature, row by row... (that's how kml do)
-    for index, row in geo_df.iterrows():
+    for ndx, (index, row) in enumerate(geo_df.iterrows()):
 
         if id_field is None:
             kml_id = index
@@ -177,24 +275,11 @@ def make_kml_lines(
         else:
             folder = output_name
 
-        kml_line = folders[folder].newlinestring(
-            name=f'{kml_id}', coords=row['geometry'].coords)
-        kml_line.stylemap.normalstyle = norm_styles[folder]
-        kml_line.stylemap.highlightstyle = sel_style
-
-        description_table = """<table>"""
+        kml_line = add_kml_geometry(
+            folders[folder], row['geometry'], f'{kml_id}')
+        kml_line.stylemap = norm_stylemaps[folder]
 
-        for attr, value in zip(row.index, row.values):
-            if attr == 'geometry':
-                continue
-            # build string...
-            description_table += f"""
-            <tr style='background-color:#9DBBE0'> <th>{attr}</th> </tr>
-            <tr style='background-color:#ffffff'> <td>{value}</td>
-            """
-        description_table += """</table>"""
-
-        kml_line.description = description_table
+        kml_line.description = descriptions[ndx]
 
     if export_as_kmz:
         res_file = os.path.join(output_path, f"{output_name}.kmz")
@@ -234,6 +319,7 @@ def make_kml_polygons(
             print(f'Groupby Field {groupby_field} not found')
 
     norm_styles = {}
+    element_color = as_color_list(element_color, len(folder_list))
     for style_color, folder_name in zip(element_color, folder_list):
         # kml style for polygons
         norm_style = simplekml.Style()
@@ -250,6 +336,12 @@ def make_kml_polygons(
     sel_style.polystyle.color = simplekml.Color.changealphaint(
         alpha_selected, simplekml.Color.orange)
 
+    # one shared style map per folder, referenced by every placemark
+    norm_stylemaps = {
+        folder_name: simplekml.StyleMap(
+            normalstyle=norm_style, highlightstyle=sel_style)
+        for folder_name, norm_style in norm_styles.items()}
+
     # Being Making KML
     kml = simplekml.Kml(open=1)
 
@@ -263,8 +355,11 @@ def make_kml_polygons(
     folders = {folder_name: doc.newfolder(name=folder_name)
                for folder_name in folder_list}
 
+    # html description tables, built column-wise
+    descriptions = make_descriptions(geo_df)
+
     # write each feature, row by row... (that's how kml do)
-    for index, row in geo_df.iterrows():
+    for ndx, (index, row) in enumerate(geo_df.iterrows()):
 
         if id_field is None:
             kml_id = index
@@ -276,24 +371,11 @@ def make_kml_polygons(
         else:
             folder = output_name
 
-        kml_poly = folders[folder].newpolygon(name=f'{kml_id}')
-        kml_poly.outerboundaryis = row['geometry'].exterior.coords
-        kml_poly.stylemap.normalstyle = norm_styles[folder]
-        kml_poly.stylemap.highlightstyle = sel_style
-
-        description_table = """<table>"""
+        kml_poly = add_kml_geometry(
+            folders[folder], row['geometry'], f'{kml_id}')
+        kml_poly.stylemap = norm_stylemaps[folder]
 
-        for attr, value in zip(row.index, row.values):
-            if attr == 'geometry':
-                continue
-            # build string...
-            description_table += f"""
-            <tr style='background-color:#9DBBE0'> <th>{attr}</th> </tr>
-            <tr style='background-color:#ffffff'> <td>{value}</td>
-            """
-        description_table += """</table>"""
-
-        kml_poly.description = description_table
+        kml_poly.description = descriptions[ndx]
 
     if export_as_kmz:
         res_file = os.path.join(output_path, f"{output_name}.kmz")
@@ -317,10 +399,18 @@ def convert_to_kml(
         max_n_attributes=0,
         export_as_kmz=False,
         geometry_field='geometry',
+        kml_backend='stream',
+        super_overlay=False,
+        max_features_per_tile=1000,
+        max_workers=None,
+        precision=6,
+        simplify_tolerance=None,
+        compression_level=None,
                    ):
     """
     Convert geopandas readable input_file vector to kml or kmz.
-    Assumes a single type of geometry per input_file.
+    Assumes a single type of geometry (single or multi part) per
+    input_file.
     Returns the path of converted file.
 
     If output_name is not specified, result will have same name
@@ -339,7 +429,21 @@ def convert_to_kml(
     KML style of hex is #AABBGGRR where AA is the alpha value
     use of simplekml constants like simplekml.Color.red may be useful.
 
-    TODO: handle multilinestring
+    kml_backend 'stream' writes the kml feature by feature with constant
+    memory (see kml_stream), 'simplekml' builds the kml with simplekml.
+
+    Multi part geometry is written as kml MultiGeometry, polygon holes
+    as inner boundaries.
+
+    super_overlay writes a regionated kmz super-overlay (see kml_overlay)
+    of tiles with at most max_features_per_tile features, generated by
+    max_workers processes, so clients only load visible tiles. Used for
+    large layers such as local roads or block groups.
+
+    Coordinates are rounded to precision decimal degrees (None for full
+    precision). simplify_tolerance (meters) optionally generalizes lines
+    and polygons. compression_level (0 - 9) sets kmz zlib compression of
+    the stream and super_overlay outputs.
 
     """
     # Check for geodataframe input
@@ -354,34 +458,26 @@ def convert_to_kml(
     else:
         # attempt to read dataframe
         try:
-            geo_df = gpd.read_file(input_file)
+            geo_df = read_gdf(input_file)
         except TypeError:
             # may require other error type.
             print(f"Error reading {input_file}")
             return
 
     # convert to google earth crs
+    # optional generalization in meters, before coordinates are rounded
+    if simplify_tolerance:
+        geo_df = simplify_geometry(geo_df, simplify_tolerance)
+
     geo_df = geo_df.to_crs(4326)
 
-    # handle multipolygon geometry
-    if 'MultiPolygon' in geo_df['geometry'].geom_type.values:
-        geo_df = geo_df.explode(index_parts=True).reset_index()
-
-    # handle multi line strings
-    if 'MultiLineString' in geo_df['geometry'].geom_type.values:
-        geo_df = geo_df.explode(index_parts=True).reset_index()
-
-    # determine type of data
-    data_type = type(geo_df.loc[0]['geometry'])
-    if data_type == shapely.geometry.polygon.Polygon:
-        detected_geo_type = 3
-    elif data_type == shapely.geometry.linestring.LineString:
-        detected_geo_type = 2
-    elif data_type == shapely.geometry.point.Point:
-        detected_geo_type = 1
-    else:
-        print(f"Input type of '{data_type}' - not currently accounted for.")
-        # TODO can these multi types be converted to single types in gpd?
+    if precision is not None:
+        geo_df = round_coordinates(geo_df, precision)
+
+    # determine type of data (multi part geometry is kept as is and
+    # written as kml MultiGeometry)
+    detected_geo_type = detect_geo_type(geo_df)
+    if detected_geo_type is None:
         return None
 
     colors_to_choose = 1
@@ -395,21 +491,19 @@ def convert_to_kml(
 
     # handle creation of arbitrary number of colors
     if element_color is not None:
-        element_colors = element_color
-        if not isinstance(element_colors, list):
-            element_colors = list(element_colors)
+        element_colors = as_color_list(element_color, colors_to_choose)
     else:
         element_colors = []
 
-    while len(element_colors) != colors_to_choose:
+    while len(element_colors) < colors_to_choose:
         # select random color for items.
         if element_color is None:
             # dummy value to enter while loop for color selection
             element_color = '__blank'
             while (
                     ('__' in element_color) or
-                    ('change' in element_color) or
-                    ('hex' in element_color)):
+                    callable(getattr(simplekml.Color, element_color))):
+                # skips converters like changealpha, hex and rgb
                 element_color = np.random.choice(dir(simplekml.Color))
 
             # eval(f"simplekml.Color.{element_color}")  # replaced below
@@ -419,8 +513,6 @@ def convert_to_kml(
                 # allow for 50 unique colors
                 element_colors = list(set(element_colors))
             element_color = None
-        else:
-            element_colors.append(element_color)
 
     element_color = element_colors
 
@@ -482,7 +574,34 @@ def convert_to_kml(
         output_path = os.getcwd()
 
     # make kml from geodataframe.
-    if detected_geo_type == 1:
+    if super_overlay:
+        result_path = write_kml_super_overlay(
+            geo_df,
+            detected_geo_type,
+            element_color=element_color,
+            highlight_color=highlight_color,
+            id_field=id_field,
+            groupby_field=groupby_field,
+            output_name=output_name,
+            output_path=output_path,
+            max_features=max_features_per_tile,
+            max_workers=max_workers,
+            compression_level=compression_level,
+            )
+    elif kml_backend == 'stream':
+        result_path = stream_kml(
+            geo_df,
+            detected_geo_type,
+            element_color=element_color,
+            highlight_color=highlight_color,
+            id_field=id_field,
+            groupby_field=groupby_field,
+            output_name=output_name,
+            output_path=output_path,
+            export_as_kmz=export_as_kmz,
+            compression_level=compression_level,
+            )
+    elif detected_geo_type == 1:
         result_path = make_kml_pts(
             geo_df,
             element_color=element_color,
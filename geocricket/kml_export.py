@@ -0,0 +1,291 @@
+"""
+KML export stage of a collect.
+
+collect() converted each collected layer to kml one after another.
+export_layers_to_kml instead converts all layers in a process pool, so
+export time scales with cores rather than layer count, and
+export_merged_kmz assembles every layer into a single kmz with a folder
+per sector holding a folder and shared styles per layer.  The point icon
+is embedded in the merged kmz so clients make no requests at render
+time.
+"""
+import collections
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+import geopandas as gpd
+import simplekml
+
+from .gis_io import read_gdf
+from .kml import convert_to_kml
+from .kml import detect_geo_type
+from .kml import round_coordinates
+from .kml_stream import ICON_ENTRY
+from .kml_stream import KML_FOOTER
+from .kml_stream import KML_HEADER
+from .kml_stream import make_icon_png
+from .kml_stream import make_placemarks
+from .kml_stream import make_shared_styles
+from .kml_stream import open_kml_stream
+
+
+# distinct colors given to layers without a color, so layers converted in
+# separate processes do not share the same 'random' color
+LAYER_COLORS = [
+    simplekml.Color.red,
+    simplekml.Color.blue,
+    simplekml.Color.yellow,
+    simplekml.Color.green,
+    simplekml.Color.purple,
+    simplekml.Color.cyan,
+    simplekml.Color.magenta,
+    simplekml.Color.brown,
+    simplekml.Color.lime,
+    simplekml.Color.navy,
+    simplekml.Color.pink,
+    simplekml.Color.teal,
+    simplekml.Color.gold,
+    simplekml.Color.maroon,
+    simplekml.Color.olive,
+    simplekml.Color.steelblue,
+    simplekml.Color.salmon,
+    simplekml.Color.darkviolet,
+    simplekml.Color.yellowgreen,
+    simplekml.Color.white,
+    ]
+
+
+def assign_layer_colors(layers):
+    """
+    Return copy of layers with a LAYER_COLORS element_color given to each
+    layer without one.
+    """
+    colored_layers = {}
+    for ndx, (name, options) in enumerate(layers.items()):
+        options = dict(options)
+        if options.get('element_color') is None:
+            options['element_color'] = LAYER_COLORS[ndx % len(LAYER_COLORS)]
+        colored_layers[name] = options
+    return colored_layers
+
+
+def export_layers_to_kml(
+        layers,
+        output_path,
+        max_workers=None,
+        **kml_kwargs,
+        ):
+    """
+    Convert each layer to kml in a process pool.
+
+    Parameters
+    ----------
+    layers : dict
+        layer name to dict of convert_to_kml arguments, which must
+        include input_file.  A sector (see export_merged_kmz) is ignored.
+    output_path : path or str
+        folder kml files are written to.
+    max_workers : int, optional
+        Number of processes, defaults to number of cores. 1 converts
+        layers in this process.
+    kml_kwargs
+        convert_to_kml arguments used for all layers.
+
+    Returns
+    -------
+    dict
+        layer name to path of converted file (None if not converted).
+        A layer that fails to convert is reported and skipped.
+    """
+    layers = {
+        name: {key: value for key, value in options.items()
+               if key != 'sector'}
+        for name, options in assign_layer_colors(layers).items()}
+    output_path = str(output_path)
+
+    kml_paths = {}
+    if max_workers == 1:
+        for name, options in layers.items():
+            try:
+                kml_paths[name] = convert_to_kml(
+                    output_path=output_path, **kml_kwargs, **options)
+            except Exception as err:
+                print(f'* KML export of {name} failed: {err!r}')
+                kml_paths[name] = None
+        return kml_paths
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            name: executor.submit(
+                convert_to_kml,
+                output_path=output_path,
+                **kml_kwargs,
+                **options)
+            for name, options in layers.items()}
+
+        for name, future in futures.items():
+            try:
+                kml_paths[name] = future.result()
+            except Exception as err:
+                print(f'* KML export of {name} failed: {err!r}')
+                kml_paths[name] = None
+
+    return kml_paths
+
+
+def make_layer_kml(
+        input_file,
+        layer_name,
+        id_prefix,
+        element_color,
+        id_field=None,
+        precision=6,
+        ):
+    """
+    Return kml of the shared styles and folder of placemarks of a layer
+    for a merged kmz, or an empty string if the layer has no features.
+    """
+    if isinstance(input_file, gpd.GeoDataFrame):
+        geo_df = input_file
+    else:
+        geo_df = read_gdf(input_file)
+
+    if geo_df.empty:
+        return ''
+
+    geo_df = geo_df.to_crs(4326)
+    if precision is not None:
+        geo_df = round_coordinates(geo_df, precision)
+
+    geo_type = detect_geo_type(geo_df)
+    if geo_type is None:
+        return ''
+
+    style_kml, style_map_ids = make_shared_styles(
+        geo_type,
+        [element_color],
+        icon_href=ICON_ENTRY,
+        id_prefix=id_prefix)
+
+    if (id_field is None) or (id_field not in geo_df.columns):
+        kml_ids = geo_df.index.to_numpy()
+    else:
+        kml_ids = geo_df[id_field].to_numpy()
+    attrs = [x for x in geo_df.columns if x != geo_df.geometry.name]
+
+    return ''.join([
+        style_kml,
+        f'<Folder><name>{escape(str(layer_name))}</name>\n',
+        make_placemarks(geo_df, attrs, kml_ids, style_map_ids[0]),
+        '</Folder>\n',
+        ])
+
+
+def iter_layer_kml(layer_args, max_workers=None):
+    """
+    Yield make_layer_kml of each of layer_args, in order.
+
+    Layers are generated in a process pool (max_workers 1 generates them
+    in this process).  At most max_workers layers are submitted ahead of
+    the layer being yielded, so only a few layers are held in memory.
+    A layer that fails is reported and yields an empty string.
+    """
+    def get_result(name, future):
+        try:
+            return future.result()
+        except Exception as err:
+            print(f'* Merged KML of {name} failed: {err!r}')
+            return ''
+
+    if max_workers == 1:
+        for args in layer_args:
+            try:
+                yield make_layer_kml(*args)
+            except Exception as err:
+                print(f'* Merged KML of {args[1]} failed: {err!r}')
+                yield ''
+        return
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = collections.deque()
+        for args in layer_args:
+            pending.append((args[1], executor.submit(make_layer_kml, *args)))
+            if len(pending) >= max_workers:
+                yield get_result(*pending.popleft())
+
+        while pending:
+            yield get_result(*pending.popleft())
+
+
+def export_merged_kmz(
+        layers,
+        out_fp,
+        max_workers=None,
+        precision=6,
+        compression_level=None,
+        ):
+    """
+    Write all layers to a single kmz with one folder per sector, holding
+    one folder per layer.
+
+    layers is a dict of layer name to dict of input_file, and optional
+    sector (defaults to the layer name), id_field and element_color.
+    Sectors are written in order of their first layer, and layers in
+    order within their sector.  Layer folders are generated by
+    iter_layer_kml and written to the kmz as they complete.
+
+    Returns the path of the written kmz.
+    """
+    layers = assign_layer_colors(layers)
+    out_fp = Path(out_fp)
+
+    sector_layers = {}
+    for ndx, (name, options) in enumerate(layers.items()):
+        sector_layers.setdefault(options.get('sector', name), []).append((
+            options['input_file'],
+            name,
+            f'layer_{ndx}_',
+            options['element_color'],
+            options.get('id_field'),
+            precision,
+            ))
+
+    layer_sectors = [
+        sector for sector, args in sector_layers.items() for _ in args]
+    layer_args = [args for x in sector_layers.values() for args in x]
+
+    with open_kml_stream(
+            out_fp,
+            export_as_kmz=True,
+            compression_level=compression_level,
+            kmz_files={ICON_ENTRY: make_icon_png()}) as kml_file:
+        kml_file.write(KML_HEADER)
+        kml_file.write(
+            f'<Document><name>{escape(out_fp.stem)}</name><open>1</open>\n')
+
+        # sector folders are opened at their first layer with features
+        open_sector = None
+        for sector, layer_kml in zip(
+                layer_sectors, iter_layer_kml(layer_args, max_workers)):
+            if not layer_kml:
+                continue
+            if sector != open_sector:
+                if open_sector is not None:
+                    kml_file.write('</Folder>\n')
+                kml_file.write(
+                    f'<Folder><name>{escape(str(sector))}</name>\n')
+                open_sector = sector
+            kml_file.write(layer_kml)
+
+        if open_sector is not None:
+            kml_file.write('</Folder>\n')
+
+        kml_file.write('</Document>\n')
+        kml_file.write(KML_FOOTER)
+
+    return os.fspath(out_fp)
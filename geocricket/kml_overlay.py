@@ -0,0 +1,394 @@
+"""
+Regionated KML super-overlays.
+
+A flat kml of every local road or block group of a state will not open
+in Google Earth in any usable time.  write_kml_super_overlay instead
+splits a layer into a quadtree of small kml tiles packaged in a kmz.
+Each tile holds at most max_features features, largest first, so the
+coarse tiles near the root show the largest features and smaller features
+are pushed down to finer tiles.  Tiles link to their children with
+NetworkLinks and are only loaded by the client once their <Region> is
+large enough on screen (<Lod>).
+
+Features of tiles with children are shown generalized until the tile is
+TILE_PIXELS on screen.  Past that their full detail geometry is loaded
+from a detail tile that replaces the generalized copies, so no feature is
+lossy at any zoom level.
+
+Tiles are generated in parallel with a process pool and written to the
+kmz as they finish.
+"""
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from .kml_stream import HIGHLIGHT_COLOR
+from .kml_stream import ICON_ENTRY
+from .kml_stream import KML_FOOTER
+from .kml_stream import KML_HEADER
+from .kml_stream import as_color_list
+from .kml_stream import make_icon_png
+from .kml_stream import make_placemarks
+from .kml_stream import make_shared_styles
+
+
+# screen size (pixels) of a tile that coarse tile features are generalized
+# for, and that their full detail copies are shown from
+TILE_PIXELS = 256
+
+
+def make_region(bounds, min_lod_pixels=128, max_lod_pixels=-1):
+    """
+    Return kml Region element of (west, south, east, north) bounds
+    """
+    west, south, east, north = bounds
+    return (
+        '<Region><LatLonAltBox>'
+        f'<north>{north}</north><south>{south}</south>'
+        f'<east>{east}</east><west>{west}</west>'
+        '</LatLonAltBox><Lod>'
+        f'<minLodPixels>{min_lod_pixels}</minLodPixels>'
+        f'<maxLodPixels>{max_lod_pixels}</maxLodPixels>'
+        '</Lod></Region>\n')
+
+
+def tile_name(tile):
+    """
+    Return kmz entry name of (level, x, y) tile
+    """
+    level, x, y = tile
+    return f'tiles/{level}_{x}_{y}.kml'
+
+
+def detail_tile_name(tile):
+    """
+    Return kmz entry name of full detail features of (level, x, y) tile
+    """
+    level, x, y = tile
+    return f'tiles/{level}_{x}_{y}_detail.kml'
+
+
+def make_network_link(name, href, region):
+    """
+    Return kml NetworkLink to href, loaded once region is active
+    """
+    return (
+        '<NetworkLink>'
+        f'<name>{escape(str(name))}</name>'
+        f'{region}'
+        '<Link>'
+        f'<href>{href}</href>'
+        '<viewRefreshMode>onRegion</viewRefreshMode>'
+        '</Link></NetworkLink>\n')
+
+
+def split_bounds(bounds):
+    """
+    Return quadrant bounds (sw, se, nw, ne) and their x, y offsets
+    """
+    west, south, east, north = bounds
+    mid_x = (west + east) / 2
+    mid_y = (south + north) / 2
+    return [
+        ((west, south, mid_x, mid_y), 0, 0),
+        ((mid_x, south, east, mid_y), 1, 0),
+        ((west, mid_y, mid_x, north), 0, 1),
+        ((mid_x, mid_y, east, north), 1, 1),
+        ]
+
+
+def feature_importance(geoms, geo_type):
+    """
+    Return size of each geometry used to place larger features in
+    coarser tiles (area of polygons, length of lines, 0 for points).
+    """
+    if geo_type == 3:
+        return shapely.area(geoms)
+    if geo_type == 2:
+        return shapely.length(geoms)
+    return np.zeros(len(geoms))
+
+
+def build_quadtree(geoms, geo_type, max_features=1000, max_level=12):
+    """
+    Assign each geometry (in epsg 4326) to one quadtree tile.
+
+    Features are sorted largest first, each tile keeps the first
+    max_features features whose representative point is inside of it, and
+    the rest are passed on to its quadrants.  Tiles at max_level keep all
+    remaining features.
+
+    Returns dict of (level, x, y) tile to dict of bounds, feature
+    positions and child tiles.
+    """
+    points = shapely.get_coordinates(shapely.point_on_surface(geoms))
+    order = np.argsort(-feature_importance(geoms, geo_type), kind='stable')
+
+    west, south, east, north = shapely.total_bounds(geoms)
+    # avoid empty regions of single points or lines
+    pad = max(east - west, north - south, 1e-4) * 1e-6
+    root_bounds = (west - pad, south - pad, east + pad, north + pad)
+
+    tiles = {}
+    stack = [((0, 0, 0), root_bounds, order)]
+    while stack:
+        tile, bounds, positions = stack.pop()
+        level, x, y = tile
+
+        if (len(positions) <= max_features) or (level >= max_level):
+            tiles[tile] = {
+                'bounds': bounds, 'positions': positions, 'children': []}
+            continue
+
+        tiles[tile] = {
+            'bounds': bounds,
+            'positions': positions[:max_features],
+            'children': []}
+        rest = positions[max_features:]
+
+        mid_x = (bounds[0] + bounds[2]) / 2
+        mid_y = (bounds[1] + bounds[3]) / 2
+        is_east = points[rest, 0] >= mid_x
+        is_north = points[rest, 1] >= mid_y
+
+        for child_bounds, dx, dy in split_bounds(bounds):
+            in_child = (is_east == bool(dx)) & (is_north == bool(dy))
+            if not in_child.any():
+                continue
+            child = (level + 1, 2 * x + dx, 2 * y + dy)
+            tiles[tile]['children'].append((child, child_bounds))
+            stack.append((child, child_bounds, rest[in_child]))
+
+    return tiles
+
+
+def make_tile_kml(
+        tile_df,
+        kml_ids,
+        folder_codes,
+        folder_names,
+        attrs,
+        style_kml,
+        style_map_ids,
+        name,
+        region,
+        network_links,
+        tolerance=0.0,
+        feature_region='',
+        ):
+    """
+    Return kml document of a single tile.
+
+    Geometry is simplified by tolerance (degrees) when given, which is
+    used to generalize features of coarse tiles.  feature_region is added
+    to each folder of placemarks, to limit the zoom levels generalized
+    features are shown at.
+    """
+    if tolerance > 0:
+        tile_df = tile_df.copy()
+        tile_df.geometry = shapely.simplify(
+            np.asarray(tile_df.geometry.array),
+            tolerance,
+            preserve_topology=True)
+
+    parts = [
+        KML_HEADER,
+        f'<Document><name>{escape(str(name))}</name>\n',
+        region,
+        style_kml,
+        ]
+
+    for code in np.unique(folder_codes):
+        in_folder = folder_codes == code
+        parts.append(
+            f'<Folder><name>{escape(str(folder_names[code]))}</name>\n')
+        parts.append(feature_region)
+        parts.append(make_placemarks(
+            tile_df[in_folder], attrs, kml_ids[in_folder],
+            style_map_ids[code]))
+        parts.append('</Folder>\n')
+
+    parts.extend(network_links)
+    parts.append('</Document>\n')
+    parts.append(KML_FOOTER)
+
+    return ''.join(parts)
+
+
+def write_kml_super_overlay(
+        geo_df,
+        geo_type,
+        element_color=None,
+        highlight_color=None,
+        id_field=None,
+        groupby_field=None,
+        output_name=None,
+        output_path=None,
+        max_features=1000,
+        max_level=12,
+        min_lod_pixels=128,
+        generalize_pixels=1,
+        max_workers=None,
+        compression_level=None,
+        ):
+    """
+    Write kmz super-overlay of geopandas dataframe (in epsg 4326).
+
+    geo_type is 1 for points, 2 for lines and 3 for polygons.
+    Each tile holds at most max_features features and is shown once its
+    region is at least min_lod_pixels on screen.  Features of tiles that
+    have children are simplified to generalize_pixels of a TILE_PIXELS
+    tile (0 to disable), and replaced by their full detail geometry once
+    the tile is TILE_PIXELS on screen.  Tiles are generated by max_workers processes
+    (1 to generate in this process).  compression_level (0 - 9) sets
+    the zlib compression of the kmz.
+
+    Returns the path of the written kmz.
+    """
+    if output_path is None:
+        output_path = os.getcwd()
+    if highlight_color is None:
+        highlight_color = HIGHLIGHT_COLOR
+
+    geoms = np.asarray(geo_df.geometry.array)
+    tiles = build_quadtree(geoms, geo_type, max_features, max_level)
+
+    if (groupby_field is not None) and (groupby_field in geo_df.columns):
+        folder_codes, folder_names = pd.factorize(
+            geo_df[groupby_field], sort=True, use_na_sentinel=False)
+        folder_names = list(folder_names)
+    else:
+        if groupby_field is not None:
+            print(f'Groupby Field {groupby_field} not found')
+        folder_codes = np.zeros(len(geo_df), dtype=int)
+        folder_names = [output_name]
+
+    colors = as_color_list(element_color, len(folder_names))
+
+    # point icon is embedded in the kmz, tiles link to it from tiles/
+    root_style_kml, style_map_ids = make_shared_styles(
+        geo_type, colors, highlight_color, ICON_ENTRY)
+    tile_style_kml, _ = make_shared_styles(
+        geo_type, colors, highlight_color, f'../{ICON_ENTRY}')
+
+    attrs = [x for x in geo_df.columns if x != geo_df.geometry.name]
+    if id_field is None:
+        kml_ids = geo_df.index.to_numpy()
+    else:
+        kml_ids = geo_df[id_field].to_numpy()
+
+    # generalized features are replaced by full detail copies from here
+    detail_lod_pixels = max(TILE_PIXELS, min_lod_pixels)
+
+    def get_tolerance(tile):
+        tile_info = tiles[tile]
+        # points are not generalized
+        if geo_type == 1 or not tile_info['children']:
+            return 0.0
+        if generalize_pixels <= 0:
+            return 0.0
+        bounds = tile_info['bounds']
+        tile_width = max(bounds[2] - bounds[0], bounds[3] - bounds[1])
+        return tile_width / TILE_PIXELS * generalize_pixels
+
+    def tile_args(tile, detail=False):
+        tile_info = tiles[tile]
+        positions = tile_info['positions']
+        bounds = tile_info['bounds']
+        is_root = tile == (0, 0, 0)
+        tolerance = 0.0 if detail else get_tolerance(tile)
+
+        # hrefs are relative to the linking file
+        prefix = 'tiles/' if is_root else ''
+        network_links = []
+        feature_region = ''
+        if not detail:
+            network_links = [
+                make_network_link(
+                    f'{child[0]}_{child[1]}_{child[2]}',
+                    f'{prefix}{os.path.basename(tile_name(child))}',
+                    make_region(child_bounds, min_lod_pixels))
+                for child, child_bounds in tile_info['children']]
+
+            if tolerance > 0:
+                feature_region = make_region(bounds, 0, detail_lod_pixels)
+                network_links.append(make_network_link(
+                    'detail',
+                    f'{prefix}{os.path.basename(detail_tile_name(tile))}',
+                    make_region(bounds, detail_lod_pixels)))
+
+        if detail:
+            name = detail_tile_name(tile)
+            region = make_region(bounds, detail_lod_pixels)
+        else:
+            name = output_name if is_root else tile_name(tile)
+            # root is always shown
+            region = make_region(bounds, 0 if is_root else min_lod_pixels)
+
+        return (
+            geo_df.iloc[positions],
+            kml_ids[positions],
+            folder_codes[positions],
+            folder_names,
+            attrs,
+            root_style_kml if is_root and not detail else tile_style_kml,
+            style_map_ids,
+            name,
+            region,
+            network_links,
+            tolerance,
+            feature_region,
+            )
+
+    res_file = os.path.join(output_path, f"{output_name}.kmz")
+
+    # (entry name, tile, is detail tile) of every kml but the root
+    entries = [
+        (tile_name(tile), tile, False) for tile in tiles if tile != (0, 0, 0)]
+    entries.extend(
+        (detail_tile_name(tile), tile, True)
+        for tile in tiles if get_tolerance(tile) > 0)
+
+    with zipfile.ZipFile(
+            res_file,
+            'w',
+            compression=zipfile.ZIP_DEFLATED,
+            compresslevel=compression_level) as kmz:
+        # clients open the first kml of a kmz, so root is written first
+        kmz.writestr('doc.kml', make_tile_kml(*tile_args((0, 0, 0))))
+        if geo_type == 1:
+            kmz.writestr(ICON_ENTRY, make_icon_png())
+
+        if (max_workers == 1) or (not entries):
+            for entry, tile, detail in entries:
+                kmz.writestr(entry, make_tile_kml(*tile_args(tile, detail)))
+        else:
+            # limit tiles held in memory waiting to be written
+            max_pending = 2 * (max_workers or os.cpu_count() or 1)
+
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                pending = {}
+
+                def write_done(done):
+                    for future in done:
+                        kmz.writestr(pending.pop(future), future.result())
+
+                for entry, tile, detail in entries:
+                    if len(pending) >= max_pending:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        write_done(done)
+                    future = executor.submit(
+                        make_tile_kml, *tile_args(tile, detail))
+                    pending[future] = entry
+
+                done, _ = wait(pending)
+                write_done(done)
+
+    return res_file
@@ -0,0 +1,423 @@
+"""
+Streaming KML / KMZ writer.
+
+The simplekml makers in kml.py create an object (and style map) for every
+feature and hold the whole document in memory until it is saved, which
+exhausts memory on layers such as census block groups or transmission
+lines.  stream_kml writes the same document - folder, style and
+placemark structure - straight to a .kml file or to the doc.kml entry of
+a .kmz, one chunk of features at a time.
+"""
+import io
+import os
+import struct
+import zipfile
+import zlib
+from contextlib import contextmanager
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+import shapely
+
+
+KML_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<kml xmlns="http://www.opengis.net/kml/2.2" '
+    'xmlns:gx="http://www.google.com/kml/ext/2.2">\n')
+KML_FOOTER = '</kml>\n'
+
+# NOTE: uses google maps icons, assert internet connection
+DEFAULT_ICON = r"http://maps.google.com/mapfiles/kml/paddle/wht-blank.png"
+
+# kmz entry of the generated point icon, so kmz clients fetch nothing
+ICON_ENTRY = 'files/icon.png'
+
+# simplekml.Color.yellowgreen and simplekml.Color.orange
+DEFAULT_COLOR = 'ff32cd9a'
+HIGHLIGHT_COLOR = 'ff00a5ff'
+
+# Polygon alpha definitions (as kml.make_kml_polygons)
+ALPHA_NON_SELECTED = round(255 * 0.65)
+ALPHA_SELECTED = round(255 * 0.8)
+
+
+def change_alpha(alpha, color):
+    """
+    Return aabbggrr kml color with alpha (0 - 255) replaced
+    """
+    return f'{alpha:02x}{color[2:]}'
+
+
+def make_icon_png(size=32):
+    """
+    Return png bytes of a white circle point icon with a grey outline.
+    The icon is tinted by the kml IconStyle color.
+    """
+    rows, cols = np.mgrid[:size, :size]
+    center = (size - 1) / 2
+    radius = np.hypot(rows - center, cols - center)
+    outer = size / 2 - 1
+
+    rgba = np.zeros((size, size, 4), dtype=np.uint8)
+    inside = radius <= outer
+    rgba[inside] = 255
+    rgba[inside & (radius > outer - 2), :3] = 64
+
+    # each png scanline starts with filter type 0
+    raw = b''.join(b'\x00' + row.tobytes() for row in rgba)
+
+    def png_chunk(tag, data):
+        crc = zlib.crc32(tag + data) & 0xffffffff
+        return struct.pack('>I', len(data)) + tag + data + struct.pack(
+            '>I', crc)
+
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + png_chunk(b'IHDR', struct.pack(
+            '>IIBBBBB', size, size, 8, 6, 0, 0, 0))
+        + png_chunk(b'IDAT', zlib.compress(raw))
+        + png_chunk(b'IEND', b''))
+
+
+def make_style(
+        style_id,
+        geo_type,
+        color,
+        highlight=False,
+        icon_href=DEFAULT_ICON,
+        ):
+    """
+    Return kml Style element for geo_type (1 points, 2 lines, 3 polygons)
+    matching the styles of the simplekml makers.
+    """
+    if geo_type == 1:
+        return (
+            f'<Style id="{style_id}">'
+            f'<IconStyle><color>{color}</color>'
+            f'<scale>{2 if highlight else 1}</scale>'
+            f'<Icon><href>{icon_href}</href></Icon></IconStyle>'
+            '<LabelStyle><scale>0</scale></LabelStyle>'
+            '</Style>\n')
+
+    line_style = (
+        f'<LineStyle><color>{color}</color>'
+        f'<width>{4 if highlight else 2}</width></LineStyle>')
+
+    if geo_type == 2:
+        return f'<Style id="{style_id}">{line_style}</Style>\n'
+
+    alpha = ALPHA_SELECTED if highlight else ALPHA_NON_SELECTED
+    return (
+        f'<Style id="{style_id}">{line_style}'
+        f'<PolyStyle><color>{change_alpha(alpha, color)}</color>'
+        '</PolyStyle></Style>\n')
+
+
+def make_style_map(style_map_id, normal_id, highlight_id):
+    """
+    Return kml StyleMap element of normal and highlight style ids
+    """
+    return (
+        f'<StyleMap id="{style_map_id}">'
+        f'<Pair><key>normal</key><styleUrl>#{normal_id}</styleUrl></Pair>'
+        f'<Pair><key>highlight</key><styleUrl>#{highlight_id}</styleUrl>'
+        '</Pair></StyleMap>\n')
+
+
+def make_shared_styles(
+        geo_type,
+        colors,
+        highlight_color=HIGHLIGHT_COLOR,
+        icon_href=DEFAULT_ICON,
+        id_prefix='',
+        ):
+    """
+    Return kml of one Style and StyleMap per unique color of colors, and
+    the StyleMap id of each color of colors.
+
+    Placemarks reference the StyleMap of their folder by styleUrl so
+    styles are only defined once per document.  id_prefix keeps ids of
+    several layers in one document unique.
+    """
+    highlight_id = f'{id_prefix}highlight'
+    parts = [make_style(
+        highlight_id, geo_type, highlight_color, True, icon_href)]
+    color_ids = {}
+    for color in colors:
+        if color in color_ids:
+            continue
+        normal_id = f'{id_prefix}normal_{len(color_ids)}'
+        style_map_id = f'{id_prefix}stylemap_{len(color_ids)}'
+        color_ids[color] = style_map_id
+        parts.append(make_style(
+            normal_id, geo_type, color, icon_href=icon_href))
+        parts.append(make_style_map(style_map_id, normal_id, highlight_id))
+
+    return ''.join(parts), [color_ids[x] for x in colors]
+
+
+def format_coords(geom):
+    """
+    Return kml coordinate string (lon,lat without altitude) of shapely
+    geometry coordinates
+    """
+    return ' '.join(
+        f'{x},{y}' for x, y in shapely.get_coordinates(geom).tolist())
+
+
+def polygon_to_kml(polygon):
+    """
+    Return kml Polygon element of shapely polygon, including holes
+    """
+    rings = shapely.get_rings(polygon)
+    inner = ''.join(
+        '<innerBoundaryIs><LinearRing><coordinates>'
+        f'{format_coords(ring)}'
+        '</coordinates></LinearRing></innerBoundaryIs>'
+        for ring in rings[1:])
+
+    return (
+        '<Polygon><outerBoundaryIs><LinearRing><coordinates>'
+        f'{format_coords(rings[0])}'
+        f'</coordinates></LinearRing></outerBoundaryIs>{inner}</Polygon>')
+
+
+def part_to_kml(part):
+    """
+    Return kml element of single part shapely geometry
+    """
+    geom_type = part.geom_type
+    if geom_type == 'Point':
+        return (
+            '<Point><coordinates>'
+            f'{format_coords(part)}'
+            '</coordinates></Point>')
+
+    if geom_type in ('LineString', 'LinearRing'):
+        return (
+            '<LineString><coordinates>'
+            f'{format_coords(part)}'
+            '</coordinates></LineString>')
+
+    if geom_type == 'Polygon':
+        return polygon_to_kml(part)
+
+    # nested collection
+    return geometry_to_kml(part)
+
+
+def geometry_to_kml(geom):
+    """
+    Return kml geometry element of shapely geometry.
+
+    Multi part geometry is written as a single MultiGeometry of its parts.
+    Missing and empty geometry returns an empty string.
+    """
+    if geom is None or geom.is_empty:
+        return ''
+
+    if shapely.get_type_id(geom) < 4:
+        # point, linestring, linearring, polygon
+        return part_to_kml(geom)
+
+    parts = ''.join(
+        part_to_kml(part) for part in shapely.get_parts(geom)
+        if not part.is_empty)
+
+    return f'<MultiGeometry>{parts}</MultiGeometry>'
+
+
+def make_descriptions(geo_df, attrs=None):
+    """
+    Return object array of html table descriptions of each row of geo_df.
+
+    Each column is formatted once and the columns are joined into rows,
+    instead of building every row's table attribute by attribute.
+    attrs defaults to all columns except geometry.
+    """
+    if attrs is None:
+        attrs = [x for x in geo_df.columns if x != geo_df.geometry.name]
+
+    descriptions = np.full(len(geo_df), """<table>""", dtype=object)
+
+    for attr in attrs:
+        values = geo_df[attr].astype(str).to_numpy(dtype=object)
+        descriptions = descriptions + (f"""
+            <tr style='background-color:#9DBBE0'> <th>{attr}</th> </tr>
+            <tr style='background-color:#ffffff'> <td>""" + values + """</td>
+            """)
+
+    return descriptions + """</table>"""
+
+
+def as_color_list(element_color, n_colors):
+    """
+    Return list of n_colors kml colors from a color or list of colors
+    """
+    if element_color is None:
+        element_color = [DEFAULT_COLOR]
+    elif isinstance(element_color, str):
+        element_color = [element_color]
+    element_color = list(element_color)
+
+    # repeat colors if there are more folders than colors
+    return [element_color[ndx % len(element_color)]
+            for ndx in range(n_colors)]
+
+
+@contextmanager
+def open_kml_stream(
+        res_file,
+        export_as_kmz=False,
+        compression_level=None,
+        kmz_files=None,
+        ):
+    """
+    Open text stream to res_file, or to the doc.kml entry of res_file
+    if export_as_kmz (compressed with zlib compression_level 0 - 9).
+
+    kmz_files is a dict of kmz entry name to bytes (e.g. icons) written
+    after doc.kml.
+    """
+    if export_as_kmz:
+        with zipfile.ZipFile(
+                res_file,
+                'w',
+                compression=zipfile.ZIP_DEFLATED,
+                compresslevel=compression_level) as kmz:
+            with kmz.open('doc.kml', 'w') as entry:
+                with io.TextIOWrapper(entry, encoding='utf-8') as kml_file:
+                    yield kml_file
+
+            for name, data in (kmz_files or {}).items():
+                kmz.writestr(name, data)
+    else:
+        with open(res_file, 'w', encoding='utf-8') as kml_file:
+            yield kml_file
+
+
+def group_positions(geo_df, groupby_field=None, output_name=None):
+    """
+    Return list of (folder name, row positions) in folder order.
+    Folders are the sorted unique values of groupby_field, or a single
+    folder of output_name.
+    """
+    if groupby_field is not None:
+        if groupby_field in geo_df.columns:
+            codes, folder_names = pd.factorize(
+                geo_df[groupby_field], sort=True, use_na_sentinel=False)
+            order = np.argsort(codes, kind='stable')
+            splits = np.searchsorted(
+                codes[order], np.arange(1, len(folder_names)))
+            return list(zip(folder_names, np.split(order, splits)))
+
+        print(f'Groupby Field {groupby_field} not found')
+
+    return [(output_name, np.arange(len(geo_df)))]
+
+
+def make_placemarks(geo_df, attrs, kml_ids, style_map_id):
+    """
+    Return kml Placemarks of each row of geo_df, named by kml_ids, with
+    attrs in the description and styled by the shared style_map_id.
+    """
+    descriptions = make_descriptions(geo_df, attrs)
+    geoms = np.asarray(geo_df.geometry.array)
+    style_url = f'<styleUrl>#{style_map_id}</styleUrl>'
+
+    return ''.join(
+        f'<Placemark><name>{escape(str(kml_id))}</name>'
+        f'<description>{escape(description)}</description>'
+        f'{style_url}'
+        f'{geometry_to_kml(geom)}'
+        '</Placemark>\n'
+        for kml_id, geom, description in zip(kml_ids, geoms, descriptions))
+
+
+def stream_kml(
+        geo_df,
+        geo_type,
+        element_color=None,
+        highlight_color=None,
+        id_field=None,
+        groupby_field=None,
+        output_name=None,
+        output_path=None,
+        export_as_kmz=False,
+        chunk_size=5000,
+        compression_level=None,
+        ):
+    """
+    Stream kml or kmz of geopandas dataframe (in epsg 4326) to output_path.
+
+    geo_type is 1 for points, 2 for lines and 3 for polygons.
+    element_color is a kml color or list of colors, one per folder.
+    Features are written chunk_size rows at a time.
+    compression_level (0 - 9) sets the zlib compression of kmz output.
+
+    Returns the path of the written file.
+    """
+    if output_path is None:
+        output_path = os.getcwd()
+    if highlight_color is None:
+        highlight_color = HIGHLIGHT_COLOR
+
+    folders = group_positions(geo_df, groupby_field, output_name)
+    use_folders = (
+        groupby_field is not None and groupby_field in geo_df.columns)
+    colors = as_color_list(element_color, len(folders))
+
+    # kmz point icons are embedded in the archive
+    kmz_files = {}
+    icon_href = DEFAULT_ICON
+    if export_as_kmz and geo_type == 1:
+        kmz_files[ICON_ENTRY] = make_icon_png()
+        icon_href = ICON_ENTRY
+
+    style_kml, style_map_ids = make_shared_styles(
+        geo_type, colors, highlight_color, icon_href)
+
+    attrs = [x for x in geo_df.columns if x != geo_df.geometry.name]
+
+    if id_field is None:
+        kml_ids = geo_df.index.to_numpy()
+    else:
+        kml_ids = geo_df[id_field].to_numpy()
+
+    if export_as_kmz:
+        res_file = os.path.join(output_path, f"{output_name}.kmz")
+    else:
+        res_file = os.path.join(output_path, f"{output_name}.kml")
+
+    top_folder_name = groupby_field if use_folders else output_name
+
+    with open_kml_stream(
+            res_file,
+            export_as_kmz,
+            compression_level,
+            kmz_files) as kml_file:
+        kml_file.write(KML_HEADER)
+        kml_file.write('<Document><open>1</open>\n')
+        kml_file.write(
+            f'<Document><name>{escape(str(output_name))}</name>\n')
+        kml_file.write(style_kml)
+        kml_file.write(
+            f'<Folder><name>{escape(str(top_folder_name))}</name>\n')
+
+        for (folder_name, positions), style_map_id in zip(
+                folders, style_map_ids):
+            kml_file.write(
+                f'<Folder><name>{escape(str(folder_name))}</name>\n')
+
+            for start in range(0, len(positions), chunk_size):
+                chunk = positions[start:start + chunk_size]
+                kml_file.write(make_placemarks(
+                    geo_df.iloc[chunk], attrs, kml_ids[chunk], style_map_id))
+
+            kml_file.write('</Folder>\n')
+
+        kml_file.write('</Folder>\n</Document>\n</Document>\n')
+        kml_file.write(KML_FOOTER)
+
+    return res_file
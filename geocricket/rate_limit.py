@@ -0,0 +1,108 @@
+"""
+Rate limiting for api queries shared between threads.
+
+Transit Land api keys are limited to a number of requests per second
+depending on their tier (the free tier is assumed to allow about one
+request per second).
+"""
+import email.utils
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket rate limiter.
+
+    Tokens are added at rate per second up to capacity, and each request
+    takes one token.  capacity > 1 allows short bursts.
+
+    rate must be positive and capacity at least 1, else ValueError is
+    raised.
+    """
+
+    def __init__(self, rate=1.0, capacity=1):
+        if not rate > 0:
+            raise ValueError(f'rate must be positive, not {rate}')
+        if not capacity >= 1:
+            raise ValueError(f'capacity must be at least 1, not {capacity}')
+
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.n_acquired = 0
+        self._first_acquired = None
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """
+        Block until a request is allowed.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                if (now >= self._paused_until) and (self._tokens >= 1):
+                    self._tokens -= 1
+                    self.n_acquired += 1
+                    if self._first_acquired is None:
+                        self._first_acquired = now
+                    return
+
+                wait = max(
+                    self._paused_until - now,
+                    (1 - self._tokens) / self.rate)
+
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Do not allow any request for seconds (e.g. from Retry-After).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._refill(now)
+            self._tokens = 0.0
+
+    def achieved_rate(self):
+        """
+        Return requests per second since the first request.
+        """
+        if self._first_acquired is None:
+            return 0.0
+        elapsed = time.monotonic() - self._first_acquired
+        if elapsed <= 0:
+            return float(self.n_acquired)
+        return self.n_acquired / elapsed
+
+
+def parse_retry_after(retry_after, default=1.0):
+    """
+    Return seconds to wait from a Retry-After header value, which may be
+    a number of seconds or an http date.
+    """
+    if retry_after is None:
+        return default
+
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        retry_time = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return default
+
+    return max(retry_time.timestamp() - time.time(), 0.0)
@@ -0,0 +1,164 @@
+"""
+On disk cache of json api responses.
+
+Used to reuse Transit Land responses when a collection is run again over
+the same or overlapping areas.  Entries are json files named by a hash of
+the query (never including api keys), expire after a time to live, and
+the least recently used entries are removed once the cache grows past a
+size limit.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class ResponseCache:
+    """
+    Json response cache in cache_dir.
+
+    ttl is the entry time to live in seconds, max_bytes the size limit of
+    all entries, and precision the number of decimals lat and long are
+    rounded to in keys (5 decimals is about 1 m).
+    """
+
+    def __init__(
+            self,
+            cache_dir,
+            ttl=7 * 24 * 3600,
+            max_bytes=500 * 1024 ** 2,
+            precision=5,
+            ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.precision = precision
+
+        self._lock = threading.Lock()
+        self._size = sum(x.stat().st_size for x in self._entries())
+
+    def _entries(self):
+        return self.cache_dir.glob('*.json')
+
+    def _path(self, key):
+        return self.cache_dir / f'{key}.json'
+
+    def make_key(self, endpoint, lat, long, radius, **params):
+        """
+        Return key of a query at rounded lat and long
+        """
+        key_dict = {
+            'endpoint': endpoint,
+            'lat': round(float(lat), self.precision),
+            'long': round(float(long), self.precision),
+            'radius': radius,
+            **params,
+            }
+        key_str = json.dumps(key_dict, sort_keys=True, default=str)
+
+        return hashlib.sha256(key_str.encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Return cached response of key, or None if missing or expired
+        """
+        path = self._path(key)
+        try:
+            age = time.time() - path.stat().st_mtime
+            if age > self.ttl:
+                with self._lock:
+                    self._remove(path)
+                return None
+
+            with open(path, encoding='utf-8') as cache_file:
+                value = json.load(cache_file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(path, (time.time(), path.stat().st_mtime))
+        except FileNotFoundError:
+            pass
+
+        return value
+
+    def set(self, key, value):
+        """
+        Store json serializable value as key
+        """
+        path = self._path(key)
+        temp_path = path.with_suffix(f'.{threading.get_ident()}.tmp')
+
+        with open(temp_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(value, cache_file)
+
+        with self._lock:
+            # size of a replaced entry no longer counts
+            try:
+                old_size = path.stat().st_size
+            except FileNotFoundError:
+                old_size = 0
+
+            # replace is atomic, readers never see partial entries
+            os.replace(temp_path, path)
+
+            self._size += path.stat().st_size - old_size
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def _remove(self, path):
+        # called holding self._lock
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        self._size -= size
+
+    def evict(self):
+        """
+        Remove expired entries, then least recently used entries until the
+        cache is smaller than max_bytes.
+        """
+        now = time.time()
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                self._remove(path)
+            else:
+                entries.append((stat.st_atime, stat.st_size, path))
+
+        self._size = sum(x[1] for x in entries)
+
+        entries.sort()
+        for _, _, path in entries:
+            if self._size <= self.max_bytes:
+                break
+            self._remove(path)
+
+    def clear(self):
+        """
+        Remove all entries
+        """
+        with self._lock:
+            for path in self._entries():
+                self._remove(path)
+            self._size = 0
+
+
+def ensure_cache(cache):
+    """
+    Return ResponseCache from cache directory path, or cache as is
+    """
+    if cache is None or isinstance(cache, ResponseCache):
+        return cache
+    return ResponseCache(cache)
@@ -314,3 +314,38 @@ def usgs_dict():
             'color': None,
             'outCRS': 3857},
     }
+
+
+def dedupe_dict():
+    """
+    Groups of collected layers that report the same kind of facility.
+
+    Used to remove facilities reported by more than one source.
+    Each key is a dictionary with:
+    layers: collected layer names, in order of priority
+    radius: search distance in meters
+    name_similarity: minimum name similarity ratio (0 - 1) for a match
+    cross_source_only: if True, facilities of the same layer are not merged
+    """
+    return {
+        'hospitals': {
+            'layers': [
+                'HIFLD_Hospitals',
+                'USGS_Hospitals_Medical_Centers'],
+            'radius': 250,
+            'name_similarity': 0.6,
+            'cross_source_only': True},
+        'law_enforcement': {
+            'layers': [
+                'HIFLD_Local_Law_Enforcement_Locations',
+                'USGS_Police_stations'],
+            'radius': 250,
+            'name_similarity': 0.6,
+            'cross_source_only': True},
+        'fire_ems': {  # HIFLD fire and EMS no longer public
+            'layers': [
+                'USGS_Fire_stations_EMS_stations'],
+            'radius': 100,
+            'name_similarity': 0.8,
+            'cross_source_only': False},
+    }
@@ -0,0 +1,358 @@
+"""
+Functions to page through large ArcGIS REST layers.
+
+restapi select_by_location collects every feature of a query before
+returning, which holds an entire layer in memory.  These functions
+instead request a layer one page (resultOffset / resultRecordCount) at a
+time, optionally split the query area into tiles that are requested
+concurrently, and yield each page as a small GeoDataFrame so results can
+be written to disk (gpkg, GeoParquet or FlatGeobuf) as they arrive.
+"""
+import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import requests
+import shapely
+
+from .flatgeobuf import FlatGeobufWriter
+from .geoparquet import GeoParquetWriter
+from .gis_io import write_gdf
+
+
+# writers of drivers that are written through one open file, rather than
+# by appending each chunk
+CHUNK_WRITERS = {
+    'FlatGeobuf': FlatGeobufWriter,
+    'Parquet': GeoParquetWriter,
+    }
+
+
+def get_layer_url(server_url, service, layer, server_type='MapServer'):
+    """
+    Return query-able url of a layer on an ArcGIS server
+    """
+    server_url = server_url.rstrip('/')
+    return f"{server_url}/{service}/{server_type}/{layer}"
+
+
+def get_server_type(server_url):
+    """
+    Return FeatureServer for ArcGIS Online hosted servers, else MapServer
+    """
+    if '.arcgis.com/' in server_url:
+        return 'FeatureServer'
+    return 'MapServer'
+
+
+def get_json(url, params, timeout=60, attempt_limit=5):
+    """
+    Return json response of a GET request to an ArcGIS server.
+
+    Servers typically require multiple queries before responding
+    correctly. Accounts for attempt_limit attempts before raising.
+    """
+    attempt = 0
+    while True:
+        try:
+            response = requests.get(url, params=params, timeout=timeout)
+            response.raise_for_status()
+            res_json = response.json()
+            if 'error' in res_json:
+                raise requests.RequestException(res_json['error'])
+            return res_json
+        except (requests.RequestException, ValueError):
+            attempt += 1
+            if attempt >= attempt_limit:
+                raise
+
+
+@functools.lru_cache(maxsize=64)
+def get_object_id_field(layer_url, timeout=60, attempt_limit=5):
+    """
+    Return name of the object id field of an ArcGIS layer, from the
+    layer metadata.  Pages are ordered by it so offsets are stable.
+
+    Layers that do not report one are assumed to use OBJECTID.
+    """
+    info = get_json(
+        layer_url, {'f': 'json'},
+        timeout=timeout, attempt_limit=attempt_limit)
+
+    if info.get('objectIdField'):
+        return info['objectIdField']
+
+    for field in info.get('fields') or []:
+        if field.get('type') == 'esriFieldTypeOID':
+            return field['name']
+
+    return 'OBJECTID'
+
+
+def query_features_page(
+        layer_url,
+        envelope,
+        in_sr=3857,
+        out_sr=3857,
+        offset=0,
+        page_size=2000,
+        where='1=1',
+        out_fields='*',
+        order_by_field=None,
+        timeout=60,
+        attempt_limit=5,
+        ):
+    """
+    Query a single page of features that intersect envelope
+    (xmin, ymin, xmax, ymax) from an ArcGIS layer.
+
+    Features are ordered by order_by_field, which defaults to the object
+    id field of the layer (see get_object_id_field).
+
+    Servers typically require multiple queries before responding
+    correctly. Accounts for attempt_limit attempts before raising.
+
+    Returns geojson dictionary.
+    """
+    if order_by_field is None:
+        order_by_field = get_object_id_field(
+            layer_url, timeout=timeout, attempt_limit=attempt_limit)
+
+    params = {
+        'where': where,
+        'geometry': ','.join(str(x) for x in envelope),
+        'geometryType': 'esriGeometryEnvelope',
+        'spatialRel': 'esriSpatialRelIntersects',
+        'inSR': in_sr,
+        'outSR': out_sr,
+        'outFields': out_fields,
+        'returnGeometry': 'true',
+        'orderByFields': order_by_field,
+        'resultOffset': offset,
+        'resultRecordCount': page_size,
+        'f': 'geojson',
+    }
+
+    return get_json(
+        f"{layer_url}/query", params,
+        timeout=timeout, attempt_limit=attempt_limit)
+
+
+def iter_feature_pages(
+        layer_url,
+        envelope,
+        in_sr=3857,
+        out_sr=3857,
+        page_size=2000,
+        **query_kwargs,
+        ):
+    """
+    Yield geojson pages of all features that intersect envelope.
+
+    Paging stops once the server returns a partial page and no longer
+    reports exceededTransferLimit.
+    """
+    offset = 0
+    while True:
+        page = query_features_page(
+            layer_url,
+            envelope,
+            in_sr=in_sr,
+            out_sr=out_sr,
+            offset=offset,
+            page_size=page_size,
+            **query_kwargs)
+
+        n_features = len(page.get('features', []))
+        if n_features == 0:
+            return
+
+        yield page
+
+        exceeded = page.get('properties', {}).get(
+            'exceededTransferLimit', False)
+        if (n_features < page_size) and not exceeded:
+            return
+
+        offset += n_features
+
+
+def features_to_gdf(page, crs):
+    """
+    Convert geojson page to geodataframe in crs
+    """
+    return gpd.GeoDataFrame.from_features(page['features'], crs=crs)
+
+
+def make_tiles(boundary, tile_size):
+    """
+    Split bounds of shapely boundary into square tiles of tile_size
+    (crs units) and return array of tiles that intersect boundary.
+    Bounds without width or height (e.g. of a point or a straight line)
+    are widened to one tile.
+    """
+    if tile_size <= 0:
+        raise ValueError(f'tile_size must be positive, not {tile_size}')
+
+    if boundary.is_empty:
+        return np.array([], dtype=object)
+
+    min_x, min_y, max_x, max_y = boundary.bounds
+    if max_x <= min_x:
+        max_x = min_x + tile_size
+    if max_y <= min_y:
+        max_y = min_y + tile_size
+
+    x_edges = np.arange(min_x, max_x, tile_size)
+    y_edges = np.arange(min_y, max_y, tile_size)
+    x_grid, y_grid = np.meshgrid(x_edges, y_edges)
+    x_grid = x_grid.ravel()
+    y_grid = y_grid.ravel()
+
+    tiles = shapely.box(
+        x_grid,
+        y_grid,
+        np.minimum(x_grid + tile_size, max_x),
+        np.minimum(y_grid + tile_size, max_y))
+
+    return tiles[shapely.intersects(tiles, boundary)]
+
+
+def iter_tiled_feature_pages(
+        layer_url,
+        boundary,
+        crs=3857,
+        tile_size=20000,
+        page_size=2000,
+        max_workers=4,
+        **query_kwargs,
+        ):
+    """
+    Yield geodataframe pages of all features in layer_url that intersect
+    the shapely boundary (in crs).
+
+    The boundary envelope is split into tiles of tile_size that are paged
+    through concurrently.  A feature that spans several tiles is only
+    yielded by the lowest numbered tile it intersects, so no feature
+    bookkeeping is required between pages.
+
+    At most 2 * max_workers pages are held in memory at once.
+    """
+    tiles = make_tiles(boundary, tile_size)
+    n_tiles = len(tiles)
+    if n_tiles == 0:
+        return
+
+    tile_tree = shapely.STRtree(tiles)
+    shapely.prepare(boundary)
+
+    page_queue = queue.Queue(maxsize=2 * max_workers)
+    stop_event = threading.Event()
+    tile_done = object()
+
+    def put_page(item):
+        # avoid blocking forever if consumer has stopped reading
+        while not stop_event.is_set():
+            try:
+                page_queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def collect_tile(tile_ndx):
+        try:
+            # tiles still queued when the consumer stops make no requests
+            if stop_event.is_set():
+                return
+
+            pages = iter_feature_pages(
+                layer_url,
+                tiles[tile_ndx].bounds,
+                in_sr=crs,
+                out_sr=crs,
+                page_size=page_size,
+                **query_kwargs)
+
+            for page in pages:
+                if stop_event.is_set():
+                    return
+                page_df = features_to_gdf(page, crs)
+                geoms = np.asarray(page_df.geometry.array)
+
+                # find lowest numbered tile each feature intersects
+                feature_ndx, owner_ndx = tile_tree.query(
+                    geoms, predicate='intersects')
+                first_owner = np.full(len(geoms), n_tiles)
+                np.minimum.at(first_owner, feature_ndx, owner_ndx)
+
+                keep = ((first_owner == tile_ndx)
+                        & shapely.intersects(geoms, boundary))
+                if keep.any():
+                    put_page(page_df[keep])
+        finally:
+            put_page(tile_done)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(collect_tile, ndx)
+                   for ndx in range(n_tiles)]
+        try:
+            n_done = 0
+            while n_done < n_tiles:
+                item = page_queue.get()
+                if item is tile_done:
+                    n_done += 1
+                    continue
+                yield item
+        finally:
+            stop_event.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        # raise any errors from workers
+        for future in futures:
+            future.result()
+
+
+def iter_chunks(pages, chunk_size=20000):
+    """
+    Combine geodataframe pages into chunks of at least chunk_size rows
+    """
+    buffer = []
+    n_buffered = 0
+    for page in pages:
+        buffer.append(page)
+        n_buffered += len(page)
+        if n_buffered >= chunk_size:
+            yield pd.concat(buffer, ignore_index=True)
+            buffer = []
+            n_buffered = 0
+
+    if buffer:
+        yield pd.concat(buffer, ignore_index=True)
+
+
+def write_chunks(chunks, out_path, driver='GPKG'):
+    """
+    Write each geodataframe chunk to out_path as it arrives, by appending
+    to the first written chunk, or through a CHUNK_WRITERS writer
+    ('Parquet' writes GeoParquet).
+
+    Returns count of written features.
+    """
+    if driver in CHUNK_WRITERS:
+        with CHUNK_WRITERS[driver](out_path) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+        return writer.n_written
+
+    count = 0
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        write_gdf(chunk, out_path, driver=driver, append=count > 0)
+        count += len(chunk)
+
+    return count
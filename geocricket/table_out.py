@@ -0,0 +1,195 @@
+"""
+Chunked table output for the ReNCAT csv files.
+
+TableWriter appends dataframe chunks to a csv, optionally gzip or zstd
+compressed, so whole tables never have to be held in memory.  The same
+chunks can also be written to Parquet and / or Feather twins with
+explicit column dtypes, which downstream loaders can memory-map or read
+selected columns from.
+
+Parquet and Feather output require pyarrow, and zstd compression
+requires zstandard (see setup.cfg extras).
+"""
+import pathlib
+
+import pandas as pd
+
+
+# csv file suffix of each supported compression
+COMPRESSION_SUFFIXES = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+    }
+
+COLUMNAR_FORMATS = ('parquet', 'feather')
+
+# explicit dtypes of the ReNCAT csv columns, other columns are strings
+FACILITY_DTYPES = {
+    'rencat_id': 'string',
+    'longitude': 'float64',
+    'latitude': 'float64',
+    'sector': 'string',
+    'merged_rencat_ids': 'string',
+    'GEOID': 'string',
+    }
+
+CENSUS_DTYPES = {
+    'rencat_id': 'string',
+    'longitude': 'float64',
+    'latitude': 'float64',
+    'total_population_B01001_001E': 'float64',
+    'median_household_income_B19013_001E': 'float64',
+    'GEOID': 'string',
+    }
+
+
+def import_pyarrow():
+    """
+    Return pyarrow, with install instructions if missing
+    """
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError(
+            'Parquet, Feather and GeoParquet output require pyarrow, '
+            'install with: pip install geocricket[columnar]') from err
+    return pyarrow
+
+
+def apply_dtypes(df, dtypes):
+    """
+    Return df with columns cast to dtypes (string if not listed)
+    """
+    return df.astype({col: dtypes.get(col, 'string') for col in df.columns})
+
+
+class TableWriter:
+    """
+    Write dataframe chunks to {name}.csv in output_path, and to
+    {name}.parquet / {name}.feather twins for each of columnar_formats.
+
+    compression is None, 'gzip' or 'zstd'.  Each appended chunk of a
+    compressed csv is a separate gzip member / zstd frame, which readers
+    decompress as one file.  chunk_size limits rows formatted by pandas
+    at once.  Columns are cast to dtypes (string if not listed).
+    """
+
+    def __init__(
+            self,
+            output_path,
+            name,
+            dtypes=None,
+            compression=None,
+            columnar_formats=(),
+            chunk_size=None,
+            ):
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(
+                f'compression must be one of {list(COMPRESSION_SUFFIXES)}')
+
+        columnar_formats = tuple(columnar_formats or ())
+        unknown = set(columnar_formats) - set(COLUMNAR_FORMATS)
+        if unknown:
+            raise ValueError(f'Unknown columnar formats {sorted(unknown)}')
+
+        self.output_path = pathlib.Path(output_path)
+        self.output_path.mkdir(parents=True, exist_ok=True)
+
+        self.dtypes = dtypes or {}
+        self.compression = compression
+        self.columnar_formats = columnar_formats
+        self.chunk_size = chunk_size
+
+        self.csv_path = self.output_path / (
+            f'{name}.csv{COMPRESSION_SUFFIXES[compression]}')
+        self.columnar_paths = {
+            fmt: self.output_path / f'{name}.{fmt}'
+            for fmt in columnar_formats}
+
+        self._pa = import_pyarrow() if columnar_formats else None
+        self._schema = None
+        self._columnar_writers = {}
+        self._header_written = False
+        self.n_written = 0
+
+    def _open_columnar_writers(self, schema):
+        pa = self._pa
+        for fmt, path in self.columnar_paths.items():
+            if fmt == 'parquet':
+                self._columnar_writers[fmt] = pa.parquet.ParquetWriter(
+                    path, schema)
+            else:
+                self._columnar_writers[fmt] = pa.ipc.new_file(
+                    str(path), schema)
+
+    def write(self, df):
+        """
+        Append dataframe chunk to all outputs
+        """
+        df = apply_dtypes(df, self.dtypes)
+        is_first = not self._header_written
+
+        df.to_csv(
+            self.csv_path,
+            mode='w' if is_first else 'a',
+            header=is_first,
+            index=False,
+            compression=self.compression,
+            chunksize=self.chunk_size)
+
+        if self._pa is not None:
+            if self._schema is None:
+                self._schema = self._pa.Schema.from_pandas(
+                    df, preserve_index=False)
+                self._open_columnar_writers(self._schema)
+
+            table = self._pa.Table.from_pandas(
+                df[self._schema.names],
+                schema=self._schema,
+                preserve_index=False)
+            for writer in self._columnar_writers.values():
+                writer.write_table(table)
+
+        self._header_written = True
+        self.n_written += len(df)
+
+    def close(self):
+        """
+        Finish columnar outputs
+        """
+        for writer in self._columnar_writers.values():
+            writer.close()
+        self._columnar_writers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_table(
+        df,
+        output_path,
+        name,
+        dtypes=None,
+        compression=None,
+        columnar_formats=(),
+        chunk_size=None,
+        ):
+    """
+    Write df with a TableWriter, returns path of the csv
+    """
+    with TableWriter(
+            output_path,
+            name,
+            dtypes=dtypes,
+            compression=compression,
+            columnar_formats=columnar_formats,
+            chunk_size=chunk_size) as writer:
+        writer.write(df)
+    return writer.csv_path
@@ -10,147 +10,463 @@ API documentation: https://www.transit.land/documentation
 import datetime  # to generate output names with timestamp
 import os
 import time  # to handle transit land max query
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 import requests
 
+import fiona
 import pandas as pd
 import geopandas as gpd
 import numpy as np
+import pyproj
+import shapely
 
 from shapely.geometry import shape
-from shapely.geometry import Point
 
+from .gis_io import read_gdf
+from .gis_io import write_gdf
+from .rate_limit import TokenBucket
+from .rate_limit import parse_retry_after
+from .response_cache import ensure_cache
 
-def transit_land_radius_query(api_key, lat, long, radius=1000):
+
+def transit_land_get(query, rate_limiter=None, max_retries=5, timeout=20):
+    """
+    GET a transit land query, waiting on rate_limiter (TokenBucket) if
+    given.  Responses of 429 (too many requests) are retried up to
+    max_retries times after the time requested by their Retry-After
+    header, during which rate_limiter allows no other requests.
+
+    Returns the last response.
+    """
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+
+        response = requests.request("GET", query, timeout=timeout)
+
+        if (response.status_code != 429) or (attempt == max_retries):
+            return response
+
+        retry_wait = parse_retry_after(
+            response.headers.get('Retry-After'), default=2 ** attempt)
+
+        if rate_limiter is not None:
+            rate_limiter.pause(retry_wait)
+        else:
+            time.sleep(retry_wait)
+
+    return response
+
+
+def iter_transit_land_radius_pages(
+        api_key,
+        lat,
+        long,
+        radius=1000,
+        limit=100,
+        rate_limiter=None,
+        max_pages=None,
+        cache=None,
+        ):
+    """
+    Yield each page of transit land routes (with stops) found within radius
+    (meters, 0-10k) of lat and long as a parsed geojson dictionary.
+
+    Pages of limit routes are requested one at a time by following the api
+    'after' cursor, so only a single page is held in memory.  Stops after
+    max_pages pages if given.
+
+    cache is an optional ResponseCache (or cache directory) that pages are
+    reused from, keyed by rounded lat and long, radius, limit and cursor.
+    """
+    cache = ensure_cache(cache)
+
+    base_query = f"https://transit.land/api/v2/rest/routes?api_key={api_key}&lat={lat}&lon={long}&radius={radius}&limit={limit}&format=geojson"
+
+    after = None
+    n_pages = 0
+
+    while (max_pages is None) or (n_pages < max_pages):
+        geojson_query = base_query
+        if after is not None:
+            geojson_query += f"&after={after}"
+
+        page = None
+        if cache is not None:
+            cache_key = cache.make_key(
+                'routes', lat, long, radius, limit=limit, after=after)
+            page = cache.get(cache_key)
+
+        if page is None:
+            # get response
+            geojson_response = transit_land_get(
+                geojson_query, rate_limiter=rate_limiter)
+
+            # check response
+            if geojson_response.status_code != 200:
+                print(geojson_query)
+                print('Response not 200')
+                return
+
+            page = geojson_response.json()
+
+            if cache is not None:
+                cache.set(cache_key, page)
+
+        n_pages += 1
+
+        yield page
+
+        if not has_next_page(page, limit):
+            return
+
+        after = page['meta']['after']
+
+
+def has_next_page(page, limit):
+    """
+    Return True if more routes are available after a transit land page
+    """
+    after = page.get('meta', {}).get('after')
+    return (after is not None) and is_saturated_response(page, limit)
+
+
+def is_saturated_response(res, limit):
+    """
+    Return True if a response may be truncated by the query limit
+    """
+    return len(res['features']) >= limit
+
+
+def transit_land_radius_query(
+        api_key,
+        lat,
+        long,
+        radius=1000,
+        limit=100,
+        rate_limiter=None,
+        max_pages=None,
+        cache=None,
+        ):
     """
     Query transit land routes and stops using supplied api key and
     lat and long.
     Radius is in meters with a possible range of 0-10k.
+    limit is the maximum number of routes returned per page, all pages
+    (up to max_pages) are combined into a single response.
+    rate_limiter is an optional TokenBucket shared between queries.
+    cache is an optional ResponseCache (or cache directory) to reuse
+    responses from.
     """
-    # create routes query
-    geojson_query = f"https://transit.land/api/v2/rest/routes?api_key={api_key}&lat={lat}&lon={long}&radius={radius}&format=geojson"
-
-    # get response
-    geojson_response = requests.request("GET", geojson_query, timeout=20)
+    res = None
 
-    # check response
-    if geojson_response.status_code != 200:
-        print(geojson_query)
-        print('Response not 200')
-        return None
+    for page in iter_transit_land_radius_pages(
+            api_key,
+            lat,
+            long,
+            radius=radius,
+            limit=limit,
+            rate_limiter=rate_limiter,
+            max_pages=max_pages,
+            cache=cache):
 
-    # response is okay - convert response to gpd
-    res = geojson_response.json()
+        if res is None:
+            res = page
+        else:
+            res['features'].extend(page['features'])
+            res['meta'] = page.get('meta', {})
 
     return res
 
 
-def get_routes_from_transit_land_res(res):
+def iter_transit_land_frames(pages):
     """
-    Accepts a transit land response and returns a geopandas dataframe
-    with routes in epsg 4326
+    Convert each transit land page to a (routes, stops) tuple of
+    geodataframes as it arrives.
+    """
+    for page in pages:
+        yield frames_from_res(page)
+
+
+def collect_transit_land_frames(pages):
+    """
+    Combine routes and stops of all transit land pages.
+    Returns (routes, stops) tuple of geodataframes, or (None, None) if
+    there were no valid pages.
+    """
+    route_dfs = []
+    stop_dfs = []
+    for route_df, stop_df in iter_transit_land_frames(pages):
+        route_dfs.append(route_df)
+        stop_dfs.append(stop_df)
+
+    if not route_dfs:
+        return (None, None)
+
+    return (pd.concat(route_dfs, ignore_index=True),
+            pd.concat(stop_dfs, ignore_index=True))
+
+
+def get_route_line_parts(geometry):
+    """
+    Return list of coordinate lists of each line in a route geojson
+    geometry (LineString, MultiLineString, or None)
+    """
+    if geometry is None:
+        return []
+    if geometry['type'] == 'LineString':
+        return [geometry['coordinates']]
+    return geometry['coordinates']
+
+
+def parse_transit_land_res(res):
+    """
+    Parse route and stop columns of a transit land response in a single
+    pass over its features.
+
+    Returns dictionary of route columns, stop columns, route geometry
+    ragged coordinate arrays, and the route index of each stop.
+    """
+    features = res['features']
+
+    columns = {
+        'route_onestop_id': [],
+        'route_name': [],
+        'route_type': [],
+        'route_n_stops': [],
+        'agency_name': [],
+        'agency_onestop_id': [],
+        'stop_id': [],
+        'stop_name': [],
+        'stop_coords': [],
+        'stop_route_ndx': [],
+        'line_coords': [],
+        'line_offsets': [0],
+        'geom_offsets': [0],
+        }
+
+    for route_ndx, route in enumerate(features):
+        properties = route['properties']
+        stops = properties['route_stops']
+
+        columns['route_onestop_id'].append(properties['onestop_id'])
+        columns['route_name'].append(properties['route_long_name'])
+        columns['route_type'].append(properties['route_type'])
+        columns['route_n_stops'].append(len(stops))
+        columns['agency_name'].append(properties['agency']['agency_name'])
+        columns['agency_onestop_id'].append(
+            properties['agency']['onestop_id'])
+
+        # route multi line string as ragged coordinates
+        for line in get_route_line_parts(route['geometry']):
+            columns['line_coords'].extend(line)
+            columns['line_offsets'].append(len(columns['line_coords']))
+        columns['geom_offsets'].append(len(columns['line_offsets']) - 1)
+
+        for stop in stops:
+            columns['stop_id'].append(stop['stop']['id'])
+            columns['stop_name'].append(stop['stop']['stop_name'])
+            columns['stop_coords'].append(
+                stop['stop']['geometry']['coordinates'])
+        columns['stop_route_ndx'].extend([route_ndx] * len(stops))
+
+    return columns
+
+
+def make_route_geometry(columns):
+    """
+    Create array of route multi line strings from parsed ragged arrays
     """
-    # collect route multistring column data via list comprehension
-    route_onestop_id = [
-        route['properties']['onestop_id'] for route in res['features']]
-    route_name = [
-        route['properties']['route_long_name'] for route in res['features']]
-    route_type = [
-        route['properties']['route_type'] for route in res['features']]
-    route_n_stops = [
-        len(route['properties']['route_stops']) for route in res['features']]
-    agency_name = [
-        route['properties']['agency']['agency_name']
-        for route in res['features']]
-    agency_onestop_id = [
-        route['properties']['agency']['onestop_id']
-        for route in res['features']]
-    route_geometry = [shape(route['geometry']) for route in res['features']]
+    coords = np.asarray(columns['line_coords'], dtype=float).reshape(-1, 2)
+    offsets = (
+        np.asarray(columns['line_offsets'], dtype=np.int64),
+        np.asarray(columns['geom_offsets'], dtype=np.int64))
 
+    return shapely.from_ragged_array(
+        shapely.GeometryType.MULTILINESTRING, coords, offsets)
+
+
+def make_stop_geometry(columns):
+    """
+    Create array of stop points from parsed coordinates
+    """
+    coords = np.asarray(columns['stop_coords'], dtype=float).reshape(-1, 2)
+    return shapely.points(coords)
+
+
+def make_route_frame(columns):
+    """
+    Create geodataframe of routes in epsg 4326 from parsed columns
+    """
     # combine lists into dictionary
     route_dict = {
-        'route_onestop_id': route_onestop_id,
-        'route_name': route_name,
-        'route_type': route_type,
-        'route_n_stops': route_n_stops,
-        'agency_name': agency_name,
-        'agency_onestop_id': agency_onestop_id,
-        'geometry': route_geometry
+        'route_onestop_id': columns['route_onestop_id'],
+        'route_name': columns['route_name'],
+        'route_type': columns['route_type'],
+        'route_n_stops': columns['route_n_stops'],
+        'agency_name': columns['agency_name'],
+        'agency_onestop_id': columns['agency_onestop_id'],
     }
 
     # convert dictionary to geodataframe
-    route_df = gpd.GeoDataFrame(route_dict)
-
-    route_df.set_crs(epsg="4326", inplace=True)
+    route_df = gpd.GeoDataFrame(
+        route_dict, geometry=make_route_geometry(columns), crs=4326)
 
     return route_df
 
 
+def make_stop_frame(columns):
+    """
+    Create geodataframe of route stops in epsg 4326 from parsed columns
+
+    A stop is included once for each route that serves it.
+    """
+
+    # route information of each stop
+    route_ndx = np.asarray(columns['stop_route_ndx'], dtype=np.int64)
+
+    def route_column(name):
+        return pd.Series(columns[name]).to_numpy()[route_ndx]
+
+    # collect stops into dictionary
+    stop_dict = {
+        'id': columns['stop_id'],
+        'name': columns['stop_name'],
+        'route_onestop_id': route_column('route_onestop_id'),
+        'route_name': route_column('route_name'),
+        'route_type': route_column('route_type'),
+        'agency': route_column('agency_name'),
+        'agency_onestop_id': route_column('agency_onestop_id'),
+    }
+
+    # convert dictionary to geodatafram
+    stop_df = gpd.GeoDataFrame(
+        stop_dict, geometry=make_stop_geometry(columns), crs=4326)
+
+    return stop_df
+
+
+def get_routes_from_transit_land_res(res):
+    """
+    Accepts a transit land response and returns a geopandas dataframe
+    with routes in epsg 4326
+    """
+    return make_route_frame(parse_transit_land_res(res))
+
+
 def get_stops_from_transit_land_res(res):
     """
     Accepts a transit land response and returns a geopandas dataframe
     with route stops in epsg 4326
+
+    A stop is included once for each route that serves it.
     """
-    # handle data from stops
-    full_stop_route_onestop_id = []
-    full_stop_route_name = []
-    full_stop_route_type = []
-    full_stop_agency = []
-    full_stop_agency_onestop_id = []
+    return make_stop_frame(parse_transit_land_res(res))
 
-    full_stop_id = []
-    full_stop_names = []
-    full_stop_geometry = []
 
-    # Handle individual stops
-    for route in res['features']:
+def frames_from_res(res):
+    """
+    Parse a transit land response once and return (routes, stops) tuple
+    of geodataframes in epsg 4326
+    """
+    columns = parse_transit_land_res(res)
+    return make_route_frame(columns), make_stop_frame(columns)
 
-        n_stops = len(route['properties']['route_stops'])
-        # collect information common to each stop
-        route_onestop_id = [route['properties']['onestop_id']] * n_stops
-        route_name = [route['properties']['route_long_name']] * n_stops
-        route_type = [route['properties']['route_type']] * n_stops
 
-        stop_agency = [route['properties']['agency']['agency_name']] * n_stops
-        stop_agency_onestop_id = [route['properties']['agency']['onestop_id']] * n_stops
+def normalize_transit_tables(route_df, stop_df):
+    """
+    Split routes and stops (one stop row per route that serves it) into
+    normalized tables:
 
-        # list comprehend each stop in current route
-        stops = route['properties']['route_stops']
+    routes: one row per route with an integer route_key
+    stops: one row per unique stop id with an integer stop_key
+    stop_route: integer stop_key and route_key of each stop and route pair
 
-        stop_geometry = [shape(stop['stop']['geometry']) for stop in stops]
-        stop_names = [stop['stop']['stop_name'] for stop in stops]
-        stop_id = [stop['stop']['id'] for stop in stops]
+    Returns tuple of (routes, stops, stop_route) dataframes.
+    """
+    routes = route_df.drop_duplicates(
+        subset='route_onestop_id', ignore_index=True)
+    routes.insert(0, 'route_key', np.arange(len(routes), dtype=np.int64))
 
-        # combine stops from route into one list
-        full_stop_id.extend(stop_id)
-        full_stop_names.extend(stop_names)
-        full_stop_geometry.extend(stop_geometry)
+    stop_codes, _ = pd.factorize(stop_df['id'])
+    is_first_stop = ~pd.Series(stop_codes).duplicated().to_numpy()
 
-        full_stop_route_onestop_id.extend(route_onestop_id)
-        full_stop_route_name.extend(route_name)
-        full_stop_route_type.extend(route_type)
+    stops = stop_df.loc[is_first_stop, ['id', 'name', 'geometry']]
+    stops = stops.reset_index(drop=True)
+    stops.insert(0, 'stop_key', np.arange(len(stops), dtype=np.int64))
 
-        # unsure if this really makes sense...
-        full_stop_agency.extend(stop_agency)
-        full_stop_agency_onestop_id.extend(stop_agency_onestop_id)
+    route_keys = pd.Index(routes['route_onestop_id']).get_indexer(
+        stop_df['route_onestop_id'])
 
-    # collect stops into dictionary
-    stop_dict = {
-        'id': full_stop_id,
-        'name': full_stop_names,
-        'route_onestop_id': full_stop_route_onestop_id,
-        'route_name': full_stop_route_name,
-        'route_type': full_stop_route_type,
-        'agency': full_stop_agency,
-        'agency_onestop_id': full_stop_agency_onestop_id,
-        'geometry': full_stop_geometry
-    }
+    stop_route = pd.DataFrame({
+        'stop_key': stop_codes.astype(np.int64),
+        'route_key': route_keys.astype(np.int64),
+        }).drop_duplicates(ignore_index=True)
 
-    # convert dictionary to geodatafram
-    stop_df = gpd.GeoDataFrame(stop_dict)
+    return (routes, stops, stop_route)
 
-    stop_df.set_crs(epsg="4326", inplace=True)
 
-    return stop_df
+def write_attribute_table(df, fp_out, layer):
+    """
+    Write non-spatial dataframe df as an attribute table layer of
+    geopackage fp_out
+    """
+    # fiona field types of numpy dtype kinds, others written as str
+    field_types = {'i': 'int', 'u': 'int', 'f': 'float', 'b': 'bool'}
+
+    schema = {
+        'geometry': 'None',
+        'properties': {
+            col: field_types.get(df[col].dtype.kind, 'str')
+            for col in df.columns},
+        }
+
+    with fiona.open(fp_out, 'w', driver='GPKG', layer=layer,
+                    schema=schema) as dst:
+        dst.writerecords(
+            {'geometry': None, 'properties': record}
+            for record in df.to_dict(orient='records'))
+
+
+def export_transit_frames(
+        route_df,
+        stop_df,
+        out_name,
+        out_dir,
+        normalized=False,
+        ):
+    """
+    Export routes and stops geodataframes as geopackages.
+
+    If normalized is True, routes, unique stops, and a stop_route link
+    table (see normalize_transit_tables) are written as layers of a
+    single '_transit' geopackage instead.
+
+    Returns list of exported geopackages.
+    """
+    if normalized:
+        fp_out = os.path.join(out_dir, f'{out_name}_transit.gpkg')
+
+        routes, stops, stop_route = normalize_transit_tables(
+            route_df, stop_df)
+
+        write_gdf(routes, fp_out, driver='GPKG', layer='routes')
+        write_gdf(stops, fp_out, driver='GPKG', layer='stops')
+        write_attribute_table(stop_route, fp_out, layer='stop_route')
+
+        return [fp_out]
+
+    # create file paths for export
+    route_fp_out = os.path.join(out_dir, f'{out_name}_routes.gpkg')
+    stops_fp_out = os.path.join(out_dir, f'{out_name}_stops.gpkg')
+
+    # export geopackages
+    write_gdf(route_df, route_fp_out, driver='GPKG')
+    write_gdf(stop_df, stops_fp_out, driver='GPKG')
+
+    return [route_fp_out, stops_fp_out]
 
 
 def export_transit_land_point_radius_query(
@@ -159,24 +475,32 @@ def export_transit_land_point_radius_query(
         long,
         radius=1000,
         out_name=None,
-        out_dir=None):
+        out_dir=None,
+        limit=100,
+        normalized=False,
+        cache=None):
     """
     Collect and export transit land routes and stops given an api_key
     and a lat and long coordinates
 
+    All pages of limit routes are collected.
+    If normalized is True, a single geopackage of routes, unique stops,
+    and stop_route layers is exported (see normalize_transit_tables).
+    cache is an optional ResponseCache (or cache directory) to reuse
+    responses from.
+
     Return list of exported geopackages.
 
     """
 
-    res = transit_land_radius_query(api_key, lat, long, radius)
+    pages = iter_transit_land_radius_pages(
+        api_key, lat, long, radius=radius, limit=limit, cache=cache)
+    route_df, stop_df = collect_transit_land_frames(pages)
 
-    if res is None:
+    if route_df is None:
         print('Error with API response')
         return None
 
-    route_df = get_routes_from_transit_land_res(res)
-    stop_df = get_stops_from_transit_land_res(res)
-
     # handle no name
     if out_name is None:
         # present as longitude_latitude_radius
@@ -186,15 +510,252 @@ def export_transit_land_point_radius_query(
     if out_dir is None:
         out_dir = os.getcwd()
 
-    # create file paths for export
-    route_fp_out = os.path.join(out_dir, f'{out_name}_routes.gpkg')
-    stops_fp_out = os.path.join(out_dir, f'{out_name}_stops.gpkg')
+    return export_transit_frames(
+        route_df,
+        stop_df,
+        out_name,
+        out_dir,
+        normalized=normalized)
 
-    # export geopackages
-    route_df.to_file(route_fp_out, driver="GPKG")
-    stop_df.to_file(stops_fp_out, driver="GPKG")
 
-    return [route_fp_out, stops_fp_out]
+def join_site_ids(df, key_cols, site_col='site_id'):
+    """
+    Deduplicate rows found for multiple sites on key_cols and replace
+    site_col with a site_ids column of all sites (';' separated).
+    """
+    site_ids = df[site_col].astype(str).groupby(
+        [df[x] for x in key_cols], sort=False).agg(
+            lambda x: ';'.join(pd.unique(x)))
+    site_ids.name = 'site_ids'
+
+    unique_df = df.drop_duplicates(subset=key_cols, ignore_index=True)
+    unique_df = unique_df.drop(columns=site_col)
+
+    return unique_df.merge(
+        site_ids.reset_index(), on=key_cols, how='left')
+
+
+def query_site(api_key, site_id, lat, long, **query_kwargs):
+    """
+    Collect routes and stops around a single site tagged with site_id.
+    Returns (routes, stops) tuple of geodataframes or (None, None).
+    """
+    pages = iter_transit_land_radius_pages(api_key, lat, long, **query_kwargs)
+    route_df, stop_df = collect_transit_land_frames(pages)
+
+    if route_df is not None:
+        route_df['site_id'] = site_id
+        stop_df['site_id'] = site_id
+
+    return (route_df, stop_df)
+
+
+def export_transit_land_sites_query(
+        api_key,
+        sites,
+        radius=1000,
+        site_id_field=None,
+        out_name=None,
+        out_dir=None,
+        limit=100,
+        requests_per_second=1.0,
+        max_workers=4,
+        cache=None,
+        normalized=False,
+        ):
+    """
+    Collect and export transit land routes and stops within radius
+    (meters) of each site in sites, a geopandas readable file or
+    geodataframe (e.g. hospitals or shelters).  Non-point sites use a
+    representative point.
+
+    Sites are queried by max_workers threads limited to
+    requests_per_second (see export_transit_land_geometry_bound_query).
+
+    Each route and stop is exported once with a site_ids column listing
+    every site (site_id_field values, or index) it was found for.
+    Routes and stops are written as layers of a single '_sites_transit'
+    geopackage, with a stop_route layer if normalized is True
+    (see normalize_transit_tables).
+
+    Returns location of exported geopackage.
+    """
+    if isinstance(sites, gpd.GeoDataFrame):
+        site_df = sites
+    else:
+        site_df = read_gdf(sites)
+
+    site_pts = site_df.to_crs(4326).representative_point()
+
+    if site_id_field is None:
+        site_ids = site_df.index.to_numpy()
+    else:
+        site_ids = site_df[site_id_field].to_numpy()
+
+    rate_limiter = TokenBucket(rate=requests_per_second)
+    cache = ensure_cache(cache)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                query_site,
+                api_key,
+                site_id,
+                pt.y,
+                pt.x,
+                radius=radius,
+                limit=limit,
+                rate_limiter=rate_limiter,
+                cache=cache)
+            for site_id, pt in zip(site_ids, site_pts)]
+
+        results = [future.result() for future in futures]
+
+    print(f"{rate_limiter.n_acquired} transit land requests at "
+          f"{rate_limiter.achieved_rate():.2f} requests per second")
+
+    route_dfs = [x[0] for x in results if x[0] is not None]
+    stop_dfs = [x[1] for x in results if x[1] is not None]
+
+    if not route_dfs:
+        print('No valid transit land responses')
+        return None
+
+    full_routes = pd.concat(route_dfs, ignore_index=True)
+    full_stops = pd.concat(stop_dfs, ignore_index=True)
+
+    # handle no name
+    if out_name is None:
+        # add time string
+        t_str = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        out_name = f"result_sites_{t_str}"
+
+    # handle dir export
+    if out_dir is None:
+        out_dir = os.getcwd()
+
+    fp_out = os.path.join(out_dir, f'{out_name}_sites_transit.gpkg')
+
+    routes = join_site_ids(full_routes, ['route_onestop_id'])
+
+    if normalized:
+        routes, stops, stop_route = normalize_transit_tables(
+            routes, full_stops.drop(columns='site_id'))
+
+        stop_sites = join_site_ids(full_stops, ['id'])
+        stops = stops.merge(stop_sites[['id', 'site_ids']], on='id')
+
+        write_gdf(routes, fp_out, driver='GPKG', layer='routes')
+        write_gdf(stops, fp_out, driver='GPKG', layer='stops')
+        write_attribute_table(stop_route, fp_out, layer='stop_route')
+    else:
+        stops = join_site_ids(full_stops, ['id', 'route_onestop_id'])
+
+        write_gdf(routes, fp_out, driver='GPKG', layer='routes')
+        write_gdf(stops, fp_out, driver='GPKG', layer='stops')
+
+    return fp_out
+
+
+def generate_search_covering(boundary, radius, overlap=0.05):
+    """
+    Return array of shapely points whose circles of radius cover the
+    shapely boundary polygon (in a meter crs).
+
+    Points are placed on a hexagonal grid, which is the regular circle
+    covering with the least overlap, and only points with circles that
+    intersect the boundary are returned.  Grid spacing is reduced by the
+    overlap fraction so that projection error does not leave gaps.
+
+    The grid is anchored at the crs origin rather than the boundary
+    bounds, so a small boundary edit keeps the points (and cached
+    responses) of unchanged areas.
+    """
+    min_x, min_y, max_x, max_y = boundary.bounds
+
+    grid_radius = radius * (1 - overlap)
+    x_step = np.sqrt(3) * grid_radius
+    y_step = 1.5 * grid_radius
+
+    # grid step numbers, extended one step past bounds so the full
+    # boundary is covered
+    x_ndx = np.arange(
+        np.floor(min_x / x_step) - 1, np.ceil(max_x / x_step) + 2)
+    y_ndx = np.arange(
+        np.floor(min_y / y_step) - 1, np.ceil(max_y / y_step) + 2)
+    x_ndx, y_ndx = np.meshgrid(x_ndx, y_ndx)
+
+    # offset every other (odd numbered) row by half a step
+    x_grid = (x_ndx + 0.5 * (y_ndx % 2)) * x_step
+    y_grid = y_ndx * y_step
+
+    pts = shapely.points(x_grid.ravel(), y_grid.ravel())
+
+    return pts[shapely.dwithin(pts, boundary, radius)]
+
+
+def subdivide_search_cell(center, radius, boundary):
+    """
+    Return points of a search covering with half the radius over the part
+    of the boundary covered by a circle at center with radius.
+    """
+    cell_area = shapely.intersection(shapely.buffer(center, radius), boundary)
+    return generate_search_covering(cell_area, radius / 2)
+
+
+def query_search_cell(
+        api_key,
+        center,
+        radius,
+        lat,
+        long,
+        limit=100,
+        rate_limiter=None,
+        max_pages=None,
+        cache=None,
+        ):
+    """
+    Query routes and stops of a single search circle at shapely center
+    point (utm) located at lat and long.
+
+    Returns dictionary of query location, routes, stops, and if the
+    response was saturated (more routes after max_pages pages).
+    """
+    cell = {
+        'lat': lat,
+        'long': long,
+        'radius': radius,
+        'center': center,
+        'routes': None,
+        'stops': None,
+        'saturated': False,
+        }
+
+    route_dfs = []
+    stop_dfs = []
+
+    pages = iter_transit_land_radius_pages(
+        api_key,
+        lat,
+        long,
+        radius=radius,
+        limit=limit,
+        rate_limiter=rate_limiter,
+        max_pages=max_pages,
+        cache=cache)
+
+    # parse each page as it arrives
+    for page in pages:
+        route_df, stop_df = frames_from_res(page)
+        route_dfs.append(route_df)
+        stop_dfs.append(stop_df)
+        cell['saturated'] = has_next_page(page, limit)
+
+    if route_dfs:
+        cell['routes'] = pd.concat(route_dfs, ignore_index=True)
+        cell['stops'] = pd.concat(stop_dfs, ignore_index=True)
+
+    return cell
 
 
 def export_transit_land_geometry_bound_query(
@@ -202,117 +763,128 @@ def export_transit_land_geometry_bound_query(
         boundary_fp,
         out_name=None,
         out_dir=None,
+        search_radius=10000,
+        min_search_radius=1250,
+        limit=100,
+        clip_routes=True,
+        requests_per_second=1.0,
+        max_workers=4,
+        max_pages=None,
+        normalized=False,
+        cache=None,
         ):
     """
     Export collected routes and stops found inside boundary defined by
     geopandas readable file located at the boundary_fp path location.
 
-    Returns locations of exported full stops and routes geopackages
+    The boundary is covered by a hexagonal grid of search_radius (meters)
+    circles that intersect the boundary.  All pages of limit routes are
+    collected for each circle, unless max_pages is given.  If a circle
+    has more routes than max_pages pages, its area is searched again with
+    circles of half the radius, down to min_search_radius.
+
+    Collected stops outside of the boundary are removed, and route
+    geometry is clipped to the boundary if clip_routes is True.
 
-    NOTE: Includes a 1 second sleep between each api call to prevent
-    over query (assumes free api license)
+    Search circles are queried by max_workers threads limited to
+    requests_per_second, which should match the api key tier (default
+    of 1 assumes free api license).
+
+    If normalized is True, a single geopackage of routes, unique stops,
+    and stop_route layers is exported (see normalize_transit_tables).
+
+    cache is an optional ResponseCache (or cache directory) so that
+    repeated or overlapping collections reuse earlier responses.
+
+    Returns locations of exported full stops and routes geopackages
     """
 
     # read bounding geometry
-    boundary_df = gpd.read_file(boundary_fp)
+    boundary_df = read_gdf(boundary_fp)
     # estimate utm crs - for meter math
     utm_crs = boundary_df.estimate_utm_crs()
-    # convert boundary to utm
-    utm_df = boundary_df.to_crs(utm_crs)
-    # collect bounds
-    all_bounds = utm_df.total_bounds
-
-    # seperate bounds into human readalbe variables
-    min_x = int(np.floor(all_bounds[0]))
-    min_y = int(np.floor(all_bounds[1]))
-    max_x = int(np.ceil(all_bounds[2]))
-    max_y = int(np.ceil(all_bounds[3]))
-
-    search_radius = 10000  # use 10km range
-
-    # define interval of radius search
-    # e.g. largest square to fit inside radius
-    point_radius = int(np.floor(2 * search_radius / np.sqrt(2)))
-
-    # create ranges
-    x_range = list(range(min_x, max_x, point_radius))
-    y_range = list(range(min_y, max_y, point_radius))
-
-    # make lists of points for query dataframe
-    n = 1
-    pts = []
-    ndx = []
-    for x in x_range:
-        for y in y_range:
-            pts.append(Point([x, y]))
-            ndx.append(str(n))
-            n += 1
-
-    # create utm dataframe from grid of search coordinates
-    gdf = gpd.GeoDataFrame(ndx, geometry=pts, columns=['num'])
-    gdf.set_crs(utm_crs, inplace=True)
-
-    # convert search coordinates back to lat long for api
-    gdf2 = gdf.to_crs(epsg="4326")
+    # convert boundary to single utm geometry
+    boundary_utm = shapely.union_all(
+        np.asarray(boundary_df.to_crs(utm_crs).geometry.array))
 
-    # initialize dictionary for api query results
-    res_dict = {}
+    # to convert search coordinates back to lat long for api
+    to_lat_long = pyproj.Transformer.from_crs(
+        utm_crs, "EPSG:4326", always_xy=True)
 
-    for index, row in gdf2.iterrows():
-        # collect require information for query
-        long = row.geometry.x
-        lat = row.geometry.y
+    rate_limiter = TokenBucket(rate=requests_per_second)
+    cache = ensure_cache(cache)
 
-        res_dict[index] = {}
-        res_dict[index]['lat'] = lat
-        res_dict[index]['long'] = long
-
-        res = transit_land_radius_query(
+    def submit_cell(executor, center, radius):
+        long, lat = to_lat_long.transform(center.x, center.y)
+        return executor.submit(
+            query_search_cell,
             api_key,
+            center,
+            radius,
             lat,
             long,
-            radius=search_radius)
+            limit=limit,
+            rate_limiter=rate_limiter,
+            max_pages=max_pages,
+            cache=cache)
 
-        if res is None:
-            res_dict[index]['routes'] = None
-            res_dict[index]['stops'] = None
-        else:
-            res_dict[index]['routes'] = get_routes_from_transit_land_res(res)
-            res_dict[index]['stops'] = get_stops_from_transit_land_res(res)
-
-        time.sleep(1)  # to prevent over query of 'free' transit land api key
-
-    # handle result dictionary
-    stops_init = False
-    routes_init = False
-
-    for d in res_dict.values():
-        if not d['stops'].empty:
-            # stops in result
-            if not stops_init:
-                # df not created yet, init full stops df
-                full_stops = d['stops']
-                stops_init = True
-            else:
-                # stops df already created, simple concat
-                full_stops = pd.concat([full_stops, d['stops']])
-
-        if not d['routes'].empty:
-            # routes in result
-            if not routes_init:
-                # routes df not created yet, init full routes df
-                full_routes = d['routes']
-                routes_init = True
-            else:
-                # routes df already created, simple concat
-                full_routes = pd.concat([full_routes, d['routes']])
-
-    # clean up full collections of routes and stops
-    full_routes.drop_duplicates(inplace=True)
-    full_routes.reset_index(drop=True, inplace=True)
-
-    full_stops.drop_duplicates(inplace=True)
-    full_stops.reset_index(drop=True, inplace=True)
+    # initialize dictionary for api query results
+    res_dict = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # circles of search_radius that intersect the boundary
+        pending = {
+            submit_cell(executor, pt, search_radius)
+            for pt in generate_search_covering(boundary_utm, search_radius)}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                cell = future.result()
+                res_dict[len(res_dict)] = cell
+
+                # query smaller circles in dense areas with truncated results
+                radius = cell['radius']
+                if cell['saturated'] and (radius / 2 >= min_search_radius):
+                    for pt in subdivide_search_cell(
+                            cell['center'], radius, boundary_utm):
+                        pending.add(submit_cell(executor, pt, radius / 2))
+
+    print(f"{rate_limiter.n_acquired} transit land requests at "
+          f"{rate_limiter.achieved_rate():.2f} requests per second")
+
+    # combine results of all cells at once
+    route_dfs = [x['routes'] for x in res_dict.values()
+                 if x['routes'] is not None]
+    stop_dfs = [x['stops'] for x in res_dict.values()
+                if x['stops'] is not None]
+
+    if not route_dfs:
+        print('No valid transit land responses')
+        return None
+
+    # routes and stops are found by multiple overlapping cells
+    full_routes = pd.concat(route_dfs, ignore_index=True)
+    full_routes.drop_duplicates(
+        subset='route_onestop_id', inplace=True, ignore_index=True)
+
+    full_stops = pd.concat(stop_dfs, ignore_index=True)
+    full_stops.drop_duplicates(
+        subset=['id', 'route_onestop_id'], inplace=True, ignore_index=True)
+
+    # clip results to boundary
+    boundary_4326 = shapely.union_all(
+        np.asarray(boundary_df.to_crs(4326).geometry.array))
+    shapely.prepare(boundary_4326)
+
+    full_stops = full_stops[
+        full_stops.intersects(boundary_4326)].reset_index(drop=True)
+
+    full_routes = full_routes[
+        full_routes.intersects(boundary_4326)].reset_index(drop=True)
+    if clip_routes:
+        full_routes['geometry'] = full_routes.intersection(boundary_4326)
 
     # handle no name
     if out_name is None:
@@ -324,12 +896,9 @@ def export_transit_land_geometry_bound_query(
     if out_dir is None:
         out_dir = os.getcwd()
 
-    # create file paths for export
-    route_fp_out = os.path.join(out_dir, f'{out_name}_routes.gpkg')
-    stops_fp_out = os.path.join(out_dir, f'{out_name}_stops.gpkg')
-
-    # export geopackages
-    full_routes.to_file(route_fp_out, driver="GPKG")
-    full_stops.to_file(stops_fp_out, driver="GPKG")
-
-    return [route_fp_out, stops_fp_out]
+    return export_transit_frames(
+        full_routes,
+        full_stops,
+        out_name,
+        out_dir,
+        normalized=normalized)
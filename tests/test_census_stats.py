@@ -0,0 +1,107 @@
+import json
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box
+
+import geocricket as gc
+from geocricket import census_stats
+
+
+def make_census_df():
+    # two 1x1 km census units side by side in utm meters
+    return gpd.GeoDataFrame(
+        {
+            'GEOID': ['35001000100', '35001000200'],
+            'total_population_B01001_001E': [100.0, 300.0],
+            'median_household_income_B19013_001E': [40000.0, np.nan],
+        },
+        geometry=[box(0, 0, 1000, 1000), box(1000, 0, 2000, 1000)],
+        crs=32613)
+
+
+class TestCensusStats(unittest.TestCase):
+    def test_area_weighted_interpolation(self):
+        census_df = make_census_df()
+        target_df = gpd.GeoDataFrame(
+            {'name': ['left_half', 'straddle', 'outside']},
+            geometry=[box(0, 0, 500, 1000),
+                      box(500, 0, 1500, 1000),
+                      box(5000, 5000, 6000, 6000)],
+            crs=32613)
+
+        result = gc.interpolate_census_stats(census_df, target_df)
+
+        pop = result['total_population_B01001_001E'].to_list()
+        self.assertAlmostEqual(pop[0], 50.0)
+        self.assertAlmostEqual(pop[1], 200.0)
+        self.assertAlmostEqual(pop[2], 0.0)
+
+        # missing income is ignored instead of averaged as zero
+        income = result['median_household_income_B19013_001E'].to_list()
+        self.assertAlmostEqual(income[1], 40000.0)
+        self.assertTrue(np.isnan(income[2]))
+
+    def test_dasymetric_interpolation(self):
+        census_df = make_census_df()
+        target_df = gpd.GeoDataFrame(
+            geometry=[box(0, 0, 500, 1000), box(500, 0, 1000, 1000)],
+            crs=32613)
+        # all of the first census unit population lives in its left half
+        weight_df = gpd.GeoDataFrame(
+            geometry=[box(0, 0, 250, 1000)], crs=32613)
+
+        result = gc.interpolate_census_stats(
+            census_df, target_df, weight_geo=weight_df)
+
+        pop = result['total_population_B01001_001E'].to_list()
+        self.assertAlmostEqual(pop[0], 100.0)
+        self.assertAlmostEqual(pop[1], 0.0)
+
+    def test_generate_geoid(self):
+        columns = ['P1_001N', 'state', 'county', 'tract', 'block']
+        res_df = pd.DataFrame(
+            [['12', '35', '001', '000100', '1000']], columns=columns)
+
+        result = census_stats.generate_geoid(res_df)
+        self.assertEqual(result.columns.to_list(), ['P1_001N', 'GEOID'])
+        self.assertEqual(result['GEOID'].to_list(), ['350010001001000'])
+
+        # header only response
+        result = census_stats.generate_geoid(pd.DataFrame(columns=columns))
+        self.assertEqual(result.columns.to_list(), ['P1_001N', 'GEOID'])
+        self.assertTrue(result.empty)
+
+    def test_failed_block_stats_not_cached(self):
+        census_stats.get_decennial_block_stats.cache_clear()
+        rows = [['P1_001N', 'state', 'county', 'tract', 'block'],
+                ['12', '35', '001', '000100', '1000']]
+        responses = [
+            mock.Mock(status_code=500, content=b''),
+            mock.Mock(
+                status_code=200,
+                content=json.dumps(rows).encode(),
+                json=mock.Mock(return_value=rows)),
+            ]
+        block_df = gpd.GeoDataFrame(
+            {'GEOID': ['350010001001000']},
+            geometry=[box(0, 0, 1, 1)])
+
+        with mock.patch.object(
+                census_stats.requests, 'request',
+                side_effect=responses) as request:
+            failed = gc.join_decennial_block_stats(block_df, 'key')
+            joined = gc.join_decennial_block_stats(block_df, 'key')
+            self.assertEqual(request.call_count, 2)
+
+        census_stats.get_decennial_block_stats.cache_clear()
+
+        self.assertTrue(failed['P1_001N'].isna().all())
+        self.assertEqual(joined['P1_001N'].to_list(), [12])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import os
+import pathlib
+import tempfile
+import unittest
+
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box, LineString, Point
+
+import geocricket as gc
+
+try:
+    import pyarrow
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+def make_census_df():
+    return gpd.GeoDataFrame(
+        {'GEOID': ['35001000100', '35001000200']},
+        geometry=[box(-107, 35, -106.5, 35.5), box(-106.5, 35, -106, 35.5)],
+        crs=4326)
+
+
+class TestCsvOut(unittest.TestCase):
+    def test_facilities_tagged_with_geoid(self):
+        hospitals = gpd.GeoDataFrame(
+            {'Sector': ['Hospitals'] * 3},
+            geometry=[Point(-106.8, 35.2), Point(-106.2, 35.2),
+                      Point(-100, 40)],
+            crs=4326)
+        schools = gpd.GeoDataFrame(
+            {'Sector': ['Schools']},
+            geometry=[Point(-106.7, 35.1)],
+            crs=4326).to_crs(3857)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fps = []
+            for name, gdf in [('hospitals', hospitals), ('schools', schools)]:
+                fp = os.path.join(temp_dir, f'{name}.gpkg')
+                gdf.to_file(fp, driver='GPKG')
+                fps.append(fp)
+
+            gc.export_facilities_to_csv(
+                fps,
+                output_path=pathlib.Path(temp_dir),
+                census_fp=make_census_df(),
+                sector_counts=True)
+
+            facility_df = pd.read_csv(
+                os.path.join(temp_dir, 'facility_data.csv'), dtype=str)
+            count_df = pd.read_csv(
+                os.path.join(temp_dir, 'census_facility_counts.csv'),
+                dtype={'GEOID': str})
+
+        self.assertEqual(
+            facility_df['GEOID'].fillna('').to_list(),
+            ['35001000100', '35001000200', '', '35001000100'])
+
+        count_df = count_df.set_index('GEOID')
+        self.assertEqual(count_df.loc['35001000100', 'Hospitals'], 1)
+        self.assertEqual(count_df.loc['35001000100', 'Schools'], 1)
+        self.assertEqual(count_df.loc['35001000200', 'Schools'], 0)
+
+    def test_line_and_polygon_locations(self):
+        lines = gpd.GeoDataFrame(
+            {'Sector': ['Transmission']},
+            geometry=[LineString([(-106.9, 35.2), (-106.7, 35.2)])],
+            crs=4326).to_crs(3857)
+        polygons = gpd.GeoDataFrame(
+            {'Sector': ['Parks', 'Parks']},
+            geometry=[box(-106.4, 35.1, -106.2, 35.3),
+                      box(-100, 40, -99, 41)],
+            crs=4326)
+
+        facility_df = gc.export_facilities_to_csv(
+            [lines, None, polygons],
+            export_csv=False,
+            census_fp=make_census_df())
+
+        self.assertEqual(
+            facility_df['sector'].to_list(),
+            ['Transmission', 'Parks', 'Parks'])
+        self.assertAlmostEqual(facility_df['longitude'].iloc[0], -106.8)
+        self.assertAlmostEqual(facility_df['latitude'].iloc[0], 35.2)
+        self.assertAlmostEqual(facility_df['longitude'].iloc[1], -106.3)
+        self.assertEqual(
+            facility_df['GEOID'].to_list(),
+            ['35001000100', '35001000200', None])
+
+    def test_compressed_chunked_csv(self):
+        layers = [
+            gpd.GeoDataFrame(
+                {'Sector': [sector] * 3,
+                 'rencat_id': [f'{sector}_{x}' for x in range(3)]},
+                geometry=[Point(-106.8, 35.2)] * 3,
+                crs=4326)
+            for sector in ['Hospitals', 'Schools']]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            gc.export_facilities_to_csv(
+                layers,
+                output_path=pathlib.Path(temp_dir),
+                compression='gzip',
+                chunk_size=2)
+            csv_fp = os.path.join(temp_dir, 'facility_data.csv.gz')
+            facility_df = pd.read_csv(csv_fp)
+
+        self.assertEqual(len(facility_df), 6)
+        self.assertEqual(
+            facility_df['rencat_id'].to_list()[2:4],
+            ['Hospitals_2', 'Schools_0'])
+
+    @unittest.skipUnless(HAS_PYARROW, 'requires pyarrow')
+    def test_columnar_twins(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            gc.export_census_geography_to_csv(
+                make_census_df(),
+                output_path=pathlib.Path(temp_dir),
+                columnar_formats=('parquet', 'feather'))
+            parquet_df = pd.read_parquet(
+                os.path.join(temp_dir, 'census_geometry_and_stats.parquet'))
+            feather_df = pd.read_feather(
+                os.path.join(temp_dir, 'census_geometry_and_stats.feather'))
+
+        for df in [parquet_df, feather_df]:
+            self.assertEqual(
+                df['GEOID'].to_list(), ['35001000100', '35001000200'])
+            self.assertEqual(df['longitude'].dtype, 'float64')
+
+    def test_cross_source_dedupe(self):
+        hifld = gpd.GeoDataFrame(
+            {'rencat_id': ['hospitals_0', 'hospitals_1'],
+             'NAME': ['St. Joseph Medical Center', 'Lovelace Hospital']},
+            geometry=[Point(-106.60, 35.10), Point(-106.50, 35.10)],
+            crs=4326)
+        usgs = gpd.GeoDataFrame(
+            {'rencat_id': ['usgs_0', 'usgs_1', 'usgs_2'],
+             'name': ['Saint Joseph Medical Ctr', 'Lovelace Hospital',
+                      'Unrelated Clinic']},
+            # 1st within ~100 m, 2nd ~2 km away, 3rd close with other name
+            geometry=[Point(-106.601, 35.1003), Point(-106.48, 35.10),
+                      Point(-106.6005, 35.10)],
+            crs=4326).to_crs(3857)
+
+        result = gc.find_duplicate_facilities(
+            {'HIFLD_Hospitals': hifld, 'USGS_Hospitals': usgs})
+
+        self.assertEqual(result['rencat_id'].to_list(), ['hospitals_0'])
+        self.assertEqual(result['merged_rencat_id'].to_list(), ['usgs_0'])
+        self.assertEqual(result['merged_source'].to_list(), ['USGS_Hospitals'])
+        self.assertLess(result['distance'].iloc[0], 250)
+
+    def test_dedupe_geodataframe_layers(self):
+        hifld = gpd.GeoDataFrame(
+            {'Sector': ['Hospitals'],
+             'rencat_id': ['hospitals_0'],
+             'NAME': ['St. Joseph Medical Center']},
+            geometry=[Point(-106.60, 35.10)],
+            crs=4326)
+        usgs = gpd.GeoDataFrame(
+            {'Sector': ['USGS_Hospitals_Medical_Centers'],
+             'rencat_id': ['usgs_hospitals_medical_centers_0'],
+             'name': ['Saint Joseph Medical Ctr']},
+            geometry=[Point(-106.601, 35.1003)],
+            crs=4326)
+
+        result = gc.export_facilities_to_csv(
+            [hifld],
+            export_csv=False,
+            dedupe_groups=gc.dedupe_dict())
+        self.assertEqual(result['rencat_id'].to_list(), ['hospitals_0'])
+
+        result = gc.export_facilities_to_csv(
+            [hifld, usgs],
+            export_csv=False,
+            dedupe_groups=gc.dedupe_dict())
+        self.assertEqual(result['rencat_id'].to_list(), ['hospitals_0'])
+        self.assertEqual(
+            result['merged_rencat_ids'].to_list(),
+            ['usgs_hospitals_medical_centers_0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+import geopandas as gpd
+from shapely.geometry import box, LineString, Point
+
+import geocricket as gc
+from geocricket import flatgeobuf
+
+
+def make_layer_df():
+    return gpd.GeoDataFrame(
+        {'rencat_id': [f'L_{ndx}' for ndx in range(100)] + ['L_none']},
+        geometry=[
+            LineString([(x, 0), (x + 0.5, 1)]) for x in range(100)] + [None],
+        crs=4326)
+
+
+class TestFlatGeobuf(unittest.TestCase):
+    def test_shp_to_fgb(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_dir = pathlib.Path(temp_dir)
+            shp_fp = temp_dir / 'lines.shp'
+            make_layer_df().to_file(shp_fp)
+
+            fgb_fp = gc.shp_to_fgb(
+                shp_fp, out_path=temp_dir / 'fgb', remove_old=True)
+
+            self.assertEqual(fgb_fp, temp_dir / 'fgb' / 'lines.fgb')
+            self.assertFalse(shp_fp.exists())
+            # feature without geometry is not indexed
+            self.assertEqual(len(gpd.read_file(fgb_fp)), 100)
+
+    def test_read_bbox(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fgb_fp = gc.write_flatgeobuf(
+                make_layer_df(),
+                pathlib.Path(temp_dir) / 'lines.fgb')
+
+            result = gc.read_flatgeobuf_bbox(fgb_fp, (9.9, 0, 12.1, 1))
+            self.assertEqual(
+                sorted(result['rencat_id']), ['L_10', 'L_11', 'L_12'])
+
+            # bbox in another crs
+            bounds = gpd.GeoSeries(
+                [box(9.9, 0, 12.1, 1)], crs=4326).to_crs(3857)
+            result = gc.read_flatgeobuf_bbox(
+                fgb_fp, tuple(bounds.total_bounds), crs=3857)
+            self.assertEqual(
+                sorted(result['rencat_id']), ['L_10', 'L_11', 'L_12'])
+
+    def test_empty_layer(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            empty_df = gpd.GeoDataFrame(
+                {'rencat_id': ['P_0']}, geometry=[None], crs=4326)
+            fgb_fp = gc.write_flatgeobuf(
+                empty_df, pathlib.Path(temp_dir) / 'empty.fgb')
+            self.assertIsNone(fgb_fp)
+
+    def test_mixed_geometry(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            mixed_df = gpd.GeoDataFrame(
+                {'rencat_id': ['P_0', 'A_0']},
+                geometry=[Point(0, 0), box(1, 1, 2, 2)],
+                crs=4326)
+            fgb_fp = gc.write_flatgeobuf(
+                mixed_df, pathlib.Path(temp_dir) / 'mixed.fgb')
+            result = gc.read_flatgeobuf_bbox(fgb_fp, (0.5, 0.5, 3, 3))
+            self.assertEqual(list(result['rencat_id']), ['A_0'])
+
+    @unittest.skipUnless(flatgeobuf.HAS_PYOGRIO, 'pyogrio not installed')
+    def test_writer_appends_chunks_columnar(self):
+        lines = make_layer_df()
+        areas = gpd.GeoDataFrame(
+            {'rencat_id': ['A_0']}, geometry=[box(20, 0, 21, 1)], crs=4326)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fgb_fp = pathlib.Path(temp_dir) / 'chunks.fgb'
+            with mock.patch.object(
+                    gpd.GeoDataFrame, 'iterfeatures') as iterfeatures:
+                with flatgeobuf.FlatGeobufWriter(fgb_fp) as writer:
+                    for chunk in [lines[:50], lines[50:], areas]:
+                        writer.write(chunk)
+            iterfeatures.assert_not_called()
+
+            self.assertEqual(writer.n_written, 101)
+            result = gc.read_flatgeobuf_bbox(fgb_fp, (19.9, 0, 20.2, 1))
+
+        self.assertEqual(
+            sorted(result['rencat_id']), ['A_0', 'L_20'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,15 @@ import os
 os.environ['RESTAPI_USE_ARCPY'] = 'FALSE'
 
 from test_geohandling import TestGeoHandling
+from test_census_stats import TestCensusStats
+from test_rest_paging import TestRestPaging
+from test_csv_out import TestCsvOut
+from test_transit_land import TestTransitLand
+from test_kml import TestKml
+from test_geoparquet import TestGeoParquet
+from test_flatgeobuf import TestFlatGeobuf
+from test_gpkg import TestGpkg
+from test_gis_io import TestGisIo
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,134 @@
+import json
+import pathlib
+import tempfile
+import unittest
+
+import geopandas as gpd
+from shapely.geometry import box, Point
+
+from geocricket.geoparquet import GeoParquetWriter
+from geocricket.geoparquet import make_geo_metadata
+import geocricket as gc
+
+try:
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+def make_facility_df():
+    return gpd.GeoDataFrame(
+        {
+            'Sector': ['Hospitals', 'Schools', 'Hospitals'],
+            'rencat_id': ['H_0', 'S_0', 'H_1'],
+        },
+        geometry=[Point(-106.8, 35.2), Point(-106.2, 35.2),
+                  box(-106.5, 35, -106, 35.5)],
+        crs=4326)
+
+
+class TestGeoParquet(unittest.TestCase):
+    def test_geo_metadata(self):
+        meta = make_geo_metadata(make_facility_df())
+        column = meta['columns']['geometry']
+
+        self.assertEqual(meta['primary_column'], 'geometry')
+        self.assertEqual(column['encoding'], 'WKB')
+        self.assertEqual(column['geometry_types'], ['Point', 'Polygon'])
+        self.assertEqual(column['bbox'], [-106.8, 35.0, -106.0, 35.5])
+        self.assertEqual(column['covering']['bbox']['xmin'], ['bbox', 'xmin'])
+        self.assertEqual(column['crs']['id']['code'], 4326)
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow not installed')
+    def test_write_geoparquet(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            out_fp = gc.write_geoparquet(
+                make_facility_df(),
+                pathlib.Path(temp_dir) / 'facilities.parquet',
+                row_group_size=2)
+
+            meta = pq.read_metadata(out_fp)
+            self.assertEqual(meta.num_rows, 3)
+            self.assertEqual(meta.num_row_groups, 2)
+            geo = json.loads(meta.schema.to_arrow_schema().metadata[b'geo'])
+            self.assertEqual(geo['primary_column'], 'geometry')
+
+            result = gpd.read_parquet(out_fp)
+            self.assertEqual(sorted(result['rencat_id']), ['H_0', 'H_1', 'S_0'])
+            self.assertEqual(result.crs.to_epsg(), 4326)
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow not installed')
+    def test_write_geoparquet_dataset(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            written = gc.write_geoparquet_dataset(
+                make_facility_df(),
+                pathlib.Path(temp_dir) / 'facilities',
+                ['Sector'])
+
+            self.assertEqual(
+                [fp.parent.name for fp in written],
+                ['Sector=Hospitals', 'Sector=Schools'])
+            hospitals = gpd.read_parquet(written[0])
+            self.assertEqual(len(hospitals), 2)
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow not installed')
+    def test_dataset_round_trip(self):
+        facility_df = make_facility_df().assign(
+            BEDS=[10, None, 20],
+            GRADES=[None, 'K-5', None],
+            NOTES=None)
+        facility_df.loc[2, 'Sector'] = 'Health/Medical'
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            out_dir = pathlib.Path(temp_dir) / 'facilities'
+            written = gc.write_geoparquet_dataset(
+                facility_df, out_dir, ['Sector'])
+
+            # values are escaped, not nested directories
+            self.assertEqual(
+                sorted(fp.parent.name for fp in written),
+                ['Sector=Health%2FMedical', 'Sector=Hospitals',
+                 'Sector=Schools'])
+            self.assertNotIn(
+                'Sector', pq.read_schema(written[0]).names)
+
+            result = gpd.read_parquet(out_dir)
+
+        result = result.assign(Sector=result['Sector'].astype(str))
+        result = result.sort_values('rencat_id').reset_index(drop=True)
+
+        self.assertEqual(
+            sorted(result.columns),
+            sorted([*facility_df.columns, 'bbox']))
+        self.assertEqual(result['rencat_id'].to_list(), ['H_0', 'H_1', 'S_0'])
+        self.assertEqual(
+            result['Sector'].to_list(),
+            ['Hospitals', 'Health/Medical', 'Schools'])
+        self.assertEqual(result['GRADES'].to_list(), [None, None, 'K-5'])
+        self.assertEqual(result['BEDS'].fillna(0).to_list(), [10, 20, 0])
+        self.assertTrue(result['NOTES'].isna().all())
+        self.assertTrue(result.geometry.geom_equals(
+            facility_df.sort_values('rencat_id').geometry.reset_index(
+                drop=True)).all())
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow not installed')
+    def test_writer_null_first_chunk(self):
+        first = make_facility_df().assign(NAME=None)
+        second = make_facility_df().assign(NAME=['a', 'b', 'c'])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            out_fp = pathlib.Path(temp_dir) / 'facilities.parquet'
+            with GeoParquetWriter(out_fp, sort=False) as writer:
+                writer.write(first)
+                writer.write(second)
+
+            result = gpd.read_parquet(out_fp)
+
+        self.assertEqual(len(result), 6)
+        self.assertEqual(
+            result['NAME'].to_list(), [None, None, None, 'a', 'b', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import pathlib
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import geopandas as gpd
+from shapely.geometry import box, Point
+
+import geocricket as gc
+from geocricket.gis_io import get_driver
+from geocricket.gis_io import HAS_PYOGRIO
+
+
+def make_points_df():
+    return gpd.GeoDataFrame(
+        {
+            'rencat_id': [f'P_{ndx}' for ndx in range(10)],
+            'Sector': ['Hospitals', 'Schools'] * 5,
+        },
+        geometry=[Point(x, x) for x in range(10)],
+        crs=4326)
+
+
+class TestGisIo(unittest.TestCase):
+    def test_get_driver(self):
+        self.assertEqual(get_driver('a/b.GPKG'), 'GPKG')
+        self.assertEqual(get_driver('b.shp'), 'ESRI Shapefile')
+        self.assertEqual(get_driver('b.gpkg', driver='FlatGeobuf'),
+                         'FlatGeobuf')
+        self.assertIsNone(get_driver('b.unknown'))
+
+    def check_round_trip(self, engine):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for suffix in ['.gpkg', '.shp', '.fgb']:
+                fp = pathlib.Path(temp_dir) / f'{engine}{suffix}'
+                gc.write_gdf(make_points_df(), fp, engine=engine)
+                # appended features
+                gc.write_gdf(
+                    make_points_df().iloc[:2], fp, append=True, engine=engine)
+
+                result = gc.read_gdf(fp, engine=engine)
+                self.assertEqual(len(result), 12)
+                self.assertEqual(result.crs.to_epsg(), 4326)
+
+                # column, bbox and attribute pushdown
+                result = gc.read_gdf(
+                    fp,
+                    columns=['rencat_id'],
+                    bbox=(1.5, 1.5, 5.5, 5.5),
+                    where="Sector = 'Schools'",
+                    engine=engine)
+                self.assertEqual(
+                    list(result.columns), ['rencat_id', 'geometry'])
+                self.assertEqual(
+                    sorted(result['rencat_id']), ['P_3', 'P_5'])
+
+                # bbox in another crs
+                bounds = gpd.GeoSeries(
+                    [box(1.5, 1.5, 5.5, 5.5)], crs=4326).to_crs(3857)
+                result = gc.read_gdf(
+                    fp,
+                    bbox=tuple(bounds.total_bounds),
+                    bbox_crs=3857,
+                    engine=engine)
+                self.assertEqual(len(result), 4)
+
+    def test_fiona_round_trip(self):
+        self.check_round_trip('fiona')
+
+    @unittest.skipUnless(HAS_PYOGRIO, 'pyogrio not installed')
+    def test_pyogrio_round_trip(self):
+        self.check_round_trip('pyogrio')
+
+    @unittest.skipUnless(HAS_PYOGRIO, 'pyogrio not installed')
+    def test_sqlite_pragmas_restored(self):
+        import pyogrio
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            gc.write_gdf(
+                make_points_df(),
+                pathlib.Path(temp_dir) / 'points.gpkg',
+                engine='pyogrio')
+        self.assertIsNone(pyogrio.get_gdal_config_option('OGR_SQLITE_PRAGMA'))
+
+    @unittest.skipUnless(HAS_PYOGRIO, 'pyogrio not installed')
+    def test_sqlite_pragmas_restored_from_threads(self):
+        import pyogrio
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fps = [pathlib.Path(temp_dir) / f'points_{ndx}.gpkg'
+                   for ndx in range(8)]
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                written = list(executor.map(
+                    lambda fp: gc.write_gdf(
+                        make_points_df(), fp, engine='pyogrio'),
+                    fps))
+            counts = [len(gc.read_gdf(fp)) for fp in written]
+
+        self.assertEqual(counts, [10] * 8)
+        self.assertIsNone(pyogrio.get_gdal_config_option('OGR_SQLITE_PRAGMA'))
+
+
+if __name__ == '__main__':
+    unittest.main()
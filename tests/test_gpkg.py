@@ -0,0 +1,54 @@
+import pathlib
+import sqlite3
+import tempfile
+import unittest
+
+import fiona
+import geopandas as gpd
+from shapely.geometry import box, Point
+
+import geocricket as gc
+
+
+class TestGpkg(unittest.TestCase):
+    def test_multi_layer_gpkg(self):
+        points = gpd.GeoDataFrame(
+            {'rencat_id': ['P_0', 'P_1']},
+            geometry=[Point(0, 0), Point(1, 1)],
+            crs=4326)
+        polygons = gpd.GeoDataFrame(
+            {'rencat_id': ['A_0']},
+            geometry=[box(0, 0, 1, 1)],
+            crs=4326)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            gpkg_fp = pathlib.Path(temp_dir) / 'collect.gpkg'
+            gc.write_gpkg_layer(points, gpkg_fp, 'points')
+            gc.write_gpkg_layer(polygons, gpkg_fp, 'polygons')
+            # rewritten layers are replaced
+            gc.write_gpkg_layer(points.iloc[:1], gpkg_fp, 'points')
+
+            self.assertEqual(
+                sorted(fiona.listlayers(gpkg_fp)), ['points', 'polygons'])
+            self.assertEqual(
+                list(gpd.read_file(gpkg_fp, layer='points')['rencat_id']),
+                ['P_0'])
+
+            with sqlite3.connect(gpkg_fp) as con:
+                rtrees = con.execute(
+                    "SELECT table_name FROM gpkg_extensions "
+                    "WHERE extension_name = 'gpkg_rtree_index'").fetchall()
+            self.assertEqual(sorted(rtrees), [('points',), ('polygons',)])
+
+    def test_layer_source(self):
+        self.assertEqual(
+            gc.combined.get_layer_source({'shp': 'a.shp', 'gpkg': 'a.gpkg'}),
+            'a.gpkg')
+        self.assertEqual(
+            gc.combined.get_layer_source(
+                {'shp': 'a.shp', 'gpkg': 'collect.gpkg', 'gpkg_layer': 'a'}),
+            'a.shp')
+
+
+if __name__ == '__main__':
+    unittest.main()
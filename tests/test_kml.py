@@ -0,0 +1,340 @@
+import os
+import tempfile
+import unittest
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import geopandas as gpd
+from shapely.geometry import LineString, MultiPolygon, Point, Polygon
+
+import geocricket as gc
+
+KML_NS = {'kml': 'http://www.opengis.net/kml/2.2'}
+
+
+def make_points_df():
+    return gpd.GeoDataFrame(
+        {'NAME': ['a<b', 'c', 'd'], 'grp': ['y', 'x', 'y']},
+        geometry=[Point(-106.5, 35.1), Point(-106.6, 35.2),
+                  Point(-106.7, 35.3)],
+        crs=4326)
+
+
+class TestKml(unittest.TestCase):
+    def test_descriptions_match_row_markup(self):
+        points = make_points_df()
+        points['count'] = [1, 2, 3]
+
+        descriptions = gc.make_descriptions(points)
+
+        for ndx, (_, row) in enumerate(points.iterrows()):
+            expected = """<table>"""
+            for attr, value in zip(row.index, row.values):
+                if attr == 'geometry':
+                    continue
+                expected += f"""
+            <tr style='background-color:#9DBBE0'> <th>{attr}</th> </tr>
+            <tr style='background-color:#ffffff'> <td>{value}</td>
+            """
+            expected += """</table>"""
+            self.assertEqual(descriptions[ndx], expected)
+
+    def test_stream_kml_folders(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            kml_fp = gc.convert_to_kml(
+                make_points_df(),
+                groupby_field='grp',
+                output_name='pts',
+                output_path=temp_dir)
+            root = ET.parse(kml_fp).getroot()
+
+        folders = root.findall('.//kml:Folder/kml:Folder', KML_NS)
+        self.assertEqual(
+            [x.find('kml:name', KML_NS).text for x in folders], ['x', 'y'])
+
+        placemarks = folders[1].findall('kml:Placemark', KML_NS)
+        self.assertEqual(
+            [x.find('kml:name', KML_NS).text for x in placemarks],
+            ['0', '2'])
+
+        description = placemarks[0].find('kml:description', KML_NS).text
+        self.assertIn('<th>NAME</th>', description)
+        self.assertIn('<td>a<b</td>', description)
+
+        coords = placemarks[0].find('.//kml:coordinates', KML_NS).text
+        self.assertEqual(coords, '-106.5,35.1')
+
+        # one shared style map per folder, every styleUrl resolves
+        style_maps = root.findall('.//kml:StyleMap', KML_NS)
+        self.assertEqual(len(style_maps), 2)
+        ids = {x.get('id') for x in root.iter() if x.get('id')}
+        for style_url in root.iterfind('.//kml:styleUrl', KML_NS):
+            self.assertIn(style_url.text[1:], ids)
+
+    def test_random_colors_are_kml_colors(self):
+        points = gpd.GeoDataFrame(
+            {'grp': [str(x) for x in range(50)]},
+            geometry=[Point(-106.5, 35.1)] * 50,
+            crs=4326)
+
+        # seed previously chose the simplekml.Color.rgb converter
+        np.random.seed(0)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            kml_fp = gc.convert_to_kml(
+                points,
+                groupby_field='grp',
+                output_name='pts',
+                output_path=temp_dir)
+            root = ET.parse(kml_fp).getroot()
+
+        colors = [x.text for x in root.iterfind('.//kml:color', KML_NS)]
+        self.assertTrue(all(
+            len(x) == 8 and int(x, 16) >= 0 for x in colors))
+
+    def test_stream_kmz(self):
+        polygons = gpd.GeoDataFrame(
+            {'NAME': ['a']},
+            geometry=[Polygon([(0, 0), (1, 0), (1, 1)])],
+            crs=4326)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            kmz_fp = gc.convert_to_kml(
+                polygons,
+                output_name='poly',
+                output_path=temp_dir,
+                export_as_kmz=True)
+            self.assertEqual(os.path.basename(kmz_fp), 'poly.kmz')
+
+            with zipfile.ZipFile(kmz_fp) as kmz:
+                root = ET.fromstring(kmz.read('doc.kml'))
+
+        rings = root.findall('.//kml:Polygon//kml:coordinates', KML_NS)
+        self.assertEqual(len(rings), 1)
+        self.assertEqual(len(rings[0].text.split()), 4)
+
+    def test_multi_geometry_with_holes(self):
+        outer = [(0, 0), (4, 0), (4, 4), (0, 4)]
+        hole = [(1, 1), (2, 1), (2, 2), (1, 2)]
+        polygons = gpd.GeoDataFrame(
+            {'NAME': ['multi', 'single']},
+            geometry=[
+                MultiPolygon([
+                    Polygon(outer, [hole]),
+                    Polygon([(5, 5), (6, 5), (6, 6)])]),
+                Polygon(outer)],
+            crs=4326)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            kml_fp = gc.convert_to_kml(
+                polygons,
+                id_field='NAME',
+                output_name='poly',
+                output_path=temp_dir)
+            root = ET.parse(kml_fp).getroot()
+
+        placemarks = root.findall('.//kml:Placemark', KML_NS)
+        self.assertEqual(len(placemarks), 2)
+        self.assertEqual(
+            placemarks[0].find('kml:name', KML_NS).text, 'multi')
+
+        multi = placemarks[0].find('kml:MultiGeometry', KML_NS)
+        self.assertEqual(len(multi.findall('kml:Polygon', KML_NS)), 2)
+        self.assertEqual(
+            len(multi.findall('.//kml:innerBoundaryIs', KML_NS)), 1)
+        self.assertIsNone(placemarks[1].find('kml:MultiGeometry', KML_NS))
+
+    def test_super_overlay(self):
+        n_points = 50
+        points = gpd.GeoDataFrame(
+            {'NAME': [f'p{x}' for x in range(n_points)]},
+            geometry=[Point(-107 + x / 10, 35 + (x % 7) / 10)
+                      for x in range(n_points)],
+            crs=4326)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            kmz_fp = gc.convert_to_kml(
+                points,
+                output_name='overlay',
+                output_path=temp_dir,
+                super_overlay=True,
+                max_features_per_tile=10,
+                max_workers=2)
+
+            with zipfile.ZipFile(kmz_fp) as kmz:
+                names = kmz.namelist()
+                docs = {x: ET.fromstring(kmz.read(x))
+                        for x in names if x.endswith('.kml')}
+
+        self.assertEqual(names[0], 'doc.kml')
+        self.assertGreater(len(names), 1)
+
+        # every feature is written once, every link resolves
+        placemark_names = [
+            x.text for doc in docs.values()
+            for x in doc.iterfind('.//kml:Placemark/kml:name', KML_NS)]
+        self.assertEqual(
+            sorted(placemark_names), sorted(map(str, range(n_points))))
+
+        for name, doc in docs.items():
+            self.assertIsNotNone(doc.find('.//kml:Region/kml:Lod', KML_NS))
+            for href in doc.iterfind('.//kml:NetworkLink//kml:href', KML_NS):
+                linked = os.path.normpath(
+                    os.path.join(os.path.dirname(name), href.text))
+                self.assertIn(linked, docs)
+
+    def test_super_overlay_full_detail(self):
+        # large detailed circles end up generalized in coarse tiles
+        polygons = gpd.GeoDataFrame(
+            {'NAME': [f'c{x}' for x in range(40)]},
+            geometry=[
+                Point(-107 + (x % 8) / 4, 35 + (x // 8) / 4).buffer(
+                    0.2 if x < 4 else 0.01, quad_segs=64)
+                for x in range(40)],
+            crs=4326)
+        n_coords = {
+            str(ndx): len(geom.exterior.coords)
+            for ndx, geom in enumerate(polygons.geometry)}
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            kmz_fp = gc.convert_to_kml(
+                polygons,
+                output_name='overlay',
+                output_path=temp_dir,
+                super_overlay=True,
+                max_features_per_tile=4,
+                max_workers=1,
+                precision=None)
+
+            with zipfile.ZipFile(kmz_fp) as kmz:
+                docs = {x: ET.fromstring(kmz.read(x))
+                        for x in kmz.namelist() if x.endswith('.kml')}
+
+        self.assertTrue(any(x.endswith('_detail.kml') for x in docs))
+
+        full_detail = []
+        for name, doc in docs.items():
+            for folder in doc.iterfind('.//kml:Folder', KML_NS):
+                max_lod = folder.find(
+                    'kml:Region/kml:Lod/kml:maxLodPixels', KML_NS)
+                for placemark in folder.iterfind('kml:Placemark', KML_NS):
+                    if max_lod is not None:
+                        # generalized copy, replaced when zoomed in
+                        self.assertEqual(max_lod.text, '256')
+                        continue
+                    coords = placemark.find(
+                        './/kml:outerBoundaryIs//kml:coordinates', KML_NS)
+                    feature = placemark.find('kml:name', KML_NS).text
+                    full_detail.append(feature)
+                    self.assertEqual(
+                        len(coords.text.split()), n_coords[feature])
+
+            for href in doc.iterfind('.//kml:NetworkLink//kml:href', KML_NS):
+                linked = os.path.normpath(
+                    os.path.join(os.path.dirname(name), href.text))
+                self.assertIn(linked, docs)
+
+        # every feature is shown in full detail exactly once
+        self.assertEqual(sorted(full_detail), sorted(n_coords))
+
+    def test_precision_and_simplify(self):
+        # dense line with vertices off by less than a centimeter
+        line = LineString(
+            [(-106 + x / 1000, 35 + 1e-9 * (x % 2)) for x in range(101)])
+        lines = gpd.GeoDataFrame(
+            {'NAME': ['line']}, geometry=[line], crs=4326).to_crs(3857)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            full_fp = gc.convert_to_kml(
+                lines, output_name='full', output_path=temp_dir,
+                precision=None)
+            small_fp = gc.convert_to_kml(
+                lines, output_name='small', output_path=temp_dir,
+                precision=6, simplify_tolerance=1)
+
+            full_size = os.path.getsize(full_fp)
+            small_size = os.path.getsize(small_fp)
+            root = ET.parse(small_fp).getroot()
+
+        coords = root.find('.//kml:coordinates', KML_NS).text.split()
+        self.assertLess(len(coords), 10)
+        self.assertEqual(coords[0], '-106.0,35.0')
+        self.assertEqual(coords[-1], '-105.9,35.0')
+        self.assertLess(small_size, full_size / 2)
+
+    def test_rounding_keeps_sub_precision_polygons(self):
+        polygons = gpd.GeoDataFrame(
+            {'NAME': ['tiny', 'sliver', 'large']},
+            geometry=[
+                Polygon([(-106, 35), (-106 + 3e-7, 35),
+                         (-106 + 3e-7, 35 + 3e-7), (-106, 35 + 3e-7)]),
+                Polygon([(-106, 35), (-105, 35), (-105, 35 + 2e-7)]),
+                Polygon([(-106.1234567, 35), (-105, 35), (-105, 36)])],
+            crs=4326)
+
+        result = gc.kml.round_coordinates(polygons, precision=6)
+
+        self.assertTrue(result.geometry.is_valid.all())
+        self.assertFalse(result.geometry.is_empty.any())
+        self.assertTrue(result.geometry[:2].geom_equals_exact(
+            polygons.geometry[:2], 0).all())
+        self.assertEqual(result.geometry[2].exterior.coords[0][0], -106.123457)
+
+    def test_merged_kmz(self):
+        hospitals = make_points_df().to_crs(3857)
+        lines = gpd.GeoDataFrame(
+            {'NAME': ['line']},
+            geometry=[LineString([(-106, 35), (-105, 36)])],
+            crs=4326)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            hospital_fp = os.path.join(temp_dir, 'hospitals.gpkg')
+            hospitals.to_file(hospital_fp, driver='GPKG')
+            layers = {
+                'hospitals': {'input_file': hospital_fp, 'id_field': 'NAME',
+                              'sector': 'Health'},
+                'lines': {'input_file': lines},
+                'clinics': {'input_file': hospitals, 'sector': 'Health'},
+                }
+
+            # a layer that fails to convert does not stop the others
+            kml_paths = gc.export_layers_to_kml(
+                {'missing': {'input_file': 'missing.gpkg'},
+                 'hospitals': layers['hospitals']},
+                temp_dir,
+                max_workers=2)
+            self.assertIsNone(kml_paths['missing'])
+            self.assertTrue(os.path.exists(kml_paths['hospitals']))
+
+            kmz_fp = gc.export_merged_kmz(
+                layers, os.path.join(temp_dir, 'collect.kmz'), max_workers=2)
+            with zipfile.ZipFile(kmz_fp) as kmz:
+                names = kmz.namelist()
+                root = ET.fromstring(kmz.read('doc.kml'))
+                icon = kmz.read('files/icon.png')
+
+        self.assertEqual(names[0], 'doc.kml')
+        self.assertTrue(icon.startswith(b'\x89PNG'))
+
+        # one folder per sector, holding its layer folders in order
+        sectors = root.findall('kml:Document/kml:Folder', KML_NS)
+        self.assertEqual(
+            [x.find('kml:name', KML_NS).text for x in sectors],
+            ['Health', 'lines'])
+        folders = sectors[0].findall('kml:Folder', KML_NS)
+        self.assertEqual(
+            [x.find('kml:name', KML_NS).text for x in folders],
+            ['hospitals', 'clinics'])
+        self.assertEqual(
+            len(folders[0].findall('kml:Placemark', KML_NS)), 3)
+
+        # no remote icons, every styleUrl resolves
+        hrefs = [x.text for x in root.iterfind('.//kml:href', KML_NS)]
+        self.assertEqual(set(hrefs), {'files/icon.png'})
+        ids = {x.get('id') for x in root.iter() if x.get('id')}
+        for style_url in root.iterfind('.//kml:styleUrl', KML_NS):
+            self.assertIn(style_url.text[1:], ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import geopandas as gpd
+import restapi
+import shapely
+from shapely.geometry import box
+
+import geocricket as gc
+from geocricket import rest_paging
+
+try:
+    import pyarrow
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+# fake layer of 20 x 20 blocks, 100 m on a side
+BLOCKS = [box(x, y, x + 100, y + 100)
+          for x in range(0, 2000, 100) for y in range(0, 2000, 100)]
+
+
+def fake_query_features_page(layer_url, envelope, offset=0, page_size=2000,
+                             **kwargs):
+    """
+    Serve pages of BLOCKS that intersect envelope as geojson
+    """
+    query_box = box(*envelope)
+    found = [ndx for ndx, geo in enumerate(BLOCKS)
+             if geo.intersects(query_box)]
+    page = found[offset:offset + page_size]
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature',
+             'properties': {'GEOID': f'{ndx:015d}'},
+             'geometry': shapely.geometry.mapping(BLOCKS[ndx])}
+            for ndx in page],
+        }
+
+
+class TestRestPaging(unittest.TestCase):
+    @mock.patch.object(rest_paging, 'query_features_page',
+                       fake_query_features_page)
+    def test_tiled_pages_yield_each_feature_once(self):
+        # boundary cuts diagonally through the layer
+        boundary = shapely.Polygon([(0, 0), (1950, 0), (0, 1950)])
+
+        pages = rest_paging.iter_tiled_feature_pages(
+            'fake_url',
+            boundary,
+            tile_size=450,
+            page_size=7,
+            max_workers=3)
+
+        geoids = np.concatenate([x['GEOID'].to_numpy() for x in pages])
+        expected = [ndx for ndx, geo in enumerate(BLOCKS)
+                    if geo.intersects(boundary)]
+
+        self.assertEqual(len(geoids), len(set(geoids)))
+        self.assertEqual(sorted(int(x) for x in geoids), expected)
+
+    def test_early_stop_skips_queued_tiles(self):
+        query = mock.Mock(side_effect=fake_query_features_page)
+        boundary = box(0, 0, 2000, 2000)
+
+        with mock.patch.object(rest_paging, 'query_features_page', query):
+            pages = rest_paging.iter_tiled_feature_pages(
+                'fake_url', boundary, tile_size=100, page_size=10,
+                max_workers=2)
+            next(pages)
+            pages.close()
+
+        # 400 tiles, only those already started are queried
+        self.assertLess(query.call_count, 10)
+
+    def test_make_tiles_degenerate(self):
+        with self.assertRaises(ValueError):
+            rest_paging.make_tiles(box(0, 0, 10, 10), 0)
+
+        self.assertEqual(
+            len(rest_paging.make_tiles(shapely.Polygon(), 10)), 0)
+        self.assertEqual(
+            len(rest_paging.make_tiles(shapely.Point(5, 5), 10)), 1)
+        self.assertEqual(len(rest_paging.make_tiles(
+            shapely.LineString([(0, 5), (25, 5)]), 10)), 3)
+
+    @mock.patch.object(rest_paging, 'query_features_page',
+                       fake_query_features_page)
+    def test_chunks_written_to_file(self):
+        boundary = box(0, 0, 1000, 1000)
+        pages = rest_paging.iter_tiled_feature_pages(
+            'fake_url', boundary, tile_size=300, page_size=10)
+        chunks = rest_paging.iter_chunks(pages, chunk_size=25)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            out_path = os.path.join(temp_dir, 'blocks.gpkg')
+            count = rest_paging.write_chunks(chunks, out_path)
+            written = gpd.read_file(out_path)
+
+        self.assertEqual(count, 121)
+        self.assertEqual(len(written), 121)
+
+    @mock.patch.object(rest_paging, 'query_features_page',
+                       fake_query_features_page)
+    def test_chunks_written_to_flatgeobuf(self):
+        boundary = box(0, 0, 1000, 1000)
+        pages = rest_paging.iter_tiled_feature_pages(
+            'fake_url', boundary, crs=3857, tile_size=300, page_size=10)
+        chunks = rest_paging.iter_chunks(pages, chunk_size=25)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            out_path = os.path.join(temp_dir, 'blocks.fgb')
+            count = rest_paging.write_chunks(
+                chunks, out_path, driver='FlatGeobuf')
+            written = gc.read_flatgeobuf_bbox(out_path, (0, 0, 150, 150))
+
+        self.assertEqual(count, 121)
+        self.assertEqual(len(written), 4)
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow not installed')
+    @mock.patch.object(rest_paging, 'query_features_page',
+                       fake_query_features_page)
+    def test_chunks_written_to_geoparquet(self):
+        boundary = box(0, 0, 1000, 1000)
+        pages = rest_paging.iter_tiled_feature_pages(
+            'fake_url', boundary, crs=3857, tile_size=300, page_size=10)
+        chunks = rest_paging.iter_chunks(pages, chunk_size=25)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            out_path = os.path.join(temp_dir, 'blocks.parquet')
+            count = rest_paging.write_chunks(
+                chunks, out_path, driver='Parquet')
+            written = gpd.read_parquet(out_path)
+
+        self.assertEqual(count, 121)
+        self.assertEqual(len(written), 121)
+        self.assertEqual(written.crs.to_epsg(), 3857)
+
+    @mock.patch.object(rest_paging, 'query_features_page',
+                       fake_query_features_page)
+    def test_streamed_server_export(self):
+        boundary_geo = restapi.Geometry(
+            shapely.geometry.mapping(box(0, 0, 1000, 1000)))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            out_path, count = gc.export_server_URL_data(
+                boundary_geo,
+                'https://example.com/arcgis/rest/services',
+                'blocks',
+                0,
+                out_directory=temp_dir,
+                out_name='blocks',
+                crs_in=3857,
+                crs_out=3857,
+                stream_format='gpkg',
+                page_size=10,
+                chunk_size=25)
+            written = gpd.read_file(out_path)
+
+        self.assertTrue(out_path.endswith('blocks.gpkg'))
+        self.assertEqual(count, 121)
+        self.assertEqual(len(written), 121)
+
+        with self.assertRaises(ValueError):
+            gc.geocricket.stream_layer(
+                'fake_url', boundary_geo, 'blocks.shp')
+
+    def test_pages_ordered_by_object_id_field(self):
+        rest_paging.get_object_id_field.cache_clear()
+        layer_info = {
+            'objectIdField': 'FID',
+            'fields': [{'name': 'FID', 'type': 'esriFieldTypeOID'}],
+            }
+        page = {'type': 'FeatureCollection', 'features': []}
+
+        def fake_get(url, params=None, timeout=None):
+            res_json = layer_info if params['f'] == 'json' else page
+            return mock.Mock(json=mock.Mock(return_value=res_json))
+
+        with mock.patch.object(
+                rest_paging.requests, 'get', side_effect=fake_get) as get:
+            for offset in [0, 10]:
+                rest_paging.query_features_page(
+                    'https://example.com/layer/0', (0, 0, 1, 1),
+                    offset=offset)
+
+        rest_paging.get_object_id_field.cache_clear()
+
+        # layer metadata is requested once
+        self.assertEqual(
+            [call.kwargs['params']['f'] for call in get.call_args_list],
+            ['json', 'geojson', 'geojson'])
+        self.assertEqual(
+            get.call_args_list[-1].kwargs['params']['orderByFields'], 'FID')
+
+    @mock.patch.object(rest_paging, 'query_features_page',
+                       fake_query_features_page)
+    def test_census_blocks_boundary_reprojected(self):
+        # 900 m square over the centers of 10 x 10 blocks, in lon / lat
+        boundary = gpd.GeoSeries(
+            [box(50, 50, 950, 950)], crs=3857).to_crs(4326)[0]
+        boundary_geo = restapi.Geometry(shapely.geometry.mapping(boundary))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            out_path, count = gc.export_census_blocks(
+                boundary_geo,
+                out_directory=temp_dir,
+                crs_in=4326,
+                crs=3857,
+                tile_size=500,
+                page_size=10,
+                chunk_size=25)
+            written = gpd.read_file(out_path)
+
+        self.assertEqual(count, 100)
+        self.assertEqual(written['GEOID'].nunique(), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,290 @@
+import os
+import pathlib
+import tempfile
+import time
+import unittest
+import urllib.parse
+from unittest import mock
+
+import numpy as np
+import geopandas as gpd
+import shapely
+
+import geocricket as gc
+from geocricket import transit_land
+
+
+def make_route_feature(route_id, stops):
+    """
+    Make transit land style route feature with list of (id, lon, lat) stops
+    """
+    coords = [[lon, lat] for _, lon, lat in stops]
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'MultiLineString', 'coordinates': [coords]},
+        'properties': {
+            'onestop_id': route_id,
+            'route_long_name': f'Route {route_id}',
+            'route_type': 3,
+            'agency': {'agency_name': 'ABQ Ride', 'onestop_id': 'o-abq'},
+            'route_stops': [
+                {'stop': {
+                    'id': stop_id,
+                    'stop_name': f'Stop {stop_id}',
+                    'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+                    }}
+                for stop_id, lon, lat in stops],
+            },
+        }
+
+
+# two routes sharing a stop, second route leaves the test boundary
+ROUTES = [
+    make_route_feature('r-1', [(1, -106.65, 35.08), (2, -106.60, 35.08)]),
+    make_route_feature('r-2', [(2, -106.60, 35.08), (3, -105.00, 35.08)]),
+    ]
+
+
+def fake_transit_land_get(query, rate_limiter=None):
+    """
+    Serve ROUTES in pages of limit routes following the after cursor
+    """
+    params = urllib.parse.parse_qs(urllib.parse.urlparse(query).query)
+    limit = int(params['limit'][0])
+    after = int(params.get('after', [0])[0])
+
+    page = {'type': 'FeatureCollection',
+            'features': ROUTES[after:after + limit],
+            'meta': {}}
+    if after + limit < len(ROUTES):
+        page['meta']['after'] = after + limit
+
+    return mock.Mock(status_code=200, json=mock.Mock(return_value=page))
+
+
+class TestTransitLand(unittest.TestCase):
+    def test_search_covering(self):
+        # long diagonal boundary, poorly covered by a bounding box grid
+        boundary = shapely.buffer(
+            shapely.LineString([(0, 0), (100000, 100000)]), 2000)
+        radius = 10000
+        centers = gc.generate_search_covering(boundary, radius)
+
+        covered = shapely.union_all(shapely.buffer(centers, radius))
+        self.assertTrue(covered.contains(boundary))
+
+        # bounding box grid of previous implementation
+        step = np.floor(2 * radius / np.sqrt(2))
+        n_grid = len(np.arange(0, 1e5, step)) ** 2
+        self.assertLess(len(centers), n_grid / 2)
+
+    def test_search_covering_stable_after_edit(self):
+        radius = 5000
+        boundary = shapely.box(351234, 3881234, 401234, 3921234)
+        # small edit moves the west edge, and so the bounds
+        edited = shapely.union(
+            boundary, shapely.box(349000, 3890000, 351500, 3895000))
+
+        centers = gc.generate_search_covering(boundary, radius)
+        edited_centers = gc.generate_search_covering(edited, radius)
+
+        covered = shapely.union_all(shapely.buffer(edited_centers, radius))
+        self.assertTrue(covered.contains(edited))
+
+        # points of unchanged areas are reused exactly
+        points = {tuple(x) for x in shapely.get_coordinates(centers)}
+        edited_points = {
+            tuple(x) for x in shapely.get_coordinates(edited_centers)}
+        self.assertGreater(
+            len(points & edited_points), 0.9 * len(points))
+
+    @mock.patch.object(transit_land, 'transit_land_get',
+                       side_effect=fake_transit_land_get)
+    def test_geometry_bound_query(self, transit_land_get):
+        boundary_df = gpd.GeoDataFrame(
+            geometry=[shapely.box(-106.7, 35.0, -106.5, 35.2)], crs=4326)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            boundary_fp = os.path.join(temp_dir, 'boundary.gpkg')
+            boundary_df.to_file(boundary_fp, driver='GPKG')
+
+            route_fp, stop_fp = gc.export_transit_land_geometry_bound_query(
+                'fake_key',
+                boundary_fp,
+                out_name='test',
+                out_dir=temp_dir,
+                search_radius=20000,
+                limit=1,
+                requests_per_second=100)
+            routes = gpd.read_file(route_fp)
+            stops = gpd.read_file(stop_fp)
+
+            # only the first page is collected, so circles are subdivided
+            gc.export_transit_land_geometry_bound_query(
+                'fake_key',
+                boundary_fp,
+                out_name='test_subdivided',
+                out_dir=temp_dir,
+                search_radius=20000,
+                min_search_radius=10000,
+                limit=1,
+                max_pages=1,
+                requests_per_second=100)
+
+        queries = [x.args[0] for x in transit_land_get.call_args_list]
+        self.assertTrue(any('radius=10000' in x for x in queries))
+
+        self.assertEqual(sorted(routes['route_onestop_id']), ['r-1', 'r-2'])
+        # route clipped to boundary
+        self.assertLessEqual(routes.total_bounds[2], -106.5 + 1e-9)
+        # stop 3 outside boundary
+        self.assertEqual(sorted(stops['id'].unique()), [1, 2])
+
+    def test_pages_parsed_once(self):
+        pages = [{'features': ROUTES}, {'features': ROUTES[:1]}]
+
+        with mock.patch.object(
+                transit_land, 'parse_transit_land_res',
+                wraps=transit_land.parse_transit_land_res) as parse:
+            routes, stops = transit_land.collect_transit_land_frames(pages)
+
+        self.assertEqual(parse.call_count, 2)
+        self.assertEqual(len(routes), len(ROUTES) + 1)
+        self.assertEqual(
+            len(stops),
+            len(gc.get_stops_from_transit_land_res({'features': ROUTES}))
+            + len(gc.get_stops_from_transit_land_res(
+                {'features': ROUTES[:1]})))
+
+    def test_normalized_tables(self):
+        res = {'features': ROUTES}
+        route_df = gc.get_routes_from_transit_land_res(res)
+        stop_df = gc.get_stops_from_transit_land_res(res)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            [fp] = transit_land.export_transit_frames(
+                route_df, stop_df, 'test', temp_dir, normalized=True)
+            routes = gpd.read_file(fp, layer='routes')
+            stops = gpd.read_file(fp, layer='stops')
+            stop_route = gpd.read_file(fp, layer='stop_route')
+
+        # shared stop 2 is only stored once
+        self.assertEqual(len(stop_df), 4)
+        self.assertEqual(stops['id'].to_list(), [1, 2, 3])
+        self.assertEqual(len(routes), 2)
+
+        pairs = set(zip(stops['id'][stop_route['stop_key']],
+                        routes['route_onestop_id'][stop_route['route_key']]))
+        self.assertEqual(
+            pairs, {(1, 'r-1'), (2, 'r-1'), (2, 'r-2'), (3, 'r-2')})
+
+    @mock.patch.object(transit_land, 'transit_land_get',
+                       side_effect=fake_transit_land_get)
+    def test_radius_query_follows_pages(self, transit_land_get):
+        res = gc.transit_land_radius_query(
+            'fake_key', 35.08, -106.6, limit=1)
+
+        self.assertEqual(transit_land_get.call_count, 2)
+        self.assertEqual(
+            [x['properties']['onestop_id'] for x in res['features']],
+            ['r-1', 'r-2'])
+
+    @mock.patch.object(transit_land, 'transit_land_get',
+                       side_effect=fake_transit_land_get)
+    def test_response_cache(self, transit_land_get):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = gc.ResponseCache(temp_dir)
+            first = gc.transit_land_radius_query(
+                'fake_key', 35.08, -106.6, limit=1, cache=cache)
+            # slightly different location rounds to same key
+            second = gc.transit_land_radius_query(
+                'fake_key', 35.080001, -106.6, limit=1, cache=cache)
+
+            self.assertEqual(transit_land_get.call_count, 2)
+            self.assertEqual(first, second)
+
+            # expired entries are not used
+            cache.ttl = -1
+            gc.transit_land_radius_query(
+                'fake_key', 35.08, -106.6, limit=1, cache=cache)
+            self.assertEqual(transit_land_get.call_count, 4)
+
+            # oldest entries removed past size limit
+            cache.ttl = 3600
+            cache.max_bytes = 1
+            cache.set('extra', {'features': []})
+            self.assertLessEqual(len(os.listdir(temp_dir)), 1)
+
+    def test_response_cache_overwrite_size(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = gc.ResponseCache(temp_dir)
+            for ndx in range(5):
+                cache.set('key', {'features': list(range(ndx))})
+
+            size = sum(
+                x.stat().st_size for x in pathlib.Path(temp_dir).iterdir())
+            self.assertEqual(cache._size, size)
+
+    @mock.patch.object(transit_land, 'transit_land_get',
+                       side_effect=fake_transit_land_get)
+    def test_sites_query(self, transit_land_get):
+        sites = gpd.GeoDataFrame(
+            {'site': ['hospital_a', 'hospital_b']},
+            geometry=[shapely.Point(-106.6, 35.08),
+                      shapely.Point(-106.5, 35.08)],
+            crs=4326)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fp = gc.export_transit_land_sites_query(
+                'fake_key', sites, site_id_field='site', out_name='test',
+                out_dir=temp_dir, requests_per_second=100)
+            routes = gpd.read_file(fp, layer='routes')
+            stops = gpd.read_file(fp, layer='stops')
+
+            fp = gc.export_transit_land_sites_query(
+                'fake_key', sites, site_id_field='site', out_name='norm',
+                out_dir=temp_dir, requests_per_second=100, normalized=True)
+            norm_stops = gpd.read_file(fp, layer='stops')
+
+        # both sites find both routes, each route exported once
+        self.assertEqual(routes['route_onestop_id'].to_list(), ['r-1', 'r-2'])
+        self.assertEqual(
+            routes['site_ids'].to_list(), ['hospital_a;hospital_b'] * 2)
+        self.assertEqual(len(stops), 4)
+        self.assertEqual(norm_stops['id'].to_list(), [1, 2, 3])
+        self.assertEqual(
+            norm_stops['site_ids'].to_list(), ['hospital_a;hospital_b'] * 3)
+
+    def test_token_bucket_rate(self):
+        bucket = gc.TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        elapsed = time.monotonic() - start
+
+        # first token is available immediately
+        self.assertGreaterEqual(elapsed, 5 / 20 * 0.9)
+        self.assertEqual(bucket.n_acquired, 6)
+
+    def test_token_bucket_validation(self):
+        for kwargs in [{'rate': 0}, {'rate': -1}, {'capacity': 0.5}]:
+            with self.assertRaises(ValueError):
+                gc.TokenBucket(**kwargs)
+
+    def test_retry_after_429(self):
+        too_many = mock.Mock(status_code=429, headers={'Retry-After': '0'})
+        okay = mock.Mock(status_code=200, headers={})
+        bucket = gc.TokenBucket(rate=100)
+
+        with mock.patch.object(transit_land.requests, 'request',
+                               side_effect=[too_many, okay]) as request:
+            response = transit_land.transit_land_get(
+                'fake_query', rate_limiter=bucket)
+
+        self.assertIs(response, okay)
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(bucket.n_acquired, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()